@@ -1,21 +1,40 @@
+import os
 import pandas as pd
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
+import scipy.sparse as sp
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
 from collections import Counter
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, Optional
+
+from knn_graph import KNNGraph
+from neighbors import NeighborEngine
+
+# Hardness levels, by how many of a sample's 5 neighbors share its class (>= 4, >= 2, fewer)
+HARDNESS_LEVELS = ("safe", "borderline", "rare")
+# Samples rated per class (a stratified random sample above this)
+COMPLEXITY_SAMPLES_PER_CLASS = int(os.getenv("COMPLEXITY_SAMPLES_PER_CLASS", "2000"))
+# Rated samples whose neighbors are searched at once (bounds the neighbor arrays held in memory)
+COMPLEXITY_BATCH_ROWS = int(os.getenv("COMPLEXITY_BATCH_ROWS", "1024"))
+# Up to this many rows /imbalance-analysis builds the shared k-NN graph; above, it only reuses a stored one
+COMPLEXITY_GRAPH_ROWS = int(os.getenv("COMPLEXITY_GRAPH_ROWS", "50000"))
+# z of the reported confidence intervals (95%)
+CI_Z = 1.96
 
 class ImbalanceAnalyzer:
     def __init__(self, random_state=42):
         self.random_state = random_state
 
-    def calculate_metrics(self, X: pd.DataFrame, y: pd.Series) -> Dict[str, Any]:
+    def calculate_metrics(self, X: pd.DataFrame, y: pd.Series, graph: Optional[KNNGraph] = None) -> Dict[str, Any]:
         """
         Calculates comprehensive imbalance metrics:
         1. Class Distribution & IR
-        2. Data Complexity (Safe/Borderline/Rare/Outlier) via k-NN
+        2. Data Complexity (Safe/Borderline/Rare/Outlier) via k-NN, per class
         3. PCA Projection (2D) for visualization
+
+        The k-NN step reads `graph` (the workflow's k-NN graph of X, shared
+        with the resamplers) when it holds 5 neighbors per row, and searches
+        itself otherwise; both search the features as given.
         """
         # 1. Basic Distribution
         counts = y.value_counts().to_dict()
@@ -25,6 +44,10 @@ class ImbalanceAnalyzer:
                 "distribution": {},
                 "imbalance_ratio": 0,
                 "complexity": {"safe":0, "borderline":0, "rare":0},
+                "class_complexity": {},
+                "complexity_ci": {"safe": [0, 0], "borderline": [0, 0], "rare": [0, 0]},
+                "class_complexity_ci": {},
+                "complexity_rated": {},
                 "pca": {},
                 "shape": [0, 0],
                 "technique_status": {}
@@ -39,64 +62,49 @@ class ImbalanceAnalyzer:
         ir = n_majority / n_minority if n_minority > 0 else 0
         
         # 2. Complexity / Hardness Analysis (k=5)
-        # We only analyze minority samples to see how "hard" they are.
+        # Every sample is rated by how many of its 5 neighbors share its class:
         # Safe: 4-5 neighbors are same class
         # Borderline: 2-3 neighbors are same class
         # Rare/Outlier: 0-1 neighbor is same class
+        # `complexity` is the minority class's breakdown, `class_complexity` every class's.
+        # Large classes are rated on a stratified sample of at most COMPLEXITY_SAMPLES_PER_CLASS
+        # rows; their neighbors still come from the whole dataset, so density is not distorted.
+        # `*_ci` are 95% confidence intervals of the percentages (exact when a class is fully rated).
         
-        complexity = {
-            "safe": 0,
-            "borderline": 0,
-            "rare": 0
-        }
-        
-        # Sampling for large datasets to keep it fast
-        MAX_SAMPLES = 2000
-        if len(X) > MAX_SAMPLES:
-            # Stratified sample if possible, or just sample
-            # For complexity analysis, we need the whole density, so downsampling 
-            # might distort neighbors. However, for UI responsiveness we might need to.
-            # Let's try to use full dataset but limited query if X is huge.
-             pass 
+        complexity = {level: 0 for level in HARDNESS_LEVELS}
+        class_complexity = {label: dict(complexity) for label in counts}
+        complexity_ci = {level: [0, 0] for level in HARDNESS_LEVELS}
+        class_complexity_ci = {label: dict(complexity_ci) for label in counts}
+        rated_counts = {label: 0 for label in counts}
 
         # Only run if we have enough samples for k=5
-        if len(X) > 6:
+        if X.shape[0] > 6:
             try:
-                # Scale for k-NN
-                scaler = StandardScaler()
-                X_scaled = scaler.fit_transform(X.select_dtypes(include=[np.number]))
-                
                 # Check if we have numeric features
-                if X_scaled.shape[1] > 0:
-                    neigh = NearestNeighbors(n_neighbors=6) # 1 self + 5 neighbors
-                    neigh.fit(X_scaled)
-                    
-                    # Find neighbors for all points
-                    distances, indices = neigh.kneighbors(X_scaled)
-                    
-                    # Analyze Minority Class instances
-                    y_arr = y.to_numpy()
-                    minority_indices = np.where(y_arr == minority_class)[0]
-                    
-                    for idx in minority_indices:
-                        # Get neighbors (exclude self at index 0)
-                        neighbor_indices = indices[idx, 1:] 
-                        neighbor_classes = y_arr[neighbor_indices]
-                        
-                        # Count how many neighbors are SAME class (Minority)
-                        same_class_count = np.sum(neighbor_classes == minority_class)
-                        
-                        if same_class_count >= 4:
-                            complexity["safe"] += 1
-                        elif same_class_count >= 2:
-                            complexity["borderline"] += 1
-                        else:
-                            complexity["rare"] += 1
-                            
-                    # Normalize percentages
-                    total_minority = len(minority_indices)
-                    if total_minority > 0:
-                        complexity = {k: round((v / total_minority) * 100, 1) for k, v in complexity.items()}
+                if self._numeric(X).shape[1] > 0:
+                    codes, labels = pd.factorize(y)
+                    sample = self._stratified_sample(codes, COMPLEXITY_SAMPLES_PER_CLASS)
+                    level_counts = np.zeros((len(labels), len(HARDNESS_LEVELS)), dtype=np.int64)
+
+                    # 5 neighbors of every rated point (itself excluded), in the space the resamplers
+                    # search: preprocessing already scales the features as configured
+                    if graph is not None and graph.n_neighbors >= 5 and graph.n_rows == X.shape[0]:
+                        neighbors = lambda batch: np.asarray(graph.indices[batch, :5])
+                    else:
+                        neigh = NeighborEngine(n_neighbors=6).fit(self._numeric(X)) # 1 self + 5 neighbors
+                        X_search = neigh.fit_X_
+                        neighbors = lambda batch: self._without_self(neigh.kneighbors(X_search[batch], return_distance=False), batch)
+
+                    for start in range(0, len(sample), COMPLEXITY_BATCH_ROWS):
+                        batch = sample[start:start + COMPLEXITY_BATCH_ROWS]
+                        level_counts += self._hardness_counts(codes[batch], codes[neighbors(batch)], len(labels))
+
+                    class_totals = np.bincount(codes[codes >= 0], minlength=len(labels))
+                    class_complexity = self._hardness_percentages(level_counts, labels)
+                    class_complexity_ci = self._hardness_intervals(level_counts, class_totals, labels)
+                    rated_counts = {label: int(n) for label, n in zip(labels, level_counts.sum(axis=1))}
+                    complexity = class_complexity[minority_class]
+                    complexity_ci = class_complexity_ci[minority_class]
             except Exception as e:
                 print(f"Complexity analysis failed: {e}")
 
@@ -125,7 +133,7 @@ class ImbalanceAnalyzer:
              set_status("ADASYN", False, msg)
 
         # Undersampling
-        if len(X) > 50:
+        if X.shape[0] > 50:
             set_status("RandomUnderSampler", True)
         else:
             set_status("RandomUnderSampler", False, "Dataset too small (<50 rows). Undersampling would lose critical data.")
@@ -147,6 +155,10 @@ class ImbalanceAnalyzer:
             "distribution": counts,
             "imbalance_ratio": round(ir, 2),
             "complexity": complexity, # Percentages
+            "class_complexity": class_complexity,
+            "complexity_ci": complexity_ci,
+            "class_complexity_ci": class_complexity_ci,
+            "complexity_rated": rated_counts, # Samples rated per class
             "pca": pca_coords,
             "shape": list(X.shape),
             "technique_status": technique_status
@@ -159,7 +171,7 @@ class ImbalanceAnalyzer:
         """
         try:
             # Handle Categorical: Only using numeric for PCA for simplicity
-            X_numeric = X.select_dtypes(include=[np.number])
+            X_numeric = self._numeric(X)
             
             if X_numeric.shape[1] < 3:
                  # If < 3 features, can't really do 3D PCA in the standard way without filling 0s or erroring.
@@ -169,24 +181,28 @@ class ImbalanceAnalyzer:
                  pass
 
             # Downsample for visualization
-            if len(X) > max_points:
+            if X.shape[0] > max_points:
                 # Simple random sample
-                idx = np.random.choice(len(X), max_points, replace=False)
-                X_subset = X_numeric.iloc[idx]
+                idx = np.random.choice(X.shape[0], max_points, replace=False)
+                X_subset = X_numeric[idx] if sp.issparse(X_numeric) else X_numeric.iloc[idx]
                 y_subset = y.iloc[idx]
             else:
                 X_subset = X_numeric
                 y_subset = y
 
             # Impute if needed (PCA generally fails with NaNs)
-            X_subset = X_subset.fillna(X_subset.mean())
+            if not sp.issparse(X_subset):
+                X_subset = X_subset.fillna(X_subset.mean())
 
-            scaler = StandardScaler()
+            scaler = StandardScaler(with_mean=not sp.issparse(X_subset))
             X_scaled = scaler.fit_transform(X_subset)
             
             # Determine suitable n_components
             n_cols = X_scaled.shape[1]
             n_comps = min(n_cols, 3)
+            if sp.issparse(X_scaled):
+                # Sparse PCA (arpack, centered implicitly) needs fewer components than features
+                n_comps = min(n_comps, n_cols - 1, X_scaled.shape[0] - 1)
             
             pca = PCA(n_components=n_comps, random_state=self.random_state)
             X_pca = pca.fit_transform(X_scaled)
@@ -203,3 +219,71 @@ class ImbalanceAnalyzer:
         except Exception as e:
             print(f"PCA generation failed: {e}")
             return {}
+
+    @staticmethod
+    def _hardness_counts(codes: np.ndarray, neighbor_codes: np.ndarray, n_classes: int) -> np.ndarray:
+        """
+        Samples per (class, hardness level), as an n_classes x 3 array.
+
+        `codes` are the class codes of the rated samples and `neighbor_codes`
+        (one row per sample) those of their 5 neighbors.
+        """
+        same_class = (neighbor_codes == codes[:, None]).sum(axis=1)
+        level = np.where(same_class >= 4, 0, np.where(same_class >= 2, 1, 2))
+        return np.bincount(codes * len(HARDNESS_LEVELS) + level, minlength=n_classes * len(HARDNESS_LEVELS)).reshape(n_classes, -1)
+
+    def _stratified_sample(self, codes: np.ndarray, per_class: int) -> np.ndarray:
+        """Sorted rows to rate: every labeled row of small classes, `per_class` random rows of the others."""
+        rng = np.random.default_rng(self.random_state)
+        rows = []
+        for code in range(codes.max() + 1):
+            class_rows = np.flatnonzero(codes == code)
+            if len(class_rows) > per_class:
+                class_rows = rng.choice(class_rows, per_class, replace=False)
+            rows.append(class_rows)
+        return np.sort(np.concatenate(rows))
+
+    @staticmethod
+    def _without_self(indices: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Neighbor indices with each query's own row removed (or the farthest, if a duplicate took its place)."""
+        own = indices == rows[:, None]
+        own[~own.any(axis=1), -1] = True
+        return indices[~own].reshape(len(indices), -1)
+
+    @staticmethod
+    def _hardness_intervals(level_counts: np.ndarray, class_totals: np.ndarray, labels) -> Dict[Any, Dict[str, list]]:
+        """
+        Wilson score intervals (CI_Z) of the per-class percentages, with the
+        finite population correction for classes rated on a sample.
+        """
+        rated = np.maximum(level_counts.sum(axis=1, keepdims=True), 1).astype(float)
+        totals = np.maximum(class_totals[:, None], rated)
+        p = level_counts / rated
+        with np.errstate(divide="ignore"):
+            n = np.where(totals > rated, rated * (totals - 1) / (totals - rated), np.inf)
+        z2 = CI_Z ** 2
+        center = (p + z2 / (2 * n)) / (1 + z2 / n)
+        half = CI_Z * np.sqrt(p * (1 - p) / n + z2 / (4 * n ** 2)) / (1 + z2 / n)
+        low = np.round(np.clip(center - half, 0, 1) * 100, 1)
+        high = np.round(np.clip(center + half, 0, 1) * 100, 1)
+        return {
+            label: {level: [float(lo), float(hi)] for level, lo, hi in zip(HARDNESS_LEVELS, low_row, high_row)}
+            for label, low_row, high_row in zip(labels, low, high)
+        }
+
+    @staticmethod
+    def _hardness_percentages(level_counts: np.ndarray, labels) -> Dict[Any, Dict[str, float]]:
+        """Per-class hardness breakdown in percent of the class's rated samples."""
+        totals = np.maximum(level_counts.sum(axis=1, keepdims=True), 1)
+        percentages = np.round(level_counts / totals * 100, 1)
+        return {
+            label: {level: float(value) for level, value in zip(HARDNESS_LEVELS, row)}
+            for label, row in zip(labels, percentages)
+        }
+
+    @staticmethod
+    def _numeric(X):
+        """Numeric feature columns; sparse matrices (preprocessed one-hot output) are all numeric."""
+        if sp.issparse(X):
+            return X.tocsr()
+        return X.select_dtypes(include=[np.number])
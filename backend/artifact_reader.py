@@ -0,0 +1,130 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+from typing import List, Tuple, Any
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+import scipy.sparse as sp
+
+from artifacts import Features, features_path, mapped_path, reference_base, SPARSE_SUFFIX, COLUMNS_SUFFIX
+
+# Opened artifacts kept per process (they are memory-mapped, so this bounds open files, not RAM)
+ARTIFACT_CACHE_ENTRIES = int(os.getenv("ARTIFACT_CACHE_ENTRIES", "16"))
+
+SPARSE_PARTS = ("data", "indices", "indptr", "shape")
+
+
+class ArtifactReader:
+    """
+    Reads workflow artifacts as memory-mapped, zero-copy arrays.
+
+    On first use a Parquet artifact is copied to an uncompressed Arrow IPC
+    file, and a sparse .npz to plain .npy arrays, in a hidden folder next to
+    it (kept while the source's mtime is older). Later reads map that copy,
+    so only the pages a step touches are loaded, and they sit in the OS page
+    cache where every worker reading the same workflow shares them. Opened
+    artifacts are also cached in-process by (path, mtime), so concurrent
+    requests in one process share a single mapping.
+
+    Returned frames and matrices are read-only; copy before mutating.
+    """
+
+    def __init__(self, max_entries: int = ARTIFACT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, float], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def features(self, path_base: str) -> Tuple[Features, List[str]]:
+        """Feature matrix stored at `path_base` (see artifacts.load_features) and its column names."""
+        path = features_path(path_base)
+        if path is None:
+            raise FileNotFoundError(f"No feature matrix found at {path_base}")
+
+        if path.endswith(SPARSE_SUFFIX):
+            X = self._cached(path, self._map_sparse)
+            with open(path_base + COLUMNS_SUFFIX, "r") as f:
+                feature_names = json.load(f)
+            return X, feature_names
+
+        X = self._cached(path, self._map_table)
+        base = reference_base(path_base)
+        if base is not None:
+            # Rows stored by reference: the only copy made, when a step asks for the whole matrix
+            X = pd.concat([self.features(base)[0], X], ignore_index=True)
+        return X, X.columns.tolist()
+
+    def target(self, path: str) -> pd.Series:
+        """The single column of a stored target (y_*.parquet)."""
+        return self._cached(path, self._map_table).iloc[:, 0]
+
+    def _cached(self, path: str, load):
+        key = (path, os.path.getmtime(path))
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                return cached
+
+        value = load(path)
+        with self._lock:
+            # Older versions of the same artifact can never be hit again
+            for stale in [k for k in self._entries if k[0] == path and k != key]:
+                del self._entries[stale]
+            self._entries[key] = value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def _is_fresh(self, path: str, mapped: str) -> bool:
+        return os.path.exists(mapped) and os.path.getmtime(mapped) >= os.path.getmtime(path)
+
+    def _map_table(self, path: str) -> pd.DataFrame:
+        mapped = mapped_path(path) + ".arrow"
+        if not self._is_fresh(path, mapped):
+            table = pq.read_table(path)
+            self._write_atomic(mapped, lambda f: self._write_ipc(f, table))
+
+        table = ipc.open_file(pa.memory_map(mapped)).read_all()
+        # One block per column, so numeric columns stay views of the mapped buffers
+        return table.to_pandas(split_blocks=True)
+
+    def _map_sparse(self, path: str) -> sp.csr_matrix:
+        base = mapped_path(path)
+        parts = {name: f"{base}.{name}.npy" for name in SPARSE_PARTS}
+        if not all(self._is_fresh(path, part) for part in parts.values()):
+            X = sp.load_npz(path).tocsr()
+            arrays = {"data": X.data, "indices": X.indices, "indptr": X.indptr, "shape": np.array(X.shape)}
+            for name in SPARSE_PARTS:
+                self._write_atomic(parts[name], lambda f, a=arrays[name]: np.save(f, a))
+
+        arrays = {name: np.load(part, mmap_mode="r") for name, part in parts.items()}
+        return sp.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]),
+            shape=tuple(int(n) for n in arrays["shape"]), copy=False
+        )
+
+    @staticmethod
+    def _write_ipc(sink, table: pa.Table):
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    @staticmethod
+    def _write_atomic(path: str, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Per-process temporary name: workers may convert the same artifact at once
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+artifact_reader = ArtifactReader()
@@ -0,0 +1,318 @@
+import os
+import glob
+import json
+import pandas as pd
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import scipy.sparse as sp
+from typing import List, Optional, Tuple, Union
+
+from manifest import StepManifest
+
+# Feature matrices are stored either dense, as Parquet, or sparse, as a CSR
+# matrix (.npz) plus a sidecar with the column names. Callers refer to an
+# artifact by its path without extension (e.g. ".../X_train").
+DENSE_SUFFIX = ".parquet"
+SPARSE_SUFFIX = ".npz"
+COLUMNS_SUFFIX = ".columns.json"
+# A dense matrix written in chunks may hold only its new rows: the sidecar names the
+# artifact (path base, relative to it) whose rows come first, stored once, not copied
+REFERENCE_SUFFIX = ".base.json"
+# Memory-mappable copies made by readers (see artifact_reader.py) live in a hidden folder
+MAPPED_DIRNAME = ".mapped"
+
+# Stored precision of feature values: "auto" (float32 for columns it represents within
+# FEATURE_FLOAT32_RTOL), "float32" (always) or "float64" (as computed, no uint8 packing)
+FEATURE_PRECISION = os.getenv("FEATURE_PRECISION", "auto")
+FEATURE_FLOAT32_RTOL = float(os.getenv("FEATURE_FLOAT32_RTOL", "1e-6"))
+# Parquet codec and row-group size of dense feature matrices
+FEATURE_COMPRESSION = os.getenv("FEATURE_COMPRESSION", "zstd")
+FEATURE_ROW_GROUP_ROWS = int(os.getenv("FEATURE_ROW_GROUP_ROWS", "100000"))
+
+Features = Union[pd.DataFrame, sp.csr_matrix]
+
+
+def storage_dtypes(X, binary: Optional[np.ndarray] = None) -> List[np.dtype]:
+    """
+    Storage dtype of every column of a dense matrix.
+
+    Columns flagged in `binary` (one-hot outputs, always 0/1) become uint8;
+    without flags, columns holding only 0 and 1 do. The rest are float32
+    when FEATURE_PRECISION allows it, float64 otherwise.
+    """
+    values = X.to_numpy(dtype=float) if isinstance(X, pd.DataFrame) else np.asarray(X, dtype=float)
+    n_features = values.shape[1]
+    if FEATURE_PRECISION == "float64":
+        return [np.dtype(np.float64)] * n_features
+
+    if binary is None:
+        binary = ((values == 0) | (values == 1)).all(axis=0) if len(values) else np.zeros(n_features, dtype=bool)
+    if FEATURE_PRECISION == "float32":
+        fits = np.ones(n_features, dtype=bool)
+    else:
+        fits = np.isclose(values.astype(np.float32), values, rtol=FEATURE_FLOAT32_RTOL, atol=0, equal_nan=True).all(axis=0)
+
+    return [
+        np.dtype(np.uint8) if is_binary else np.dtype(np.float32 if fits32 else np.float64)
+        for is_binary, fits32 in zip(binary, fits)
+    ]
+
+
+def storage_frame(X, feature_names: List[str], dtypes: List[np.dtype]) -> pd.DataFrame:
+    """Dense matrix as a DataFrame with the given per-column dtypes (see storage_dtypes)."""
+    values = X.to_numpy(dtype=float) if isinstance(X, pd.DataFrame) else np.asarray(X)
+    if len(set(dtypes)) <= 1:
+        return pd.DataFrame(values.astype(dtypes[0]) if dtypes else values, columns=feature_names)
+
+    # One block per dtype rather than one array per column
+    blocks = []
+    for dtype in set(dtypes):
+        idx = [i for i, d in enumerate(dtypes) if d == dtype]
+        blocks.append(pd.DataFrame(values[:, idx].astype(dtype), columns=[feature_names[i] for i in idx]))
+    return pd.concat(blocks, axis=1)[list(feature_names)]
+
+
+def sparse_storage_dtype(X: sp.spmatrix, binary: Optional[np.ndarray] = None) -> np.dtype:
+    """
+    Storage dtype of a sparse matrix's stored values: uint8 if they are all 1,
+    as in one-hot blocks, otherwise as in `storage_dtypes`. When `binary`
+    flags the 0/1 columns, uint8 requires every column to be flagged (the
+    values of `X` may be a sample of the matrix being stored).
+    """
+    if FEATURE_PRECISION == "float64":
+        return np.dtype(np.float64)
+    data = X.data.astype(float)
+    if (binary.all() if binary is not None else np.all(data == 1)):
+        return np.dtype(np.uint8)
+    if FEATURE_PRECISION == "float32" or np.isclose(data.astype(np.float32), data, rtol=FEATURE_FLOAT32_RTOL, atol=0, equal_nan=True).all():
+        return np.dtype(np.float32)
+    return np.dtype(np.float64)
+
+
+def save_features(path_base: str, X, feature_names: Optional[List[str]] = None, binary: Optional[np.ndarray] = None) -> str:
+    """
+    Saves a feature matrix, keeping sparse input sparse.
+
+    Values are stored in the dtypes chosen by `storage_dtypes` (`binary`
+    flags the columns known to be 0/1). Any artifact of the other kind left
+    at `path_base` by an earlier run is removed, so loaders never see a
+    stale matrix. Returns the written path.
+    """
+    if sp.issparse(X):
+        X = sp.csr_matrix(X)
+        path = path_base + SPARSE_SUFFIX
+        sp.save_npz(path, X.astype(sparse_storage_dtype(X)), compressed=False)
+        names = list(feature_names) if feature_names is not None else [f"feat_{i}" for i in range(X.shape[1])]
+        with open(path_base + COLUMNS_SUFFIX, "w") as f:
+            json.dump(names, f)
+        stale = [path_base + DENSE_SUFFIX]
+    else:
+        path = path_base + DENSE_SUFFIX
+        if isinstance(X, pd.DataFrame):
+            feature_names = X.columns.tolist()
+        elif feature_names is None:
+            feature_names = [f"feat_{i}" for i in range(X.shape[1])]
+        frame = storage_frame(X, feature_names, storage_dtypes(X, binary))
+        frame.to_parquet(path, index=False, compression=FEATURE_COMPRESSION, row_group_size=FEATURE_ROW_GROUP_ROWS)
+        stale = [path_base + SPARSE_SUFFIX, path_base + COLUMNS_SUFFIX]
+    stale.append(path_base + REFERENCE_SUFFIX)
+
+    for stale_path in stale:
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
+    _remove_mapped(path_base)
+    return path
+
+
+def remove_features(path_base: str):
+    """Deletes the feature matrix stored at `path_base`, whichever kind it is."""
+    for suffix in (DENSE_SUFFIX, SPARSE_SUFFIX, COLUMNS_SUFFIX, REFERENCE_SUFFIX):
+        if os.path.exists(path_base + suffix):
+            os.remove(path_base + suffix)
+    _remove_mapped(path_base)
+
+
+class RowGroupWriter:
+    """Appends DataFrames to one Parquet file (row groups of at most FEATURE_ROW_GROUP_ROWS rows)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._writer = None
+
+    def write(self, df: pd.DataFrame):
+        if len(df) == 0:
+            return
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema, compression=FEATURE_COMPRESSION)
+        self._writer.write_table(table.cast(self._writer.schema), row_group_size=FEATURE_ROW_GROUP_ROWS)
+
+    def close(self, empty: pd.DataFrame):
+        if self._writer is None:
+            # Nothing was written (e.g. an empty split); still leave a readable file
+            empty.to_parquet(self.path, index=False, compression=FEATURE_COMPRESSION)
+        else:
+            self._writer.close()
+
+
+class StaleReferenceError(Exception):
+    """Raised when the matrix a stored-by-reference artifact continues has been rewritten since."""
+
+
+class SparseRowWriter:
+    """
+    Writes a CSR feature matrix batch by batch, the sparse counterpart of
+    RowGroupWriter.
+
+    Each batch's values, column indices and row offsets are appended to
+    scratch files next to the artifact; `close` writes the .npz (the layout
+    of `scipy.sparse.save_npz`) from memory-mapped views of them, so only
+    one batch is ever held in memory.
+    """
+
+    PARTS = {"data": None, "indices": np.int32, "indptr": np.int64}
+
+    def __init__(self, path_base: str, feature_names: List[str], dtype: np.dtype):
+        self.path_base = path_base
+        self.feature_names = list(feature_names)
+        self.dtypes = {**self.PARTS, "data": np.dtype(dtype)}
+        self._paths = {name: f"{path_base}.{name}.part" for name in self.PARTS}
+        self._files = {name: open(path, "wb") for name, path in self._paths.items()}
+        self._rows = 0
+        self._nnz = 0
+        np.zeros(1, dtype=np.int64).tofile(self._files["indptr"])
+
+    def write(self, X):
+        X = sp.csr_matrix(X)
+        X.data.astype(self.dtypes["data"]).tofile(self._files["data"])
+        X.indices.astype(np.int32).tofile(self._files["indices"])
+        (X.indptr[1:].astype(np.int64) + self._nnz).tofile(self._files["indptr"])
+        self._rows += X.shape[0]
+        self._nnz += X.nnz
+
+    def close(self) -> str:
+        for f in self._files.values():
+            f.close()
+        try:
+            lengths = {"data": self._nnz, "indices": self._nnz, "indptr": self._rows + 1}
+            arrays = {
+                name: np.memmap(path, dtype=self.dtypes[name], mode="r", shape=(lengths[name],)) if lengths[name] else np.empty(0, dtype=self.dtypes[name])
+                for name, path in self._paths.items()
+            }
+            path = self.path_base + SPARSE_SUFFIX
+            np.savez(path, format=b"csr", shape=np.array([self._rows, len(self.feature_names)]), **arrays)
+            del arrays
+        finally:
+            for part in self._paths.values():
+                os.remove(part)
+
+        with open(self.path_base + COLUMNS_SUFFIX, "w") as f:
+            json.dump(self.feature_names, f)
+        for stale_path in (self.path_base + DENSE_SUFFIX, self.path_base + REFERENCE_SUFFIX):
+            if os.path.exists(stale_path):
+                os.remove(stale_path)
+        _remove_mapped(self.path_base)
+        return path
+
+
+def save_reference(path_base: str, base: str) -> str:
+    """
+    Records that the dense matrix at `path_base` continues the one at `base`:
+    loaders return `base`'s rows followed by its own. The base's manifest key
+    and row count are recorded too, so a base rewritten later (e.g. by a new
+    preprocessing run) is detected instead of joined. Returns the sidecar path.
+    """
+    path = path_base + REFERENCE_SUFFIX
+    reference = {
+        "base": os.path.relpath(base, os.path.dirname(path_base)),
+        "key": StepManifest(os.path.dirname(base)).key(),
+        "rows": _dense_rows(base),
+    }
+    with open(path, "w") as f:
+        json.dump(reference, f)
+    return path
+
+
+def reference_base(path_base: str) -> Optional[str]:
+    """
+    Path base of the matrix whose rows come before the ones stored at
+    `path_base`, if any. Raises StaleReferenceError if that matrix is no
+    longer the one the artifact was written against.
+    """
+    try:
+        with open(path_base + REFERENCE_SUFFIX, "r") as f:
+            reference = json.load(f)
+    except FileNotFoundError:
+        return None
+
+    base = os.path.join(os.path.dirname(path_base), reference["base"])
+    if StepManifest(os.path.dirname(base)).key() != reference["key"] or _dense_rows(base) != reference["rows"]:
+        raise StaleReferenceError(
+            f"{os.path.basename(path_base)} was made from an earlier version of {os.path.basename(base)}; run that step again"
+        )
+    return base
+
+
+def _dense_rows(path_base: str) -> Optional[int]:
+    """Rows of the dense matrix at `path_base` (from the Parquet footer), or None if there is none."""
+    path = path_base + DENSE_SUFFIX
+    return pq.ParquetFile(path).metadata.num_rows if os.path.exists(path) else None
+
+
+def mapped_path(path: str) -> str:
+    """Location (without extension) of the memory-mappable copy of an artifact file."""
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, MAPPED_DIRNAME, filename)
+
+
+def _remove_mapped(path_base: str):
+    for suffix in (DENSE_SUFFIX, SPARSE_SUFFIX):
+        for path in glob.glob(glob.escape(mapped_path(path_base + suffix)) + ".*"):
+            os.remove(path)
+
+
+def features_path(path_base: str) -> Optional[str]:
+    """Path of the stored feature matrix (dense or sparse), or None if there is none."""
+    for suffix in (DENSE_SUFFIX, SPARSE_SUFFIX):
+        if os.path.exists(path_base + suffix):
+            return path_base + suffix
+    return None
+
+
+def load_features(path_base: str) -> Tuple[Features, List[str]]:
+    """
+    Loads a feature matrix and its column names, in their stored dtypes.
+
+    Dense artifacts come back as a DataFrame, sparse ones as a CSR matrix
+    (scikit-learn, imbalanced-learn, XGBoost and LightGBM consume it directly).
+    A matrix stored by reference (see save_reference) comes back whole.
+    """
+    path = features_path(path_base)
+    if path is None:
+        raise FileNotFoundError(f"No feature matrix found at {path_base}")
+
+    if path.endswith(SPARSE_SUFFIX):
+        X = sp.load_npz(path).tocsr()
+        with open(path_base + COLUMNS_SUFFIX, "r") as f:
+            feature_names = json.load(f)
+        return X, feature_names
+
+    X = pd.read_parquet(path)
+    base = reference_base(path_base)
+    if base is not None:
+        X = pd.concat([load_features(base)[0], X], ignore_index=True)
+    return X, X.columns.tolist()
+
+
+def as_float(X: Features) -> Features:
+    """
+    Float version of a stored matrix, for steps that interpolate between rows
+    (e.g. SMOTE) and would otherwise truncate their results into uint8 columns.
+    """
+    if sp.issparse(X):
+        return X if X.dtype.kind == "f" else X.astype(np.float32)
+    packed = [col for col, dtype in X.dtypes.items() if dtype.kind != "f"]
+    if not packed:
+        return X
+    return X.astype({col: np.float32 for col in packed})
@@ -1,19 +1,71 @@
+import os
 import pandas as pd
 import numpy as np
-from typing import Dict, Any, Tuple, Optional
+import scipy.sparse as sp
+from typing import Dict, Any, Tuple, Optional, Iterator
 from imblearn.pipeline import Pipeline
 from imblearn.over_sampling import SMOTE, ADASYN, RandomOverSampler, SMOTENC
 from imblearn.under_sampling import RandomUnderSampler, TomekLinks, EditedNearestNeighbours
 from imblearn.combine import SMOTETomek, SMOTEENN
+from imblearn.utils import check_sampling_strategy
+from sklearn.utils import _safe_indexing
+
+from progress import ProgressReporter
+from neighbors import NeighborEngine, NEIGHBOR_ENGINE, NEIGHBOR_N_JOBS
+from knn_graph import KNNGraph
+
+# Above this many output rows, oversampling writes its new rows in chunks (see BalancingPipeline.chunked_plan)
+BALANCE_STREAMING_ROWS = int(os.getenv("BALANCE_STREAMING_ROWS", "1000000"))
+# New rows generated per chunk (bounds peak memory)
+BALANCE_BATCH_ROWS = int(os.getenv("BALANCE_BATCH_ROWS", "100000"))
+
+
+class NeighborTomekLinks(TomekLinks):
+    """
+    TomekLinks whose nearest-neighbor search goes through a NeighborEngine.
+
+    imbalanced-learn's TomekLinks always builds its own NearestNeighbors,
+    unlike the samplers that take a neighbors estimator; this is the same
+    resampling with the search swapped.
+    """
+
+    _parameter_constraints = {**TomekLinks._parameter_constraints, "engine": [str], "graph": [None, KNNGraph]}
+
+    def __init__(self, *, sampling_strategy="auto", engine: str = NEIGHBOR_ENGINE, n_jobs: int = NEIGHBOR_N_JOBS, graph: Optional[KNNGraph] = None):
+        super().__init__(sampling_strategy=sampling_strategy, n_jobs=n_jobs)
+        self.engine = engine
+        self.graph = graph
+
+    def _fit_resample(self, X, y):
+        # Find the nearest neighbour of every point
+        nn = NeighborEngine(n_neighbors=2, engine=self.engine, n_jobs=self.n_jobs, graph=self.graph).fit(X)
+        nns = nn.kneighbors(X, return_distance=False)[:, 1]
+
+        links = self.is_tomek(y, nns, self.sampling_strategy_)
+        self.sample_indices_ = np.flatnonzero(np.logical_not(links))
+        return _safe_indexing(X, self.sample_indices_), _safe_indexing(y, self.sample_indices_)
+
 
 class BalancingPipeline:
+    # Techniques that search neighbors
+    NEIGHBOR_TECHNIQUES = ('SMOTE', 'ADASYN', 'TomekLinks', 'ENN', 'SMOTETomek', 'SMOTEENN')
+    # Those with a search over the whole training set, the one the workflow's k-NN graph answers.
+    # SMOTE only searches within a class, and the hybrids clean a set holding synthetic rows.
+    GRAPH_TECHNIQUES = ('ADASYN', 'TomekLinks', 'ENN')
+    # Techniques whose output is every input row plus new rows of a class (chunked mode)
+    CHUNKED_TECHNIQUES = ('SMOTE', 'RandomOverSampler')
+
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.technique = config.get('technique', 'None')
         self.params = config.get('params', {})
+        # Neighbor search of SMOTE / ADASYN / ENN / Tomek links (see neighbors.NeighborEngine)
+        self.neighbor_engine = config.get('neighborEngine') or NEIGHBOR_ENGINE
+        self.n_jobs = int(config.get('nJobs') or NEIGHBOR_N_JOBS)
+        self.graph = None
         self.resampler = None
 
-    def apply_balancing(self, X_train: pd.DataFrame, y_train: pd.Series, categorical_features_indices: Optional[list] = None) -> Tuple[pd.DataFrame, pd.Series, Dict[str, Any]]:
+    def apply_balancing(self, X_train: pd.DataFrame, y_train: pd.Series, categorical_features_indices: Optional[list] = None, progress: Optional[ProgressReporter] = None, graph: Optional[KNNGraph] = None) -> Tuple[pd.DataFrame, pd.Series, Dict[str, Any]]:
         """
         Applies the configured balancing technique to the training data.
         
@@ -21,6 +73,9 @@ class BalancingPipeline:
             X_train: Training features (DataFrame or numpy array)
             y_train: Training labels
             categorical_features_indices: List of indices for categorical features (required for SMOTENC)
+            progress: Optional reporter notified when resampling starts and ends
+            graph: Optional k-NN graph of X_train; neighbor searches reuse its
+                neighbor lists
             
         Returns:
             Tuple containing:
@@ -52,6 +107,7 @@ class BalancingPipeline:
             }
             
         min_class_count = counts.min()
+        self.graph = graph
         
         self.resampler = self._get_resampler_with_checks(min_class_count, categorical_features_indices)
         
@@ -67,8 +123,10 @@ class BalancingPipeline:
         # because we want to return the resampled data for visualization/saving.
         # However, for the final model pipeline, we would wrap this in imblearn.pipeline.
         
+        progress = progress or ProgressReporter(label="balance")
         try:
-            X_resampled, y_resampled = self.resampler.fit_resample(X_train, y_train)
+            with progress.stage("resampling"):
+                X_resampled, y_resampled = self.resampler.fit_resample(X_train, y_train)
         except Exception as e:
             print(f"Balancing failed: {e}")
             import traceback
@@ -90,6 +148,53 @@ class BalancingPipeline:
             "technique": self.technique
         }
 
+    def chunked_plan(self, X_train, y_train: pd.Series) -> Optional[Dict[Any, int]]:
+        """
+        New rows per class if this run should be chunked, else None.
+
+        Chunked mode covers SMOTE and RandomOverSampler on dense data whose
+        resampled output exceeds BALANCE_STREAMING_ROWS rows.
+        """
+        if self.technique not in self.CHUNKED_TECHNIQUES or sp.issparse(X_train) or y_train.nunique() < 2:
+            return None
+        strategy = self.params.get('sampling_strategy', 'auto')
+        plan = {label: int(n) for label, n in check_sampling_strategy(strategy, y_train, 'over-sampling').items() if n > 0}
+        if len(y_train) + sum(plan.values()) <= BALANCE_STREAMING_ROWS:
+            return None
+        return plan
+
+    def generate_chunks(self, X_train: pd.DataFrame, y_train: pd.Series, plan: Dict[Any, int]) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        New rows of a chunked run (see `chunked_plan`), as (X, y) batches of
+        at most BALANCE_BATCH_ROWS rows, class by class.
+
+        Only the rows of the class being oversampled (and, for SMOTE, their
+        neighbor lists) are held besides the batch; the input rows
+        themselves are not part of the output, callers keep them by reference.
+        SMOTE interpolates like imbalanced-learn's: a random row, one of its
+        k nearest same-class rows and a uniform gap between them.
+        """
+        rng = np.random.default_rng(42)
+        y_arr = y_train.to_numpy()
+        for label, n_new in plan.items():
+            class_rows = np.flatnonzero(y_arr == label)
+            X_class = X_train.iloc[class_rows].to_numpy(dtype=np.float64)
+
+            if self.technique == 'SMOTE':
+                k = self._safe_k('k_neighbors', len(class_rows))
+                nns = self._neighbors(k).fit(X_class).kneighbors(X_class, return_distance=False)[:, 1:]
+
+            for start in range(0, n_new, BALANCE_BATCH_ROWS):
+                n_batch = min(BALANCE_BATCH_ROWS, n_new - start)
+                rows = rng.integers(len(X_class), size=n_batch)
+                if self.technique == 'SMOTE':
+                    neighbors = nns[rows, rng.integers(nns.shape[1], size=n_batch)]
+                    gaps = rng.random((n_batch, 1))
+                    X_new = X_class[rows] + gaps * (X_class[neighbors] - X_class[rows])
+                else:
+                    X_new = X_class[rows]
+                yield X_new, np.full(n_batch, label, dtype=y_arr.dtype)
+
     def _get_resampler(self, categorical_indices: Optional[list] = None):
         # Helper to parse neighbors safely
         # We need access to X or at least n_samples to adjust k.
@@ -98,26 +203,31 @@ class BalancingPipeline:
         # Let's refactor apply_balancing to pass n_samples to _get_resampler
         return None
 
+    def _neighbors(self, k: int) -> NeighborEngine:
+        # The samplers query the rows they were fitted on and skip each row's own match
+        return NeighborEngine(n_neighbors=k + 1, engine=self.neighbor_engine, n_jobs=self.n_jobs, graph=self.graph)
+
+    # Helper: Adjust k if dataset is tiny
+    def _safe_k(self, param_name: str, n_samples_minority: int, default: int = 5) -> int:
+        k = int(self.params.get(param_name, default))
+        # k_neighbors must be < n_samples_minority
+        if k >= n_samples_minority:
+            new_k = max(1, n_samples_minority - 1)
+            print(f"Warning: {param_name}={k} >= n_samples_minority={n_samples_minority}. Adjusting to {new_k}")
+            return new_k
+        return k
+
     def _get_resampler_with_checks(self, n_samples_minority: int, categorical_indices: Optional[list] = None):
-        
-        # Helper: Adjust k if dataset is tiny
-        def get_safe_k(param_name='k_neighbors', default=5):
-            k = int(self.params.get(param_name, default))
-            # k_neighbors must be < n_samples_minority
-            if k >= n_samples_minority:
-                new_k = max(1, n_samples_minority - 1)
-                print(f"Warning: {param_name}={k} >= n_samples_minority={n_samples_minority}. Adjusting to {new_k}")
-                return new_k
-            return k
+        get_safe_k = lambda param_name: self._safe_k(param_name, n_samples_minority)
 
         strategy = self.params.get('sampling_strategy', 'auto')
         
         # Category A: Oversampling
         if self.technique == 'SMOTE':
-            return SMOTE(k_neighbors=get_safe_k('k_neighbors'), sampling_strategy=strategy, random_state=42)
+            return SMOTE(k_neighbors=self._neighbors(get_safe_k('k_neighbors')), sampling_strategy=strategy, random_state=42)
             
         elif self.technique == 'ADASYN':
-             return ADASYN(n_neighbors=get_safe_k('n_neighbors'), sampling_strategy=strategy, random_state=42)
+             return ADASYN(n_neighbors=self._neighbors(get_safe_k('n_neighbors')), sampling_strategy=strategy, random_state=42)
              
         elif self.technique == 'RandomOverSampler':
             return RandomOverSampler(sampling_strategy=strategy, random_state=42)
@@ -128,7 +238,7 @@ class BalancingPipeline:
             return RandomUnderSampler(sampling_strategy=strategy, replacement=replacement, random_state=42)
             
         elif self.technique == 'TomekLinks':
-            return TomekLinks(sampling_strategy=strategy) 
+            return NeighborTomekLinks(sampling_strategy=strategy, engine=self.neighbor_engine, n_jobs=self.n_jobs, graph=self.graph)
             
         elif self.technique == 'ENN': # EditedNearestNeighbours
             # ENN uses n_neighbors to check surroundings. 
@@ -137,16 +247,18 @@ class BalancingPipeline:
             # We can use the whole dataset size here for safety check, but n_neighbors usually refers to local neighborhood.
             # Hard to check minority count vs n_neighbors for ENN as it looks at all classes.
             # We'll just use the param as is for now or cap it at reasonable number if needed.
-            return EditedNearestNeighbours(sampling_strategy=strategy, n_neighbors=int(self.params.get('n_neighbors', 3)))
+            return EditedNearestNeighbours(sampling_strategy=strategy, n_neighbors=self._neighbors(int(self.params.get('n_neighbors', 3))))
 
         # Category C: Hybrids
         elif self.technique == 'SMOTETomek':
              # SMOTE part needs safety check
-             smote = SMOTE(k_neighbors=get_safe_k('k_neighbors'), sampling_strategy=strategy, random_state=42)
-             return SMOTETomek(smote=smote, random_state=42)
+             smote = SMOTE(k_neighbors=self._neighbors(get_safe_k('k_neighbors')), sampling_strategy=strategy, random_state=42)
+             tomek = NeighborTomekLinks(sampling_strategy='all', engine=self.neighbor_engine, n_jobs=self.n_jobs, graph=self.graph)
+             return SMOTETomek(smote=smote, tomek=tomek, random_state=42)
              
         elif self.technique == 'SMOTEENN':
-             smote = SMOTE(k_neighbors=get_safe_k('k_neighbors'), sampling_strategy=strategy, random_state=42)
-             return SMOTEENN(smote=smote, random_state=42)
+             smote = SMOTE(k_neighbors=self._neighbors(get_safe_k('k_neighbors')), sampling_strategy=strategy, random_state=42)
+             enn = EditedNearestNeighbours(sampling_strategy='all', n_neighbors=self._neighbors(3))
+             return SMOTEENN(smote=smote, enn=enn, random_state=42)
 
         return None
@@ -0,0 +1,216 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, Iterator
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+# Columnar copies live in a hidden folder next to the uploaded CSV so that
+# directory listings of "*.csv" (samples, user datasets) are unaffected.
+COLUMNAR_DIRNAME = ".columnar"
+# Per-dataset metadata stored in the same folder (see `sidecar_path`)
+SIDECAR_NAMES = ("sha256.json", "schema.json")
+
+
+class DatasetStore:
+    """
+    Loads datasets through a typed columnar copy (Parquet) and an in-process LRU.
+
+    The raw CSV is parsed once, converted to Parquet next to the original file
+    and, from then on, every endpoint reads the Parquet copy instead. Loaded
+    frames are kept in memory keyed by (path, mtime) until the memory budget
+    is exceeded, at which point the least recently used frames are evicted.
+
+    Frames returned by `load` are shared between callers and must be treated
+    as read-only (copy before mutating in place). Short-lived processes (job
+    workers) load with `cache=False`: nothing would ever hit their LRU, and
+    the frame is freed as soon as the caller drops it.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._frames: "OrderedDict[Tuple[str, float], Tuple[pd.DataFrame, int]]" = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+
+    def columnar_path(self, file_path: str) -> str:
+        """Location of the Parquet copy for a given CSV."""
+        directory, filename = os.path.split(file_path)
+        return os.path.join(directory, COLUMNAR_DIRNAME, f"{filename}.parquet")
+
+    def has_columnar(self, file_path: str) -> bool:
+        """True if an up-to-date Parquet copy exists for this CSV."""
+        parquet_path = self.columnar_path(file_path)
+        if not os.path.exists(parquet_path):
+            return False
+        return os.path.getmtime(parquet_path) >= os.path.getmtime(file_path)
+
+    def convert(self, file_path: str, df: Optional[pd.DataFrame] = None, cache: bool = True) -> Optional[pd.DataFrame]:
+        """
+        Parses the CSV (unless a frame is given) and writes its Parquet copy.
+
+        Returns the loaded frame, or None if the file could not be parsed.
+        Conversion failures (e.g. mixed-type object columns Arrow cannot
+        represent) are not fatal: the dataset keeps being served from CSV.
+        """
+        if df is None:
+            df = pd.read_csv(file_path)
+
+        parquet_path = self.columnar_path(file_path)
+        os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+        tmp_path = f"{parquet_path}.tmp"
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, parquet_path)
+        except Exception as e:
+            print(f"Columnar conversion failed for {file_path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        if cache:
+            self._remember(file_path, df)
+        return df
+
+    def load(self, file_path: str, cache: bool = True) -> pd.DataFrame:
+        """
+        Returns the dataset as a DataFrame, parsing the CSV at most once.
+
+        Lookup order: in-memory LRU -> Parquet copy -> CSV (converted on the fly).
+        With `cache=False` the loaded frame is not added to the LRU.
+        """
+        key = (file_path, os.path.getmtime(file_path))
+        with self._lock:
+            cached = self._frames.get(key)
+            if cached is not None:
+                self._frames.move_to_end(key)
+                return cached[0]
+
+        if self.has_columnar(file_path):
+            try:
+                df = pd.read_parquet(self.columnar_path(file_path))
+                if cache:
+                    self._remember(file_path, df)
+                return df
+            except Exception as e:
+                print(f"Columnar read failed for {file_path}, falling back to CSV: {e}")
+
+        return self.convert(file_path, cache=cache)
+
+    def fingerprint(self, file_path: str) -> str:
+        """
+        SHA-256 of the file's content.
+
+        Stored next to the columnar copy and reused while the file's size and
+        mtime are unchanged; uploads record it while streaming (see ingest.py).
+        """
+        stat = os.stat(file_path)
+        sidecar = self._fingerprint_path(file_path)
+        try:
+            with open(sidecar, "r") as f:
+                saved = json.load(f)
+            if saved["size"] == stat.st_size and saved["mtime"] == stat.st_mtime:
+                return saved["sha256"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        self.save_fingerprint(file_path, digest.hexdigest())
+        return digest.hexdigest()
+
+    def save_fingerprint(self, file_path: str, sha256: str):
+        """Records the content hash of a file that was just written."""
+        stat = os.stat(file_path)
+        sidecar = self._fingerprint_path(file_path)
+        os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+        try:
+            with open(sidecar, "w") as f:
+                json.dump({"sha256": sha256, "size": stat.st_size, "mtime": stat.st_mtime}, f)
+        except OSError as e:
+            print(f"Could not save fingerprint for {file_path}: {e}")
+
+    def _fingerprint_path(self, file_path: str) -> str:
+        return self.sidecar_path(file_path, "sha256.json")
+
+    def sidecar_path(self, file_path: str, name: str) -> str:
+        """Location of a metadata file kept with the dataset (e.g. its fingerprint or schema)."""
+        directory, filename = os.path.split(file_path)
+        return os.path.join(directory, COLUMNAR_DIRNAME, f"{filename}.{name}")
+
+    def row_count(self, file_path: str) -> int:
+        """
+        Number of data rows, without loading the dataset.
+
+        Exact when a Parquet copy exists (read from its footer); otherwise
+        estimated from the average line length of the first megabyte of CSV.
+        """
+        if self.has_columnar(file_path):
+            try:
+                return pq.ParquetFile(self.columnar_path(file_path)).metadata.num_rows
+            except Exception as e:
+                print(f"Could not read Parquet metadata for {file_path}: {e}")
+
+        size = os.path.getsize(file_path)
+        with open(file_path, "rb") as f:
+            head = f.read(1024 * 1024)
+        lines = head.count(b"\n")
+        if len(head) == size or lines == 0:
+            return max(0, lines - 1)
+        return int(size / (len(head) / lines)) - 1
+
+    def iter_batches(self, file_path: str, batch_rows: int) -> Iterator[pd.DataFrame]:
+        """
+        Yields the dataset in DataFrames of at most `batch_rows` rows.
+
+        Reads the Parquet copy when available (consistent column types across
+        batches), otherwise the CSV in chunks. Nothing is cached.
+        """
+        if self.has_columnar(file_path):
+            parquet_file = pq.ParquetFile(self.columnar_path(file_path))
+            for batch in parquet_file.iter_batches(batch_size=batch_rows):
+                yield batch.to_pandas()
+            return
+
+        for chunk in pd.read_csv(file_path, chunksize=batch_rows):
+            yield chunk
+
+    def invalidate(self, file_path: str):
+        """Drops cached frames, the Parquet copy and the metadata sidecars of a dataset."""
+        with self._lock:
+            for key in [k for k in self._frames if k[0] == file_path]:
+                _, size = self._frames.pop(key)
+                self._current_bytes -= size
+        sidecars = [self.sidecar_path(file_path, name) for name in SIDECAR_NAMES]
+        for path in [self.columnar_path(file_path), *sidecars]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _remember(self, file_path: str, df: pd.DataFrame):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return  # Larger than the whole budget: serve it, but don't cache it.
+
+        key = (file_path, os.path.getmtime(file_path))
+        with self._lock:
+            # Older versions of the same file can never be hit again.
+            for stale in [k for k in self._frames if k[0] == file_path and k != key]:
+                _, stale_size = self._frames.pop(stale)
+                self._current_bytes -= stale_size
+
+            if key in self._frames:
+                self._frames.move_to_end(key)
+                return
+
+            self._frames[key] = (df, size)
+            self._current_bytes += size
+            while self._current_bytes > self.max_bytes and self._frames:
+                _, (_, evicted_size) = self._frames.popitem(last=False)
+                self._current_bytes -= evicted_size
+
+
+dataset_store = DatasetStore(max_bytes=int(os.getenv("DATASET_CACHE_MB", "1024")) * 1024 * 1024)
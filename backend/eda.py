@@ -0,0 +1,511 @@
+import os
+import pandas as pd
+import numpy as np
+from typing import Dict, Any, Optional, List, Iterable
+
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+from sklearn.impute import SimpleImputer
+from sklearn.decomposition import PCA
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from scipy.stats import entropy
+
+from schema import TARGET_COUNT_CAP, CLASSIFICATION_TYPES, series_target_type
+from sketches import MomentSketch, KLLSketch, HyperLogLog, FrequentItems, ReservoirSample
+from wire import compact_matrix, compact_points
+
+# Above this many rows, EDA switches to the streaming, sketch-based mode
+EDA_APPROX_ROWS = int(os.getenv("EDA_APPROX_ROWS", "1000000"))
+# Rows kept in the uniform sample used for correlation, feature importance and PCA
+EDA_SAMPLE_ROWS = int(os.getenv("EDA_SAMPLE_ROWS", "100000"))
+# Rows read per batch in approximate mode (bounds peak memory)
+EDA_BATCH_ROWS = int(os.getenv("EDA_BATCH_ROWS", "100000"))
+
+KLL_K = 200  # quantile sketch size (~1.3% rank error)
+HLL_PRECISION = 14  # 16K registers (~0.8% cardinality error)
+HEAVY_HITTERS = 1000  # values tracked per categorical column
+
+def calculate_pca(df, target_col):
+    try:
+        # Select all columns and encode categoricals for PCA visualization
+        # We use a copy to avoid modifying original df if passed by reference (though here it's usually fresh)
+        df_pca = df.copy().dropna()
+        
+        # Limit rows first to speed up processing
+        if len(df_pca) > 2000:
+             df_pca = df_pca.sample(2000, random_state=42)   
+        # Encode Categoricals
+        le = LabelEncoder()
+        for col in df_pca.select_dtypes(include=['object', 'category', 'str']).columns:
+             df_pca[col] = le.fit_transform(df_pca[col].astype(str))
+             
+        # Now we have all numeric (native or encoded)
+        if df_pca.shape[1] < 2:
+            return []
+        # Standardize
+        scaler = StandardScaler()
+        scaled_data = scaler.fit_transform(df_pca)
+        # PCA
+        n_comps = min(3, scaled_data.shape[0], scaled_data.shape[1])
+        pca = PCA(n_components=n_comps)
+        components = pca.fit_transform(scaled_data)
+        # Get targets for coloring
+        targets = []
+        if target_col and target_col in df.columns:
+            targets = df.loc[df_pca.index, target_col].astype(str).tolist()
+        else:
+            targets = ["n/a"] * len(components)
+        return compact_points(components, targets)
+    except Exception as e:
+        print(f"PCA Error: {e}")
+        return []
+
+
+def run_eda(df: pd.DataFrame, file_name: str, requested_target: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Exploratory analysis of a dataset: univariate stats, correlations,
+    quick feature importance, PCA projection and target statistics.
+    """
+    # Filter dropped rows if the target is known
+    if requested_target and requested_target != 'Unknown' and requested_target in df.columns:
+         df = df.dropna(subset=[requested_target])
+
+    row_count, col_count = df.shape
+
+    # --- 1. Univariate Analysis ---
+    numeric_cols = df.select_dtypes(include=['number']).columns
+    univariate = _univariate(df, numeric_cols)
+
+    # --- 2. Bivariate (Correlation) ---
+    correlation = _correlation(df, numeric_cols)
+
+    # --- 3. Feature Importance (Quick RF) ---
+    target_col = _resolve_target(df.columns, requested_target)
+    feature_importance = _feature_importance(df, target_col)
+
+    # --- 4. PCA and Target Stats ---
+    pca_data = calculate_pca(df, target_col)
+
+    sample_records = _sample_records(df)
+
+    return {
+        "fileName": file_name,
+        "univariate": univariate,
+        "correlation": correlation,
+        "featureImportance": feature_importance,
+        "sample": sample_records, # Larger sample for detailed view
+        "targetStats": {
+            "entropy": float(entropy(df[target_col].value_counts(normalize=True))) if target_col and target_col in df.columns else 0,
+            "imbalanceRatio": (df[target_col].value_counts().max() / df[target_col].value_counts().min()) if target_col and target_col in df.columns and len(df[target_col].value_counts()) > 0 else 1,
+            "kurtosis": float(df[target_col].kurtosis()) if target_col and target_col in df.columns and pd.api.types.is_numeric_dtype(df[target_col]) else None,
+            "skew": float(df[target_col].skew()) if target_col and target_col in df.columns and pd.api.types.is_numeric_dtype(df[target_col]) else None
+        },
+        "pca": pca_data,
+        "accuracy": {"mode": "exact", "rowCount": row_count}
+    }
+
+
+def run_eda_approximate(batches: Iterable[pd.DataFrame], file_name: str, requested_target: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Sketch-based variant of `run_eda` for datasets too large to analyze in memory.
+
+    The batches are read once. Missing counts, mean, std, min, max, skew and
+    kurtosis are exact (streaming moments); medians, quartiles and histograms
+    come from KLL quantile sketches; categorical cardinality from HyperLogLog
+    and top counts from a Misra-Gries summary. Correlation, feature importance
+    and PCA run on a uniform reservoir sample of EDA_SAMPLE_ROWS rows.
+
+    Returns the same schema as `run_eda`, with error bounds under "accuracy".
+    """
+    columns = None
+    row_count = 0
+    head = []
+    head_rows = 0
+    sample = ReservoirSample(EDA_SAMPLE_ROWS, seed=42)
+
+    for batch in batches:
+        # 1. Set up the sketches from the first batch's schema
+        if columns is None:
+            columns = list(batch.columns)
+            numeric_cols = list(batch.select_dtypes(include=['number']).columns)
+            categorical_cols = [c for c in columns if c not in numeric_cols]
+            drop_target = requested_target and requested_target != 'Unknown' and requested_target in columns
+            target_col = _resolve_target(columns, requested_target)
+
+            missing = dict.fromkeys(columns, 0)
+            moments = MomentSketch(len(numeric_cols))
+            quantiles = {c: KLLSketch(KLL_K, seed=42) for c in numeric_cols}
+            # Numeric columns only report counts below 50 distinct values
+            counts = {c: FrequentItems(49) for c in numeric_cols}
+            counts.update({c: FrequentItems(HEAVY_HITTERS) for c in categorical_cols})
+            distinct = {c: HyperLogLog(HLL_PRECISION) for c in categorical_cols}
+            target_counts = FrequentItems(TARGET_COUNT_CAP)
+
+        if drop_target:
+            batch = batch.dropna(subset=[requested_target])
+        if len(batch) == 0:
+            continue
+
+        # 2. Fold the batch into the sketches
+        row_count += len(batch)
+        if head_rows < 5000:
+            head.append(batch.head(5000 - head_rows))
+            head_rows += len(head[-1])
+        sample.update(batch)
+
+        nulls = batch.isnull().sum()
+        for col in columns:
+            missing[col] += int(nulls[col])
+
+        if numeric_cols:
+            block = batch[numeric_cols]
+            if not all(pd.api.types.is_numeric_dtype(t) for t in block.dtypes):
+                # CSV chunks may infer a different type than the first one
+                block = block.apply(pd.to_numeric, errors='coerce')
+            block = block.to_numpy(dtype=float, na_value=np.nan)
+            moments.update(block)
+            for j, col in enumerate(numeric_cols):
+                quantiles[col].update(block[:, j])
+                if counts[col].exact:
+                    counts[col].update(batch[col].value_counts())
+
+        for col in categorical_cols:
+            value_counts = batch[col].value_counts()
+            distinct[col].update(value_counts.index.to_numpy())
+            counts[col].update(value_counts)
+
+        if target_col in columns and target_counts.exact:
+            target_counts.update(batch[target_col].value_counts())
+
+    if columns is None:
+        raise ValueError("Dataset is empty")
+
+    df_sample = sample.frame if sample.frame is not None else pd.DataFrame(columns=columns)
+
+    # 3. Univariate stats, in the same shape as the exact mode
+    univariate = {}
+    std, skew, kurt = moments.std(), moments.skew(), moments.kurtosis()
+    for col in columns:
+        stats_obj = {'missing': missing[col]}
+
+        if col in numeric_cols:
+            j = numeric_cols.index(col)
+            has_values = moments.count[j] > 0
+            q1, median, q3 = quantiles[col].quantiles([0.25, 0.5, 0.75])
+
+            stats_obj['type'] = 'numeric'
+            stats_obj['mean'] = float(moments.mean[j]) if has_values else 0
+            stats_obj['median'] = float(median) if has_values else 0
+            stats_obj['std'] = float(std[j]) if has_values else 0
+            stats_obj['min'] = float(moments.min[j]) if has_values else 0
+            stats_obj['max'] = float(moments.max[j]) if has_values else 0
+            stats_obj['skew'] = float(skew[j]) if np.isfinite(skew[j]) else 0.0
+            stats_obj['kurtosis'] = float(kurt[j]) if np.isfinite(kurt[j]) else 0.0
+
+            if counts[col].exact:
+                stats_obj['counts'] = {str(k): int(v) for k, v in counts[col].top(10).items()}
+
+            if has_values:
+                # Bins span the exact min/max; counts are scaled up from the sample
+                sampled = pd.to_numeric(df_sample[col], errors='coerce').dropna().to_numpy(dtype=float)
+                hist, bin_edges = np.histogram(sampled, bins=10, range=(moments.min[j], moments.max[j]))
+                if len(sampled) > 0:
+                    hist = np.rint(hist * (moments.count[j] / len(sampled))).astype(int)
+                stats_obj['histogram'] = {
+                    'counts': hist.tolist(),
+                    'bins': bin_edges.tolist()
+                }
+                stats_obj['boxplot'] = {
+                    'q1': float(q1),
+                    'median': float(median),
+                    'q3': float(q3),
+                    'min': float(moments.min[j]),
+                    'max': float(moments.max[j])
+                }
+        else:
+            stats_obj['type'] = 'categorical'
+            if counts[col].exact:
+                stats_obj['unique'] = len(counts[col].counts)
+            else:
+                stats_obj['unique'] = int(round(distinct[col].count()))
+            stats_obj['counts'] = {str(k): int(v) for k, v in counts[col].top(10).items()}
+
+        univariate[col] = stats_obj
+
+    # 4. Sample-based analyses
+    correlation = _correlation(df_sample, numeric_cols)
+    feature_importance = _feature_importance(df_sample, target_col) if len(df_sample) else {}
+    pca_data = calculate_pca(df_sample, target_col)
+
+    # 5. Target stats: exact class counts unless the target has too many values
+    target_stats = {"entropy": 0, "imbalanceRatio": 1, "kurtosis": None, "skew": None}
+    if target_col in columns:
+        if target_counts.exact:
+            target_vc = pd.Series(target_counts.counts, dtype=float)
+        else:
+            target_vc = df_sample[target_col].value_counts()
+        if len(target_vc) > 0:
+            target_stats["entropy"] = float(entropy(target_vc / target_vc.sum()))
+            target_stats["imbalanceRatio"] = float(target_vc.max() / target_vc.min())
+        if target_col in numeric_cols:
+            j = numeric_cols.index(target_col)
+            target_stats["kurtosis"] = float(kurt[j])
+            target_stats["skew"] = float(skew[j])
+
+    return {
+        "fileName": file_name,
+        "univariate": univariate,
+        "correlation": correlation,
+        "featureImportance": feature_importance,
+        "sample": _sample_records(pd.concat(head, ignore_index=True)) if head else [],
+        "targetStats": target_stats,
+        "pca": pca_data,
+        "accuracy": {
+            "mode": "approximate",
+            "rowCount": row_count,
+            "sampleRows": len(df_sample),
+            "sampling": "uniform reservoir",
+            "exact": ["missing", "mean", "std", "min", "max", "skew", "kurtosis"],
+            # Normalized rank error of median/boxplot quantiles (99% confidence)
+            "quantileRankError": KLLSketch.rank_error(KLL_K),
+            "cardinalityRelativeError": float(HyperLogLog.relative_error(HLL_PRECISION)),
+            # Upper bound on the undercount of each top value, per column
+            "countsMaxError": {str(c): f.max_error for c, f in counts.items() if c in categorical_cols and not f.exact},
+            "targetStatsFromSample": target_col in columns and not target_counts.exact,
+            "sampled": ["histogram", "correlation", "featureImportance", "pca"]
+        }
+    }
+
+
+def _univariate(df: pd.DataFrame, numeric_cols) -> Dict[str, Any]:
+    """
+    Per-column summary statistics (missing values, moments, quartiles,
+    histogram and top counts).
+
+    Numeric columns are summarized together by `_numeric_stats`, so the cost
+    no longer grows with one Python-level pass per statistic per column.
+    """
+    missing = df.isnull().sum()
+    numeric = _numeric_stats(df[numeric_cols]) if len(numeric_cols) > 0 else {}
+
+    univariate = {}
+    for col in df.columns:
+        if col in numeric:
+            univariate[col] = {'missing': int(missing[col]), **numeric[col]}
+            continue
+
+        # Categorical
+        counts = df[col].value_counts()
+        univariate[col] = {
+            'missing': int(missing[col]),
+            'type': 'categorical',
+            'unique': len(counts),
+            # Top 10 counts (string keys, as they appear in the JSON response)
+            'counts': {str(k): int(v) for k, v in counts.head(10).items()}
+        }
+    return univariate
+
+
+def _numeric_stats(df_num: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """
+    Batched statistics for all numeric columns.
+
+    Moments come from pandas' frame-level reductions (one vectorized call per
+    statistic for the whole frame). Everything order-based - min, max,
+    median, quartiles, distinct counts, histograms - comes from a single sort
+    of the 2-D value block, reproducing NumPy's median, `percentile` (linear)
+    and `histogram` arithmetic column-wise, so the numbers are identical to
+    computing them column by column. Skew and kurtosis may differ in the last
+    bits, as pandas evaluates their closing formula on an array.
+    """
+    # 1. Moments (skip NaN, same as Series reductions)
+    moments = [df_num.mean(), df_num.std(), df_num.skew(), df_num.kurtosis()]
+    means, stds, skews, kurts = (m.to_numpy(dtype=float, na_value=np.nan) for m in moments)
+
+    # 2. Sort every column once; NaNs sort to the end of each column
+    block = np.sort(df_num.to_numpy(dtype=float, na_value=np.nan), axis=0)
+    if block.shape[0] == 0:
+        block = np.full((1, block.shape[1]), np.nan)
+    n_rows, n_cols = block.shape
+    cols = np.arange(n_cols)
+    valid = (~np.isnan(block)).sum(axis=0)
+    last = np.maximum(valid - 1, 0)
+
+    lows, highs = block[last // 2, cols], block[valid // 2 - (valid == 0), cols]
+    medians = np.where(valid % 2 == 1, highs, (lows + highs) / 2)
+    q1s, q3s = _sorted_percentile(block, valid, 0.25), _sorted_percentile(block, valid, 0.75)
+    data_mins, data_maxs = block[0], block[last, cols]
+
+    # Distinct values: positions where the sorted value changes
+    changes = (block[1:] != block[:-1]) & (np.arange(1, n_rows)[:, None] < valid)
+    distinct = np.where(valid > 0, 1 + changes.sum(axis=0), 0)
+
+    hists, edges = _sorted_histograms(block, valid, data_mins, data_maxs)
+
+    stats = {}
+    for j, col in enumerate(df_num.columns):
+        has_values = valid[j] > 0
+        skew_val, kurt_val = skews[j], kurts[j]
+        stats_obj = {
+            'type': 'numeric',
+            'mean': float(means[j]) if has_values else 0,
+            'median': float(medians[j]) if has_values else 0,
+            'std': float(stds[j]) if has_values else 0,
+            'min': float(data_mins[j]) if has_values else 0,
+            'max': float(data_maxs[j]) if has_values else 0,
+            'skew': float(skew_val) if not pd.isna(skew_val) and not np.isinf(skew_val) else 0.0,
+            'kurtosis': float(kurt_val) if not pd.isna(kurt_val) and not np.isinf(kurt_val) else 0.0,
+        }
+
+        # For numeric columns with few unique values (e.g. binary extraction), treat as categorical for counts
+        if distinct[j] < 50:
+            counts = df_num.iloc[:, j].value_counts().head(10)
+            stats_obj['counts'] = {str(k): int(v) for k, v in counts.items()} # Ensure keys are strings for JSON
+
+        if has_values:
+            stats_obj['histogram'] = {
+                'counts': hists[j].tolist(),
+                'bins': edges[:, j].tolist() # Edges are n+1
+            }
+            stats_obj['boxplot'] = {
+                'q1': float(q1s[j]),
+                'median': float(medians[j]),
+                'q3': float(q3s[j]),
+                'min': float(data_mins[j]), # pure min, often whiskers are calculated differently in JS
+                'max': float(data_maxs[j])
+            }
+        stats[col] = stats_obj
+    return stats
+
+
+def _sorted_percentile(block: np.ndarray, valid: np.ndarray, q: float) -> np.ndarray:
+    """np.percentile (linear method) of each column's first `valid` sorted values."""
+    virtual = (valid - 1) * q
+    previous = np.floor(virtual)
+    at_end = virtual >= valid - 1
+    cols = np.arange(block.shape[1])
+    below = block[np.where(at_end, valid - 1, previous).astype(np.intp), cols]
+    above = block[np.where(at_end, valid - 1, previous + 1).astype(np.intp), cols]
+
+    # Same two-sided interpolation as NumPy's _lerp
+    gamma = virtual - previous
+    diff = above - below
+    return np.where(gamma >= 0.5, above - diff * (1 - gamma), below + diff * gamma)
+
+
+def _sorted_histograms(block: np.ndarray, valid: np.ndarray, data_mins: np.ndarray, data_maxs: np.ndarray, bins: int = 10):
+    """np.histogram(column, bins=10) for every column of the sorted block at once."""
+    first, last = data_mins.copy(), data_maxs.copy()
+    not_finite = np.flatnonzero((valid > 0) & ~(np.isfinite(first) & np.isfinite(last)))
+    if len(not_finite) > 0:
+        # Same failure as np.histogram on a column holding +/-inf
+        j = not_finite[0]
+        raise ValueError(f"autodetected range of [{first[j]}, {last[j]}] is not finite")
+    first[valid == 0], last[valid == 0] = 0.0, 1.0
+
+    # Expand empty ranges to avoid dividing by zero
+    flat = first == last
+    first[flat] -= 0.5
+    last[flat] += 0.5
+    edges = np.linspace(first, last, bins + 1)
+
+    # np.histogram bins are [edge_i, edge_i+1) with the last bin closed; the
+    # columns are sorted, so each count is a difference of two ranks.
+    below = _count_below(block, valid, edges)
+    hists = np.diff(below, axis=0)
+    hists[-1] += valid - below[-1]
+    return hists.T, edges
+
+
+def _count_below(block: np.ndarray, valid: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """Vectorized binary search: how many of each column's first `valid` sorted values are < each target."""
+    cols = np.arange(block.shape[1])
+    lo = np.zeros(targets.shape, dtype=np.intp)
+    hi = np.broadcast_to(valid, targets.shape).astype(np.intp)
+    while (lo < hi).any():
+        mid = (lo + hi) // 2
+        active = lo < hi
+        go_right = active & (block[np.minimum(mid, block.shape[0] - 1), cols] < targets)
+        lo = np.where(go_right, mid + 1, lo)
+        hi = np.where(active & ~go_right, mid, hi)
+    return lo
+
+
+def _correlation(df: pd.DataFrame, numeric_cols) -> Dict[str, Any]:
+    correlation = {}
+    if len(numeric_cols) > 1:
+         # Upper triangle only; see wire.expand_matrix for the per-cell form
+         correlation = compact_matrix(df[numeric_cols].corr(), fill_value=0.0)
+    return correlation
+
+
+def _resolve_target(columns, requested_target: Optional[str]) -> str:
+    target_col = requested_target
+
+    # Try to guess target ONLY if requested_target is not provided
+    if not target_col or target_col == 'Unknown':
+        potential_targets = [c for c in columns if c.lower() in ['class', 'target', 'label', 'y']]
+        if potential_targets:
+            target_col = potential_targets[0]
+        else:
+            target_col = columns[-1]
+    return target_col
+
+
+def _feature_importance(df: pd.DataFrame, target_col: str) -> Dict[str, Any]:
+    feature_importance = {}
+    if target_col and target_col in df.columns:
+         # Preprocess for RF
+         df_rf = df.copy()
+
+         # Encode Categoricals
+         le = LabelEncoder()
+         for col in df_rf.select_dtypes(include=['object', 'str']).columns:
+             df_rf[col] = le.fit_transform(df_rf[col].astype(str))
+
+         # Impute
+         imp = SimpleImputer(strategy='mean')
+         df_rf_clean = pd.DataFrame(imp.fit_transform(df_rf), columns=df_rf.columns)
+
+         X = df_rf_clean.drop(columns=[target_col])
+         y = df_rf_clean[target_col]
+
+         # Detect Type for RF
+         is_categorical = False
+         target_dtype = df[target_col].dtype
+
+         if target_dtype == 'object' or target_dtype.name == 'category':
+             is_categorical = True
+         elif series_target_type(df[target_col]) in CLASSIFICATION_TYPES:
+             is_categorical = True
+
+         if is_categorical:
+              # Ensure classes are integers (SimpleImputer might have made them floats)
+              y = y.astype(int)
+              rf = RandomForestClassifier(n_estimators=10, max_depth=5, random_state=42)
+         else:
+              rf = RandomForestRegressor(n_estimators=10, max_depth=5, random_state=42)
+
+         rf.fit(X, y)
+
+         # Extract
+         importances = rf.feature_importances_
+         indices = np.argsort(importances)[::-1]
+
+         feats = []
+         for f in range(X.shape[1]):
+             feats.append({
+                 'feature': X.columns[indices[f]],
+                 'importance': float(importances[indices[f]])
+             })
+         feature_importance['scores'] = feats
+         feature_importance['target'] = target_col
+    return feature_importance
+
+
+def _sample_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    # Safely create sample to avoid numpy string dtype errors
+    df_sample = df.head(5000).copy()
+    num_cols_sample = df_sample.select_dtypes(include=[np.number]).columns
+    if len(num_cols_sample) > 0:
+        df_sample[num_cols_sample] = df_sample[num_cols_sample].replace([np.inf, -np.inf], np.nan)
+    return df_sample.fillna("").to_dict(orient='records')
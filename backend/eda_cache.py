@@ -0,0 +1,102 @@
+import os
+import json
+import hashlib
+from typing import Dict, Any, Optional, Iterable
+
+from json_utils import dumps
+from utils import get_user_storage_usage
+
+# Bump when the EDA response format changes so stale entries are never served
+EDA_CACHE_VERSION = 2
+
+# Per-user storage quota (matches the free tier enforced by the frontend)
+USER_STORAGE_QUOTA_BYTES = int(os.getenv("USER_STORAGE_QUOTA_MB", "1024")) * 1024 * 1024
+# Share of the quota the EDA cache may occupy
+EDA_CACHE_QUOTA_SHARE = float(os.getenv("EDA_CACHE_QUOTA_SHARE", "0.1"))
+
+
+class EDACache:
+    """
+    On-disk cache of EDA results.
+
+    Entries are keyed by the dataset's content hash plus the request
+    parameters (target column, mode), so a re-uploaded file with new content
+    can never hit a stale result. Entries are plain JSON files, touched on
+    every hit; when the cache outgrows its share of the user's quota, or the
+    user is over quota, the least recently used entries are evicted.
+    """
+
+    def __init__(self, cache_dir: str, user_id: Optional[str] = None):
+        self.cache_dir = cache_dir
+        self.user_id = user_id
+
+    def key(self, fingerprint: str, target_col: Optional[str], mode: str) -> str:
+        params = json.dumps([target_col, mode, EDA_CACHE_VERSION])
+        return f"{fingerprint}__{hashlib.sha1(params.encode()).hexdigest()[:16]}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                result = json.load(f)
+            os.utime(path)  # Recency for LRU eviction
+            return result
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Ignoring unreadable EDA cache entry {path}: {e}")
+            return None
+
+    def put(self, key: str, result: Dict[str, Any]):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(dumps(result))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Could not write EDA cache entry {path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """Drops least recently used entries until the cache fits its quota share."""
+        entries = self._entries()
+        cache_bytes = sum(size for _, size, _ in entries)
+        usage = get_user_storage_usage(self.user_id) if self.user_id else cache_bytes
+
+        for path, size, _ in sorted(entries, key=lambda e: e[2]):
+            if cache_bytes <= USER_STORAGE_QUOTA_BYTES * EDA_CACHE_QUOTA_SHARE and usage <= USER_STORAGE_QUOTA_BYTES:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            cache_bytes -= size
+            usage -= size
+
+    def prune(self, live_fingerprints: Iterable[str]):
+        """Removes entries whose dataset content no longer exists (replaced or deleted files)."""
+        live = set(live_fingerprints)
+        for path, _, _ in self._entries():
+            if os.path.basename(path).split("__")[0] not in live:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
@@ -0,0 +1,88 @@
+import os
+import numpy as np
+import pandas as pd
+from typing import List
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.neighbors import NearestNeighbors
+
+# Rows of the training data the neighbor index is built from
+KNN_IMPUTE_SAMPLE_ROWS = int(os.getenv("KNN_IMPUTE_SAMPLE_ROWS", "50000"))
+# Rows queried against the index at once (bounds the neighbor arrays held in memory)
+KNN_IMPUTE_BATCH_ROWS = int(os.getenv("KNN_IMPUTE_BATCH_ROWS", "10000"))
+
+
+class NeighborImputer(BaseEstimator, TransformerMixin):
+    """
+    k-nearest-neighbor imputation of several numeric columns at once.
+
+    Unlike sklearn's KNNImputer, which compares every row to every training
+    row, neighbors are looked up in a tree index (kd-tree or ball tree, as
+    NearestNeighbors picks) built on a bounded sample of complete training
+    rows, and rows are queried in batches. Distances use the observed
+    columns of each row, standardized so no column dominates; rows sharing
+    a missing pattern share one index. A missing value becomes the mean of
+    that column over the row's `n_neighbors` nearest donors, and rows with
+    nothing observed get the column means.
+
+    Works on a DataFrame: only `columns` are imputed, the rest pass through.
+    """
+
+    def __init__(self, columns: List[str], n_neighbors: int = 5, max_samples: int = KNN_IMPUTE_SAMPLE_ROWS,
+                 batch_size: int = KNN_IMPUTE_BATCH_ROWS, random_state: int = 42):
+        self.columns = columns
+        self.n_neighbors = n_neighbors
+        self.max_samples = max_samples
+        self.batch_size = batch_size
+        self.random_state = random_state
+
+    def fit(self, X: pd.DataFrame, y=None):
+        values = X[self.columns].to_numpy(dtype=float)
+        observed = ~np.isnan(values)
+        counts = observed.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # Columns with no values at all are filled with 0
+            self.means_ = np.where(counts > 0, np.where(observed, values, 0).sum(axis=0) / np.maximum(counts, 1), 0.0)
+            scale = np.sqrt(np.where(observed, (values - self.means_) ** 2, 0).sum(axis=0) / np.maximum(counts, 1))
+        self.scale_ = np.where(scale > 0, scale, 1.0)
+
+        # 1. Bounded sample of donor rows
+        if len(values) > self.max_samples:
+            rng = np.random.default_rng(self.random_state)
+            values = values[np.sort(rng.choice(len(values), self.max_samples, replace=False))]
+
+        # 2. Donors are the complete rows; mean-filled rows if there are too few of them
+        complete = ~np.isnan(values).any(axis=1)
+        if complete.sum() >= self.n_neighbors:
+            self.donors_ = values[complete]
+        else:
+            self.donors_ = np.where(np.isnan(values), self.means_, values)
+        return self
+
+    def transform(self, X: pd.DataFrame) -> pd.DataFrame:
+        values = X[self.columns].to_numpy(dtype=float, copy=True)
+        missing = np.isnan(values)
+        rows = np.flatnonzero(missing.any(axis=1))
+        if len(rows) == 0:
+            return X
+
+        scaled_donors = (self.donors_ - self.means_) / self.scale_
+        patterns, inverse = np.unique(missing[rows], axis=0, return_inverse=True)
+        for p, pattern in enumerate(patterns):
+            pattern_rows = rows[inverse.ravel() == p]
+            observed = ~pattern
+            if not observed.any() or len(self.donors_) == 0:
+                values[np.ix_(pattern_rows, pattern)] = self.means_[pattern]
+                continue
+
+            index = NearestNeighbors(n_neighbors=min(self.n_neighbors, len(self.donors_)))
+            index.fit(scaled_donors[:, observed])
+            donor_values = self.donors_[:, pattern]
+            for start in range(0, len(pattern_rows), self.batch_size):
+                batch = pattern_rows[start:start + self.batch_size]
+                query = (values[np.ix_(batch, observed)] - self.means_[observed]) / self.scale_[observed]
+                _, neighbors = index.kneighbors(query)
+                values[np.ix_(batch, pattern)] = donor_values[neighbors].mean(axis=1)
+
+        X = X.copy()
+        X[self.columns] = values
+        return X
@@ -0,0 +1,114 @@
+import io
+import os
+import hashlib
+from typing import Dict, Any, Optional, BinaryIO
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from dataset_store import dataset_store
+from schema import SchemaBuilder, save_schema
+
+# Rows parsed per chunk while streaming an upload (bounds peak memory)
+CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "100000"))
+
+
+class _TeeReader(io.RawIOBase):
+    """Binary reader that copies every byte it hands out into a destination file (and hashes it)."""
+
+    def __init__(self, src: BinaryIO, dest: BinaryIO):
+        self.src = src
+        self.dest = dest
+        self.bytes_read = 0
+        self.digest = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.src.read(len(buffer))
+        n = len(data)
+        buffer[:n] = data
+        self.dest.write(data)
+        self.digest.update(data)
+        self.bytes_read += n
+        return n
+
+    def drain(self):
+        """Copies whatever the parser did not consume (e.g. trailing blank lines)."""
+        while self.read(1024 * 1024):
+            pass
+
+
+def ingest_upload(src: BinaryIO, dest_path: str, user_target_col: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Saves an uploaded CSV while profiling it and writing its columnar copy.
+
+    The source is read once: every block is written to `dest_path` (and
+    hashed into the dataset's content fingerprint), parsed in
+    chunks of CHUNK_ROWS rows, folded into the dataset's schema (see
+    schema.py, cached with the dataset) and appended as a row group to the
+    dataset store's Parquet copy. Returns the upload profile. Peak memory is bounded by
+    the chunk size, not by the file size.
+
+    If a later chunk does not fit the column types inferred from the first
+    one (e.g. a numeric column that later contains text), the Parquet copy
+    is abandoned and the dataset store converts the file on first load.
+    """
+    builder = SchemaBuilder()
+    error = None
+    parquet_path = dataset_store.columnar_path(dest_path)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    tmp_parquet_path = f"{parquet_path}.tmp"
+
+    writer = None
+    schema = None
+    columnar_ok = True
+
+    try:
+        with open(dest_path, "wb") as buffer:
+            tee = _TeeReader(src, buffer)
+            with io.BufferedReader(tee, buffer_size=1024 * 1024) as reader:
+                try:
+                    for chunk in pd.read_csv(reader, chunksize=CHUNK_ROWS):
+                        builder.update(chunk)
+
+                        if not columnar_ok:
+                            continue
+                        try:
+                            if writer is None:
+                                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                                schema = table.schema
+                                writer = pq.ParquetWriter(tmp_parquet_path, schema)
+                            else:
+                                table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+                            writer.write_table(table)
+                        except Exception as e:
+                            print(f"Streaming columnar write abandoned for {dest_path}: {e}")
+                            columnar_ok = False
+                except Exception as e:
+                    # Keep saving the upload even if it cannot be parsed
+                    print(f"Error analyzing {dest_path}: {e}")
+                    error = str(e)
+                    columnar_ok = False
+
+                tee.drain()
+
+        dataset_store.save_fingerprint(dest_path, tee.digest.hexdigest())
+        inferred = builder.result()
+        if error is None:
+            save_schema(dest_path, inferred)
+
+        if writer is not None:
+            writer.close()
+            writer = None
+            if columnar_ok:
+                os.replace(tmp_parquet_path, parquet_path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_parquet_path):
+            os.remove(tmp_parquet_path)
+
+    return inferred.profile(user_target_col, os.path.getsize(dest_path), error)
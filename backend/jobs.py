@@ -0,0 +1,273 @@
+import os
+import sys
+import time
+import uuid
+import threading
+import traceback
+import multiprocessing
+from collections import deque
+from typing import Dict, Any, Optional, Callable, List, Tuple
+
+from progress import ProgressReporter
+
+# Maximum number of jobs executing at once (one worker process each)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+# Maximum number of queued + running jobs per user
+JOB_USER_LIMIT = int(os.getenv("JOB_USER_LIMIT", "2"))
+# How long finished jobs (and their results) are kept for polling
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+QUEUED = "Queued"
+RUNNING = "Running"
+COMPLETED = "Completed"
+FAILED = "Failed"
+CANCELLED = "Cancelled"
+
+FINISHED_STATES = {COMPLETED, FAILED, CANCELLED}
+
+
+class JobLimitError(Exception):
+    """Raised when a user already has the maximum number of active jobs."""
+
+
+def _execute(conn, kind: str, fn: Callable, args: tuple, kwargs: dict):
+    """Worker process body: runs the task and reports progress and outcome through the pipe."""
+    progress = ProgressReporter(emit=lambda event: conn.send(("progress", event)), label=kind)
+    try:
+        result = fn(*args, progress=progress, **kwargs)
+        conn.send(("done", result))
+    except Exception as e:
+        traceback.print_exc()
+        conn.send(("failed", str(e)))
+    finally:
+        conn.close()
+        _stop_joblib_workers()
+
+
+def _stop_joblib_workers():
+    """
+    Shuts down the reusable loky workers a task started (joblib with n_jobs > 1).
+    They outlive the task and would keep the worker process, and so the job,
+    running until their idle timeout. Tasks that never started any (serial
+    runs, most job kinds) have no executor, and none is created here.
+    """
+    from joblib.externals.loky import reusable_executor
+    executor = getattr(reusable_executor, "_executor", None)
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+class JobManager:
+    """
+    Runs CPU-heavy workflow steps outside the API process.
+
+    Each job executes in its own worker process so it can use a full core
+    and be cancelled at any point; at most `max_workers` processes run at
+    once and the rest wait in a FIFO queue. Workers are forked from a
+    preloaded server process, so the ML stack is imported only once.
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_jobs_per_user: int = JOB_USER_LIMIT):
+        self.max_workers = max_workers
+        self.max_jobs_per_user = max_jobs_per_user
+
+        if sys.platform == "win32":
+            self._ctx = multiprocessing.get_context("spawn")
+        else:
+            self._ctx = multiprocessing.get_context("forkserver")
+            self._ctx.set_forkserver_preload(["tasks"])
+
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue = deque()
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, user_id: str, kind: str, fn: Callable, *args, **kwargs) -> Dict[str, Any]:
+        """Queues `fn(*args, **kwargs)` and returns the job status immediately."""
+        with self._lock:
+            self._purge_finished()
+
+            active = sum(
+                1 for job in self._jobs.values()
+                if job["userId"] == user_id and job["status"] not in FINISHED_STATES
+            )
+            if active >= self.max_jobs_per_user:
+                raise JobLimitError(
+                    f"You already have {active} jobs in progress (limit is {self.max_jobs_per_user}). "
+                    "Wait for them to finish or cancel one."
+                )
+
+            job_id = uuid.uuid4().hex
+            job = {
+                "jobId": job_id,
+                "userId": user_id,
+                "kind": kind,
+                "status": QUEUED,
+                "createdAt": time.time(),
+                "startedAt": None,
+                "finishedAt": None,
+                "error": None,
+                "stage": None,
+                "result": None,
+                "_events": [],
+                "_call": (fn, args, kwargs),
+                "_process": None,
+            }
+            self._jobs[job_id] = job
+            self._queue.append(job_id)
+            self._dispatch()
+            return self._public(job)
+
+    def completed(self, user_id: str, kind: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Registers an already finished job (e.g. a result served from a cache),
+        so clients poll and fetch it exactly like a computed one.
+        """
+        with self._lock:
+            self._purge_finished()
+            now = time.time()
+            job_id = uuid.uuid4().hex
+            job = {
+                "jobId": job_id,
+                "userId": user_id,
+                "kind": kind,
+                "status": COMPLETED,
+                "createdAt": now,
+                "startedAt": now,
+                "finishedAt": now,
+                "error": None,
+                "stage": None,
+                "cached": True,
+                "result": result,
+                "_events": [],
+                "_process": None,
+            }
+            self._jobs[job_id] = job
+            return self._public(job)
+
+    def get(self, job_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Returns the job status (without the result), or None if unknown.
+
+        Here and below, a job of a user other than `user_id` (when given)
+        is treated as unknown.
+        """
+        with self._lock:
+            job = self._owned(job_id, user_id)
+            return self._public(job) if job else None
+
+    def result(self, job_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Returns the job status including its result, or None if unknown."""
+        with self._lock:
+            job = self._owned(job_id, user_id)
+            if not job:
+                return None
+            view = self._public(job)
+            view["result"] = job["result"]
+            return view
+
+    def events(self, job_id: str, since: int = 0, user_id: Optional[str] = None) -> Optional[Tuple[List[Dict[str, Any]], str]]:
+        """
+        Returns the progress events recorded after the first `since` ones and the
+        current job status, or None if the job is unknown.
+        """
+        with self._lock:
+            job = self._owned(job_id, user_id)
+            if not job:
+                return None
+            return list(job["_events"][since:]), job["status"]
+
+    def cancel(self, job_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Cancels a queued job, or terminates the worker of a running one."""
+        with self._lock:
+            job = self._owned(job_id, user_id)
+            if not job:
+                return None
+
+            if job["status"] == QUEUED:
+                self._queue.remove(job_id)
+                self._finish(job, CANCELLED)
+            elif job["status"] == RUNNING:
+                # The monitor thread notices the closed pipe and frees the slot
+                job["status"] = CANCELLED
+                job["_process"].terminate()
+            return self._public(job)
+
+    def _owned(self, job_id: str, user_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        # Caller holds the lock
+        job = self._jobs.get(job_id)
+        if job is None or (user_id is not None and job["userId"] != user_id):
+            return None
+        return job
+
+    def _dispatch(self):
+        # Caller holds the lock
+        while self._queue and self._running < self.max_workers:
+            job = self._jobs[self._queue.popleft()]
+            fn, args, kwargs = job.pop("_call")
+
+            parent_conn, child_conn = self._ctx.Pipe(duplex=False)
+            # Not daemonic: tasks may start their own joblib workers
+            process = self._ctx.Process(target=_execute, args=(child_conn, job["kind"], fn, args, kwargs))
+            process.start()
+            child_conn.close()
+
+            job["status"] = RUNNING
+            job["startedAt"] = time.time()
+            job["_process"] = process
+            self._running += 1
+
+            threading.Thread(target=self._monitor, args=(job, parent_conn), daemon=True).start()
+
+    def _monitor(self, job: Dict[str, Any], conn):
+        outcome = None
+        try:
+            while True:
+                message = conn.recv()
+                if message[0] == "progress":
+                    with self._lock:
+                        job["_events"].append(message[1])
+                        job["stage"] = message[1]["stage"]
+                    continue
+                if message[0] in ("done", "failed"):
+                    outcome = message
+                    break
+        except (EOFError, OSError):
+            pass  # Worker exited without reporting (cancelled or crashed)
+        finally:
+            conn.close()
+
+        job["_process"].join()
+
+        with self._lock:
+            if job["status"] == CANCELLED:
+                self._finish(job, CANCELLED)
+            elif outcome and outcome[0] == "done":
+                job["result"] = outcome[1]
+                self._finish(job, COMPLETED)
+            elif outcome:
+                job["error"] = outcome[1]
+                self._finish(job, FAILED)
+            else:
+                job["error"] = f"Worker exited unexpectedly (exit code {job['_process'].exitcode})."
+                self._finish(job, FAILED)
+
+            self._running -= 1
+            self._dispatch()
+
+    def _finish(self, job: Dict[str, Any], status: str):
+        job["status"] = status
+        job["finishedAt"] = time.time()
+        job["_process"] = None
+
+    def _purge_finished(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [
+            job_id for job_id, job in self._jobs.items()
+            if job["status"] in FINISHED_STATES and job["finishedAt"] and job["finishedAt"] < cutoff
+        ]:
+            del self._jobs[job_id]
+
+    @staticmethod
+    def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in job.items() if not k.startswith("_") and k != "result"}
@@ -1,5 +1,14 @@
+import json
+
 import pandas as pd
 import numpy as np
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # Optional: falls back to sanitize_for_json + json
+    orjson = None
 
 def sanitize_for_json(obj):
     """
@@ -14,6 +23,8 @@ def sanitize_for_json(obj):
         return {str(k): sanitize_for_json(v) for k, v in obj.items()}
     elif isinstance(obj, list):
         return [sanitize_for_json(v) for v in obj]
+    elif isinstance(obj, np.ndarray):
+        return sanitize_for_json(obj.tolist())
     elif hasattr(obj, 'item'): # Handle numpy scalars (np.float64, np.int64, etc.)
         val = obj.item()
         if isinstance(val, float) and (np.isnan(val) or np.isinf(val)):
@@ -22,3 +33,45 @@ def sanitize_for_json(obj):
     elif pd.isna(obj): # Handle pandas NaT/NaN
         return None
     return obj
+
+def _encode_default(obj):
+    """orjson hook for the few types it does not encode natively."""
+    if isinstance(obj, pd.DataFrame):
+        return obj.to_dict(orient="records")
+    if isinstance(obj, pd.Series):
+        return obj.tolist()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()  # object/datetime arrays orjson cannot encode itself
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    if hasattr(obj, 'item'):
+        return sanitize_for_json(obj)
+    if obj is pd.NA or obj is pd.NaT:
+        return None
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def dumps(obj) -> bytes:
+    """
+    Serializes a response payload to JSON bytes in a single encode pass.
+
+    NaN and Infinity become null and NumPy scalars and arrays are written
+    natively, exactly as `sanitize_for_json` would clean them. Payloads orjson
+    rejects (non-string dict keys, unknown types) take the general path, so
+    the output never depends on which path was used.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_encode_default, option=orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            pass
+    return json.dumps(
+        jsonable_encoder(sanitize_for_json(obj)),
+        ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+class FastJSONResponse(Response):
+    """JSON response encoded with `dumps`, bypassing FastAPI's own encoding walk."""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
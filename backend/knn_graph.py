@@ -0,0 +1,180 @@
+import os
+import json
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from neighbors import NeighborEngine, NEIGHBOR_ENGINE, NEIGHBOR_N_JOBS
+
+# Neighbors stored per training row; requests for up to this many (self excluded) reuse the graph
+KNN_GRAPH_NEIGHBORS = int(os.getenv("KNN_GRAPH_NEIGHBORS", "10"))
+# Folder of the persisted graph, inside the preprocessing artifacts
+KNN_GRAPH_DIRNAME = "knn_graph"
+# Stored with the graph; graphs of another version (layout or search space) are rebuilt
+KNN_GRAPH_VERSION = 2
+
+GRAPH_PARTS = ("indices", "distances", "keys", "key_rows")
+
+
+def row_keys(X) -> np.ndarray:
+    """
+    64-bit content hash of every row of a dense or sparse matrix.
+
+    Values are hashed as float64, so a stored uint8 / float32 matrix and the
+    float64 array a resampler converts it to give the same keys.
+    """
+    if sp.issparse(X):
+        X = sp.csr_matrix(X)
+        data = X.data.astype(np.float64)
+        # Explicit zeros must not change a row's key; the per-row sum is order independent
+        hashes = np.where(data != 0, pd.util.hash_array(data) ^ (pd.util.hash_array(X.indices.astype(np.int64)) * np.uint64(0x9E3779B97F4A7C15)), 0)
+        sums = np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(hashes, dtype=np.uint64)])
+        return sums[X.indptr[1:]] - sums[X.indptr[:-1]]
+    values = X.to_numpy(dtype=np.float64) if isinstance(X, pd.DataFrame) else np.asarray(X, dtype=np.float64)
+    return pd.util.hash_pandas_object(pd.DataFrame(values), index=False).to_numpy()
+
+
+class KNNGraph:
+    """
+    k-nearest-neighbor graph of a training set, shared by the imbalance
+    analysis and the neighbor-based resamplers.
+
+    Neighbors are searched in the space of the matrix it was built from,
+    unscaled: the one the resamplers (and models) are given, so reusing the
+    graph never changes which neighbors they find. `indices` / `distances`
+    hold the KNN_GRAPH_NEIGHBORS nearest rows of every row, nearest first,
+    without the row itself. Rows are recognized by their content hash
+    (`locate`), so a NeighborEngine fitted on the training set or on any
+    subset of its rows (e.g. one class) can answer from the graph.
+
+    The graph is read-only; copies (sklearn's `clone`) share its arrays.
+    """
+
+    def __init__(self, indices, distances, keys, key_rows):
+        self.indices = indices
+        self.distances = distances
+        # Row keys sorted, and the rows they belong to
+        self.keys = keys
+        self.key_rows = key_rows
+
+    @property
+    def n_rows(self) -> int:
+        return self.indices.shape[0]
+
+    @property
+    def n_neighbors(self) -> int:
+        return self.indices.shape[1]
+
+    @classmethod
+    def build(cls, X, n_neighbors: int = KNN_GRAPH_NEIGHBORS, engine: str = NEIGHBOR_ENGINE, n_jobs: int = NEIGHBOR_N_JOBS) -> "KNNGraph":
+        n_neighbors = min(n_neighbors, X.shape[0] - 1)
+        nn = NeighborEngine(n_neighbors=n_neighbors, engine=engine, n_jobs=n_jobs).fit(X)
+        # Training rows as queries: sklearn's convention leaves each row itself out
+        distances, indices = nn.kneighbors()
+
+        keys = row_keys(X)
+        key_rows = np.argsort(keys, kind="stable")
+        return cls(
+            indices.astype(np.int32 if X.shape[0] < 2 ** 31 else np.int64), distances.astype(np.float32),
+            keys[key_rows], key_rows
+        )
+
+    def locate(self, X) -> np.ndarray:
+        """
+        Graph row of every row of X (-1 for rows not in the training set).
+
+        Rows with identical content are matched in order of appearance, so
+        distinct rows of X map to distinct graph rows.
+        """
+        keys = row_keys(X)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        # n-th occurrence of a key in X -> n-th training row with that key
+        first = np.searchsorted(sorted_keys, sorted_keys, side="left")
+        occurrence = np.arange(len(keys)) - first
+        start = np.searchsorted(self.keys, sorted_keys, side="left")
+        end = np.searchsorted(self.keys, sorted_keys, side="right")
+        found = start + occurrence < end
+
+        rows = np.full(len(keys), -1, dtype=np.intp)
+        rows[order[found]] = self.key_rows[(start + occurrence)[found]]
+        return rows
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class KNNGraphStore:
+    """
+    The k-NN graph persisted next to a workflow's preprocessing artifacts.
+
+    Arrays are plain .npy files, memory-mapped on load; `meta.json`, written
+    last, records the preprocessing manifest key the graph was built for, so
+    a graph of earlier preprocessing output is never used.
+    """
+
+    def __init__(self, artifacts_dir: str):
+        self.graph_dir = os.path.join(artifacts_dir, KNN_GRAPH_DIRNAME)
+        self.meta_path = os.path.join(self.graph_dir, "meta.json")
+
+    def get(self, key: str, n_neighbors: int = 1) -> Optional[KNNGraph]:
+        """The stored graph if it was built for `key` and holds at least `n_neighbors` neighbors."""
+        try:
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+            if meta.get("version") != KNN_GRAPH_VERSION or meta["key"] != key or meta["n_neighbors"] < n_neighbors:
+                return None
+            arrays = {name: np.load(self._part(name), mmap_mode="r") for name in GRAPH_PARTS}
+            return KNNGraph(**arrays)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Ignoring unreadable k-NN graph {self.graph_dir}: {e}")
+            return None
+
+    def put(self, key: str, graph: KNNGraph):
+        os.makedirs(self.graph_dir, exist_ok=True)
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+        try:
+            for name in GRAPH_PARTS:
+                self._write_atomic(self._part(name), lambda f, a=getattr(graph, name): np.save(f, a))
+            meta = json.dumps({"version": KNN_GRAPH_VERSION, "key": key, "n_neighbors": graph.n_neighbors, "n_rows": graph.n_rows})
+            self._write_atomic(self.meta_path, lambda f: f.write(meta.encode()))
+        except Exception as e:
+            print(f"Could not write k-NN graph {self.graph_dir}: {e}")
+
+    def get_or_build(self, key: Optional[str], X, n_neighbors: int = KNN_GRAPH_NEIGHBORS) -> Optional[KNNGraph]:
+        """
+        The graph of training set X: the stored one when it fits, otherwise
+        built (and stored when `key` is known). None if X cannot be searched
+        (e.g. it still holds missing values).
+        """
+        graph = self.get(key, min(n_neighbors, X.shape[0] - 1)) if key else None
+        if graph is not None and graph.n_rows == X.shape[0]:
+            return graph
+        try:
+            graph = KNNGraph.build(X, n_neighbors)
+        except Exception as e:
+            print(f"Could not build k-NN graph: {e}")
+            return None
+        if key:
+            self.put(key, graph)
+        return graph
+
+    def _part(self, name: str) -> str:
+        return os.path.join(self.graph_dir, f"{name}.npy")
+
+    @staticmethod
+    def _write_atomic(path: str, write):
+        # Per-process temporary name: analysis and balancing may build the same graph at once
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
@@ -0,0 +1,77 @@
+import os
+import json
+import hashlib
+from typing import Dict, Any, Optional, Iterable
+
+from json_utils import dumps
+
+# Bump when a workflow step's artifacts or result format change so stale manifests are never served
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = "manifest.json"
+
+
+def step_key(*parts) -> str:
+    """
+    Hash of everything a workflow step's output depends on (input hashes,
+    target column, config). Dict keys are sorted, so configs that only
+    differ in key order hash the same.
+    """
+    canonical = json.dumps([MANIFEST_VERSION, *parts], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class StepManifest:
+    """
+    Records what a workflow step's artifact directory was computed from.
+
+    The manifest holds the step's key (see `step_key`), its result summary
+    and the artifact files it wrote. A step whose key matches and whose files
+    are all still there can return the recorded summary instead of running
+    again. Later steps fold this key into their own, so recomputing a step
+    invalidates everything downstream of it.
+    """
+
+    def __init__(self, step_dir: str):
+        self.step_dir = step_dir
+        self.path = os.path.join(step_dir, MANIFEST_FILENAME)
+
+    def key(self) -> Optional[str]:
+        """Key of the artifacts currently in the directory, or None if unknown."""
+        manifest = self._read()
+        return manifest["key"] if manifest else None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Recorded result if the artifacts were computed for `key` and still exist."""
+        manifest = self._read()
+        if not manifest or manifest["key"] != key:
+            return None
+        if not all(os.path.exists(path) for path in manifest["files"]):
+            return None
+        return manifest["result"]
+
+    def put(self, key: str, result: Dict[str, Any], files: Iterable[str]):
+        os.makedirs(self.step_dir, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(dumps({"key": key, "files": [path for path in files if path], "result": result}))
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Could not write manifest {self.path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def clear(self):
+        """Forgets the recorded run; called before a step starts rewriting its artifacts."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _read(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Ignoring unreadable manifest {self.path}: {e}")
+            return None
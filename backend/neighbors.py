@@ -0,0 +1,267 @@
+import os
+import numpy as np
+import scipy.sparse as sp
+from joblib import Parallel, delayed
+from sklearn.base import BaseEstimator
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.neighbors import NearestNeighbors
+
+# Neighbor search used by the resamplers: "exact" (brute force), "ball_tree",
+# "approximate" (clustered index) or "auto" (see NeighborEngine)
+NEIGHBOR_ENGINE = os.getenv("NEIGHBOR_ENGINE", "auto")
+# Parallel neighbor queries (-1 = all cores)
+NEIGHBOR_N_JOBS = int(os.getenv("NEIGHBOR_N_JOBS", "1"))
+# "auto" switches to the approximate engine at this many rows
+NEIGHBOR_APPROX_ROWS = int(os.getenv("NEIGHBOR_APPROX_ROWS", "200000"))
+# Clusters of the approximate index (0 = about sqrt(rows)) and how many of them each query searches
+NEIGHBOR_APPROX_CLUSTERS = int(os.getenv("NEIGHBOR_APPROX_CLUSTERS", "0"))
+NEIGHBOR_APPROX_PROBES = int(os.getenv("NEIGHBOR_APPROX_PROBES", "16"))
+# Rows the cluster centers are learned from
+NEIGHBOR_APPROX_TRAIN_ROWS = int(os.getenv("NEIGHBOR_APPROX_TRAIN_ROWS", "100000"))
+# Query rows compared to their candidates at once (bounds the distance blocks held in memory)
+NEIGHBOR_BATCH_ROWS = int(os.getenv("NEIGHBOR_BATCH_ROWS", "2048"))
+
+ENGINES = ("auto", "exact", "ball_tree", "approximate")
+
+
+class NeighborEngine(BaseEstimator):
+    """
+    k-nearest-neighbor search with a selectable engine, for the resamplers.
+
+    imbalanced-learn samplers accept any estimator with `kneighbors` in
+    place of their `k_neighbors` / `n_neighbors` integer, so SMOTE, ADASYN
+    and ENN (and the samplers inside the hybrids) search through this class.
+    Engines:
+
+    - "exact": brute force on BLAS distance blocks, the reference result.
+    - "ball_tree": exact, tree-indexed; fast for low-dimensional data.
+    - "approximate": an inverted-file index. Rows are grouped around
+      k-means centers (about sqrt(rows) of them); the queries closest to a
+      center are compared, as one BLAS block, only to the rows of the
+      NEIGHBOR_APPROX_PROBES centers nearest to it. Returned neighbors are
+      real rows with exact distances, but some of the true nearest ones
+      may be missed.
+    - "auto": sklearn's own choice below NEIGHBOR_APPROX_ROWS rows,
+      "approximate" from there on.
+
+    Queries run on `n_jobs` threads. Accepts dense or CSR input.
+
+    With a `graph` (knn_graph.KNNGraph of the training set) and every fitted
+    row a training row, queries are answered from the stored neighbor lists;
+    only rows whose lists hold too few fitted rows (e.g. a minority row
+    among majority neighbors) are searched. Results match a search without
+    the graph (up to the order of equidistant neighbors).
+    """
+
+    def __init__(self, n_neighbors: int = 5, engine: str = NEIGHBOR_ENGINE, n_jobs: int = NEIGHBOR_N_JOBS, random_state: int = 42, graph=None):
+        self.n_neighbors = n_neighbors
+        self.engine = engine
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        self.graph = graph
+
+    def fit(self, X, y=None):
+        if self.engine not in ENGINES:
+            raise ValueError(f"Unknown neighbor engine: {self.engine} (expected one of {', '.join(ENGINES)})")
+        X = self._as_matrix(X)
+        self.n_samples_fit_ = X.shape[0]
+        self.index_fitted_ = False
+
+        self.graph_rows_ = None
+        if self.graph is not None:
+            rows = self.graph.locate(X)
+            # Rows the graph does not know (e.g. synthetic samples) may be anyone's neighbors: search
+            if (rows >= 0).all():
+                self.graph_rows_ = rows
+                self.graph_positions_ = np.full(self.graph.n_rows, -1, dtype=np.intp)
+                self.graph_positions_[rows] = np.arange(len(rows))
+
+        self.fit_X_ = X
+        if self.graph_rows_ is None:
+            self._fit_index()
+        return self
+
+    def _fit_index(self):
+        X = self.fit_X_
+        self.index_fitted_ = True
+        self.engine_ = self.engine
+        if self.engine_ == "auto" and X.shape[0] >= NEIGHBOR_APPROX_ROWS:
+            self.engine_ = "approximate"
+
+        if self.engine_ != "approximate":
+            algorithm = {"exact": "brute", "ball_tree": "ball_tree"}.get(self.engine_, "auto")
+            self.index_ = NearestNeighbors(n_neighbors=self.n_neighbors, algorithm=algorithm, n_jobs=self.n_jobs).fit(X)
+            return
+
+        # 1. Cluster centers, learned on a bounded sample
+        n_clusters = NEIGHBOR_APPROX_CLUSTERS or int(np.sqrt(X.shape[0]))
+        n_clusters = int(np.clip(n_clusters, 1, X.shape[0]))
+        rng = np.random.default_rng(self.random_state)
+        train = np.sort(rng.choice(X.shape[0], min(X.shape[0], NEIGHBOR_APPROX_TRAIN_ROWS), replace=False))
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, n_init=1, batch_size=4096, random_state=self.random_state)
+        self.centers_ = kmeans.fit(X[train]).cluster_centers_
+
+        # 2. Rows grouped by their nearest center (inverted lists)
+        self.sq_norms_ = self._sq_norms(X)
+        labels = self._nearest_center(X)
+        self.order_ = np.argsort(labels, kind="stable")
+        self.bounds_ = np.searchsorted(labels[self.order_], np.arange(n_clusters + 1))
+
+        # 3. Lists searched for the queries of each center: its nearest centers (itself first)
+        center_sq = self._sq_norms(self.centers_)
+        center_dist = center_sq[:, None] + center_sq[None, :] - 2 * self.centers_ @ self.centers_.T
+        n_probes = min(NEIGHBOR_APPROX_PROBES, n_clusters)
+        self.probes_ = np.argsort(center_dist, axis=1)[:, :n_probes]
+
+    def kneighbors(self, X=None, n_neighbors=None, return_distance=True):
+        n_neighbors = n_neighbors or self.n_neighbors
+        if self.graph_rows_ is not None:
+            distances, indices = self._graph_kneighbors(X, n_neighbors)
+        else:
+            distances, indices = self._index_kneighbors(X, n_neighbors)
+        return (distances, indices) if return_distance else indices
+
+    def _index_kneighbors(self, X, n_neighbors: int):
+        """Searches the fitted rows (X in the fitted space; None = the fitted rows, each without itself)."""
+        if not self.index_fitted_:
+            self._fit_index()
+        if self.engine_ != "approximate":
+            return self.index_.kneighbors(X, n_neighbors)
+
+        if X is None:
+            # Training points as queries, each without itself (sklearn's convention)
+            distances, indices = self._search(self.fit_X_, n_neighbors + 1)
+            return self._drop_self(distances, indices, np.arange(self.n_samples_fit_))
+        return self._search(self._as_matrix(X), n_neighbors)
+
+    def _graph_kneighbors(self, X, n_neighbors: int):
+        """kneighbors answered from the graph's lists where they hold enough fitted rows."""
+        if X is None:
+            rows = self.graph_rows_
+            own = np.full(len(rows), -1, dtype=np.intp)  # Each row without itself
+            n_neighbors = min(n_neighbors, self.n_samples_fit_ - 1)
+        else:
+            rows = self.graph.locate(X)
+            own = np.where(rows >= 0, self.graph_positions_[np.maximum(rows, 0)], -1)
+            n_neighbors = min(n_neighbors, self.n_samples_fit_)
+        has_own = own >= 0
+
+        distances = np.empty((len(rows), n_neighbors))
+        indices = np.empty((len(rows), n_neighbors), dtype=np.intp)
+        answered = np.zeros(len(rows), dtype=bool)
+
+        # The fitted rows among each row's graph neighbors, nearest first
+        known = np.flatnonzero(rows >= 0)
+        candidates = self.graph_positions_[np.asarray(self.graph.indices[rows[known]])]
+        candidate_distances = np.asarray(self.graph.distances[rows[known]], dtype=float)
+        order = np.argsort(candidates < 0, axis=1, kind="stable")
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        candidate_distances = np.take_along_axis(candidate_distances, order, axis=1)
+        n_found = (candidates >= 0).sum(axis=1)
+
+        for with_own in (True, False):
+            # A query that is a fitted row is its own nearest neighbor
+            offset = int(with_own)
+            n_graph = n_neighbors - offset
+            if n_graph > self.graph.n_neighbors:
+                continue
+            select = (has_own[known] == with_own) & (n_found >= n_graph)
+            targets = known[select]
+            if with_own:
+                indices[targets, 0] = own[targets]
+                distances[targets, 0] = 0
+            indices[targets, offset:] = candidates[select, :n_graph]
+            distances[targets, offset:] = candidate_distances[select, :n_graph]
+            answered[targets] = True
+
+        rest = np.flatnonzero(~answered)
+        if len(rest):
+            if X is None:
+                d, i = self._index_kneighbors(self.fit_X_[rest], n_neighbors + 1)
+                d, i = self._drop_self(d, i, rest)
+            else:
+                d, i = self._index_kneighbors(self._as_matrix(X)[rest], n_neighbors)
+            distances[rest] = d
+            indices[rest] = i
+        return distances, indices
+
+    def kneighbors_graph(self, X=None, n_neighbors=None, mode="connectivity"):
+        distances, indices = self.kneighbors(X, n_neighbors)
+        n_queries, k = indices.shape
+        data = distances.ravel() if mode == "distance" else np.ones(n_queries * k)
+        return sp.csr_matrix((data, indices.ravel(), np.arange(0, n_queries * k + 1, k)), shape=(n_queries, self.n_samples_fit_))
+
+    def _search(self, X, n_neighbors: int):
+        n_neighbors = min(n_neighbors, self.n_samples_fit_)
+        distances = np.empty((X.shape[0], n_neighbors))
+        indices = np.empty((X.shape[0], n_neighbors), dtype=np.intp)
+
+        labels = self._nearest_center(X)
+        query_order = np.argsort(labels, kind="stable")
+        query_bounds = np.searchsorted(labels[query_order], np.arange(len(self.centers_) + 1))
+
+        def search_center(c):
+            queries = query_order[query_bounds[c]:query_bounds[c + 1]]
+            if len(queries) == 0:
+                return
+            candidates = np.concatenate([self.order_[self.bounds_[p]:self.bounds_[p + 1]] for p in self.probes_[c]])
+            if len(candidates) < n_neighbors:
+                candidates = np.arange(self.n_samples_fit_)
+            candidate_X = self.fit_X_[candidates]
+            for start in range(0, len(queries), NEIGHBOR_BATCH_ROWS):
+                batch = queries[start:start + NEIGHBOR_BATCH_ROWS]
+                d, i = self._block_neighbors(X[batch], candidate_X, self.sq_norms_[candidates], n_neighbors)
+                distances[batch] = d
+                indices[batch] = candidates[i]
+
+        # Threads share the index; the distance blocks run in BLAS, outside the GIL
+        Parallel(n_jobs=self.n_jobs, prefer="threads")(delayed(search_center)(c) for c in range(len(self.centers_)))
+        return distances, indices
+
+    def _block_neighbors(self, queries, candidates, candidate_sq_norms: np.ndarray, n_neighbors: int):
+        """Exact k nearest of `candidates` for every row of `queries` (|q|^2 + |c|^2 - 2 q.c)."""
+        dots = queries @ candidates.T
+        dots = dots.toarray() if sp.issparse(dots) else dots
+        sq = self._sq_norms(queries)[:, None] + candidate_sq_norms[None, :] - 2 * dots
+        np.maximum(sq, 0, out=sq)
+
+        if n_neighbors < sq.shape[1]:
+            nearest = np.argpartition(sq, n_neighbors - 1, axis=1)[:, :n_neighbors]
+        else:
+            nearest = np.tile(np.arange(sq.shape[1]), (sq.shape[0], 1))
+        rows = np.arange(sq.shape[0])[:, None]
+        nearest = nearest[rows, np.argsort(sq[rows, nearest], axis=1, kind="stable")]
+        return np.sqrt(sq[rows, nearest]), nearest
+
+    def _nearest_center(self, X) -> np.ndarray:
+        labels = np.empty(X.shape[0], dtype=np.intp)
+        center_sq = self._sq_norms(self.centers_)
+        for start in range(0, X.shape[0], 16 * NEIGHBOR_BATCH_ROWS):
+            # |x|^2 is the same for every center, so it does not change the argmin
+            dots = np.asarray(X[start:start + 16 * NEIGHBOR_BATCH_ROWS] @ self.centers_.T)
+            labels[start:start + len(dots)] = np.argmin(center_sq[None, :] - 2 * dots, axis=1)
+        return labels
+
+    @staticmethod
+    def _as_matrix(X):
+        if sp.issparse(X):
+            return sp.csr_matrix(X)
+        X = np.asarray(X)
+        # float32 input stays float32 (half the memory of a float64 copy)
+        return X if X.dtype.kind == "f" else X.astype(float)
+
+    @staticmethod
+    def _sq_norms(X) -> np.ndarray:
+        if sp.issparse(X):
+            return np.asarray(X.multiply(X).sum(axis=1)).ravel()
+        return np.einsum("ij,ij->i", X, X)
+
+    @staticmethod
+    def _drop_self(distances: np.ndarray, indices: np.ndarray, rows: np.ndarray):
+        # Each query's own index (`rows`) is normally first; drop it (or the last neighbor if it was not found)
+        own = indices == rows[:, None]
+        missing = ~own.any(axis=1)
+        own[missing, -1] = True
+        keep = ~own
+        n = indices.shape[1] - 1
+        return distances[keep].reshape(-1, n), indices[keep].reshape(-1, n)
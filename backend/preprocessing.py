@@ -1,13 +1,17 @@
 import os
+import sys
 import json
 import joblib
 import pandas as pd
 import numpy as np
-from typing import Dict, Any, Optional, Tuple, List
+import scipy.sparse as sp
+from collections import Counter
+from typing import Dict, Any, Optional, Tuple, List, Callable, Iterable
+from sklearn.base import clone
 from sklearn.model_selection import train_test_split
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
-from sklearn.impute import SimpleImputer, KNNImputer
+from sklearn.impute import SimpleImputer
 from sklearn.preprocessing import (
     StandardScaler, MinMaxScaler, RobustScaler, 
     OneHotEncoder, OrdinalEncoder, LabelEncoder, 
@@ -16,13 +20,106 @@ from sklearn.preprocessing import (
 from sklearn.feature_selection import VarianceThreshold, SelectKBest, f_classif, f_regression
 from sklearn.decomposition import PCA
 
+from progress import ProgressReporter
+from wire import compact_matrix
+from artifacts import save_features, remove_features, storage_dtypes, storage_frame, sparse_storage_dtype, RowGroupWriter, SparseRowWriter
+from imputers import NeighborImputer
+from sketches import KLLSketch, FrequentItems, ReservoirSample
+from eda import KLL_K, HEAVY_HITTERS
+from schema import TARGET_COUNT_CAP, CLASSIFICATION_TYPES, series_target_type, target_type
+
 # Try importing TargetEncoder (sklearn >= 1.3)
 try:
     from sklearn.preprocessing import TargetEncoder
 except ImportError:
     TargetEncoder = None
 
+# Above this many rows, preprocessing streams the dataset instead of loading it whole
+PREPROCESS_STREAMING_ROWS = int(os.getenv("PREPROCESS_STREAMING_ROWS", "1000000"))
+# Rows read per batch in streaming mode (bounds peak memory)
+PREPROCESS_BATCH_ROWS = int(os.getenv("PREPROCESS_BATCH_ROWS", "100000"))
+# Training rows sampled in streaming mode to fit steps that need the data at once
+PREPROCESS_SAMPLE_ROWS = int(os.getenv("PREPROCESS_SAMPLE_ROWS", "100000"))
+# Rows sampled for the correlation summary of the transformed features
+PREPROCESS_CORR_ROWS = int(os.getenv("PREPROCESS_CORR_ROWS", "20000"))
+# Features in the correlation matrix (and feature importance list) of the summary
+PREPROCESS_CORR_FEATURES = int(os.getenv("PREPROCESS_CORR_FEATURES", "200"))
+# Workers fitting and applying the column pipelines in parallel (1 = serial, -1 = all cores);
+# a workflow's `nJobs` setting takes precedence
+PREPROCESS_N_JOBS = int(os.getenv("PREPROCESS_N_JOBS", "1"))
+# joblib backend for those workers: loky processes, or threads on Windows where
+# loky's resource tracker is unreliable
+PREPROCESS_BACKEND = os.getenv("PREPROCESS_BACKEND", "threading" if sys.platform == "win32" else "loky")
+
+
+class _ColumnStats:
+    """
+    Imputer and encoder statistics of one training column, accumulated batch by batch.
+
+    Means and category counts are exact; medians come from a KLL sketch and
+    the most frequent value of a numeric column from a Misra-Gries summary.
+    """
+
+    def __init__(self, strategy: str, categorical: bool):
+        self.strategy = strategy
+        self.categorical = categorical
+        self.count = 0
+        self.total = 0.0
+        self.has_missing = False
+        self.quantiles = KLLSketch(KLL_K, seed=0) if strategy == 'median' and not categorical else None
+        if categorical:
+            self.values = Counter()
+        elif strategy == 'most_frequent':
+            self.values = FrequentItems(HEAVY_HITTERS)
+        else:
+            self.values = None
+
+    def update(self, column: pd.Series):
+        valid = column.dropna()
+        self.has_missing = self.has_missing or len(valid) < len(column)
+        self.count += len(valid)
+        if self.categorical:
+            self.values.update(valid.value_counts().to_dict())
+        elif self.strategy == 'mean':
+            self.total += float(valid.sum())
+        elif self.strategy == 'median':
+            self.quantiles.update(valid.to_numpy(dtype=float))
+        elif self.strategy == 'most_frequent':
+            self.values.update(valid.value_counts())
+
+    def statistic(self):
+        """Full-data value for the column's SimpleImputer, or None to keep the sample-fitted one."""
+        if self.count == 0:
+            return None
+        if self.strategy == 'mean' and not self.categorical:
+            return self.total / self.count
+        if self.quantiles is not None:
+            return float(self.quantiles.quantiles([0.5])[0])
+        if self.strategy == 'most_frequent':
+            counts = self.values.counts if isinstance(self.values, FrequentItems) else self.values
+            top = max(counts.values())
+            # SimpleImputer breaks ties towards the smallest value
+            return min(value for value, count in counts.items() if count == top)
+        return None
+
+    def categories(self, fill_value=None) -> np.ndarray:
+        """Sorted categories seen in training (plus the constant fill value if it was used)."""
+        values = set(self.values)
+        if self.has_missing and fill_value is not None:
+            values.add(fill_value)
+        if all(isinstance(v, (int, float, np.number)) and not isinstance(v, bool) for v in values):
+            # Numeric inputs leave the imputer as floats
+            return np.array(sorted(values), dtype=float)
+        try:
+            return np.array(sorted(values), dtype=object)
+        except TypeError:
+            return np.array(sorted(values, key=str), dtype=object)
+
+
 class PreprocessingPipeline:
+    # Config entries the pipeline's output depends on (part of its manifest key)
+    CONFIG_KEYS = ('splitRatio', 'droppedFeatures', 'featureConfigs', 'selection')
+
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.split_ratio = float(config.get('splitRatio', 0.2))
@@ -30,14 +127,16 @@ class PreprocessingPipeline:
         self.dropped_features = set(config.get('droppedFeatures', []))
         self.feature_configs = config.get('featureConfigs', {})
         self.selection_config = config.get('selection', {})
+        self.n_jobs = int(config.get('nJobs') or PREPROCESS_N_JOBS)
         
         # Artifacts to be saved
         self.preprocessor = None
         self.selector = None
+        self.neighbor_imputer = None
         self.label_encoder = None
         self.target_mapping = {}
 
-    def run(self, df: pd.DataFrame, target_col: str, output_dir: str) -> Dict[str, Any]:
+    def run(self, df: pd.DataFrame, target_col: str, output_dir: str, progress: Optional[ProgressReporter] = None) -> Dict[str, Any]:
         """
         Main execution method for the preprocessing pipeline.
         
@@ -45,50 +144,62 @@ class PreprocessingPipeline:
             df: Input DataFrame.
             target_col: Name of the target column.
             output_dir: Directory to save artifacts.
+            progress: Optional reporter notified as each stage starts and ends.
             
         Returns:
             Dictionary containing execution summary and artifact paths.
         """
+        progress = progress or ProgressReporter(label="preprocess")
         os.makedirs(output_dir, exist_ok=True)
         
-        # 1. Clean and Split Data
-        X, y, dropped_rows = self._prepare_data(df, target_col)
-        
-        # 2. Train/Test Split
-        # Stratify if classification (heuristic: < 50 unique values in target)
-        is_classification = False
-        if y is not None:
-             if y.nunique() < 50 or y.dtype == 'object':
-                 is_classification = True
+        with progress.stage("split"):
+            # 1. Clean and Split Data
+            X, y, dropped_rows = self._prepare_data(df, target_col)
         
-        stratify = y if is_classification else None
+            # 2. Train/Test Split
+            # Stratify if classification (encoded text labels, or at most MAX_CLASSES values without decimals)
+            is_classification = False
+            if y is not None:
+                 if self.label_encoder or series_target_type(y) in CLASSIFICATION_TYPES:
+                     is_classification = True
         
-        X_train, X_test, y_train, y_test = train_test_split(
-            X, y, test_size=self.split_ratio, random_state=self.random_state, stratify=stratify
-        )
+            stratify = y if is_classification else None
         
-        # 3. Build and Fit Preprocessor
-        self.preprocessor = self._build_column_transformer(X_train)
-        
-        # Fit on Train, Transform both
-        # Pass y_train for TargetEncoder compatibility
-        X_train_transformed = self.preprocessor.fit_transform(X_train, y_train)
-        X_test_transformed = self.preprocessor.transform(X_test)
+            X_train, X_test, y_train, y_test = train_test_split(
+                X, y, test_size=self.split_ratio, random_state=self.random_state, stratify=stratify
+            )
+
+        with progress.stage("transform"):
+            # 3. Build and Fit Preprocessor
+            plan = self._feature_plan(X_train)
+            self.preprocessor = self._build_column_transformer(X_train, plan)
         
+            # Fit on Train, Transform both
+            # Pass y_train for TargetEncoder compatibility
+            with self._parallel():
+                self.neighbor_imputer = self._build_neighbor_imputer(plan)
+                if self.neighbor_imputer:
+                    X_train = self.neighbor_imputer.fit_transform(X_train)
+                    X_test = self.neighbor_imputer.transform(X_test)
+                X_train_transformed = self.preprocessor.fit_transform(X_train, y_train)
+                X_test_transformed = self.preprocessor.transform(X_test)
+
         # 4. Feature Selection (Optional)
         if self.selection_config.get('method') != 'None':
             self.selector = self._build_selector(self.selection_config, is_classification)
             if self.selector:
-                 X_train_transformed = self.selector.fit_transform(X_train_transformed, y_train)
-                 X_test_transformed = self.selector.transform(X_test_transformed)
-
-        # 5. Save Artifacts
-        artifact_paths = self._save_results(
-            output_dir, 
-            X_train_transformed, X_test_transformed, 
-            y_train, y_test
-        )
-        
+                with progress.stage("selection"):
+                    X_train_transformed = self.selector.fit_transform(self._selector_input(X_train_transformed), y_train)
+                    X_test_transformed = self.selector.transform(self._selector_input(X_test_transformed))
+
+        with progress.stage("save"):
+            # 5. Save Artifacts
+            artifact_paths = self._save_results(
+                output_dir, 
+                X_train_transformed, X_test_transformed, 
+                y_train, y_test
+            )
+
         # 6. Generate Preview
         # Convert sparse matrix to dense for preview if necessary
         preview_data = X_train_transformed[:10]
@@ -96,109 +207,19 @@ class PreprocessingPipeline:
             preview_data = preview_data.toarray()
             
         # Attempt to recover feature names
-        feature_names = self._get_feature_names()
-        
-        # Fix: Check if list/array is empty or length mismatch safely for numpy arrays
-        is_empty = feature_names is None or len(feature_names) == 0
-        if is_empty or len(feature_names) != X_train_transformed.shape[1]:
-             feature_names = [f"Feature_{i}" for i in range(X_train_transformed.shape[1])]
-        # Convert to list if it is an array
-        elif hasattr(feature_names, 'tolist'):
-             feature_names = feature_names.tolist()
-        
-        # Create preview dictionaries
-        preview_list = []
-        if isinstance(preview_data, np.ndarray):
-            for row in preview_data:
-                # Zip with feature names if available, else generic indices
-                if len(feature_names) == len(row):
-                     preview_list.append(dict(zip(feature_names, row)))
-                else:
-                     preview_list.append(dict(zip([f"Feat_{i}" for i in range(len(row))], row)))
+        feature_names = self._output_feature_names(X_train_transformed.shape[1], "Feature_")
+        preview_list = self._preview_records(preview_data, feature_names)
 
         # Calculate Distributions
-        def get_dist(series):
-             if series is None: return {}
-             # If categorical/object/int with few values
-             try:
-                 vc = series.value_counts().to_dict()
-                 # Map if encoded
-                 if self.target_mapping:
-                     # Key in vc is integer (encoded), map to original string
-                     # Ensure keys are matched correctly (int vs int)
-                     return {self.target_mapping.get(int(k), str(k)): int(v) for k, v in vc.items()}
-                 return {str(k): int(v) for k, v in vc.items()}
-             except:
-                 return {}
-
-        train_dist = get_dist(y_train)
-        test_dist = get_dist(y_test)
+        train_dist = self._distribution(y_train)
+        test_dist = self._distribution(y_test)
         
-        # Calculate Correlations (on Transformed Data)
-        correlation_data = {}
-        feature_importance = []
-        try:
-            # Densify if sparse (limit size to avoid OOM)
-            # Limit to 500 features for correlation calculation
-            max_features = 200
-            features_to_corr = feature_names[:max_features]
-            
-            data_for_corr = X_train_transformed[:, :max_features]
-            if hasattr(data_for_corr, "toarray"):
-                data_for_corr = data_for_corr.toarray()
-                
-            df_corr = pd.DataFrame(data_for_corr, columns=features_to_corr)
-            
-            # Add target if numeric (or encoded)
-            target_series = y_train
-            # If target is Series with name
-            t_name = 'target'
-            if hasattr(y_train, 'name') and y_train.name:
-                t_name = str(y_train.name)
-            
-            # Ensure target is accessible/numeric
-            if is_classification and self.label_encoder:
-                 df_corr[t_name] = y_train.values
-            elif pd.api.types.is_numeric_dtype(y_train):
-                 df_corr[t_name] = y_train.values
-
-            # Compute Correlation Matrix
-            corr_mat = df_corr.corr(method='pearson')
-            
-            # Format for frontend: columns list, and matrix array of {x, y, v}
-            # Only send non-zero or significant correlations to save space? 
-            # Frontend expects dense matrix style usually, or sparse tuples.
-            # EdaDashboard expects: { columns: string[], matrix: {x,y,v}[] }
-            
-            corr_columns = corr_mat.columns.tolist()
-            corr_values = []
-            
-            # Iterate to build matrix list
-            # To optimize, we can rely on symmetry, but frontend might expect full.
-            for c1 in corr_columns:
-                for c2 in corr_columns:
-                    val = corr_mat.loc[c1, c2]
-                    if not pd.isna(val):
-                        corr_values.append({"x": c1, "y": c2, "v": float(val)})
-            
-            correlation_data = {
-                "columns": corr_columns,
-                "matrix": corr_values
-            }
-            
-            # Extract Feature Importance (Correlation with Target)
-            if t_name in corr_mat.columns:
-                 target_corrs = corr_mat[t_name].drop(index=[t_name])
-                 # Sort by absolute value
-                 sorted_corrs = target_corrs.abs().sort_values(ascending=False)
-                 feature_importance = [
-                     {"feature": idx, "importance": float(val)} 
-                     for idx, val in sorted_corrs.items()
-                 ]
+        with progress.stage("correlation"):
+            # Calculate Correlations (on Transformed Data)
+            correlation_data, feature_importance = self._correlation_summary(
+                X_train_transformed, y_train, feature_names, is_classification
+            )
 
-        except Exception as e:
-            print(f"Warning: Correlation calculation failed: {e}")
-            
         return {
             "status": "Completed",
             "trainCount": int(X_train_transformed.shape[0]),
@@ -217,6 +238,275 @@ class PreprocessingPipeline:
             "artifacts": artifact_paths
         }
 
+    def run_streaming(self, batches: Callable[[], Iterable[pd.DataFrame]], target_col: str, output_dir: str, progress: Optional[ProgressReporter] = None) -> Dict[str, Any]:
+        """
+        Out-of-core variant of `run` for datasets larger than memory.
+
+        Args:
+            batches: Returns a fresh iterator over the dataset's row batches on every call.
+            target_col: Name of the target column.
+            output_dir: Directory to save artifacts.
+            progress: Optional reporter notified as each stage starts and ends.
+
+        The dataset is read in up to three passes and never held whole:
+        1. scan: imputer statistics, encoder categories and target classes of
+           the training rows, plus a bounded uniform sample of them.
+        2. fit: the ColumnTransformer is fitted on the sample with the scanned
+           categories, its imputer statistics are replaced by the full-data
+           ones, and Standard/MinMax scalers are refitted with `partial_fit`
+           over the whole training split.
+        3. transform: every batch is transformed and appended to the Parquet
+           outputs as one row group.
+
+        Steps that need all rows at once (KNN imputation, power transforms,
+        robust scaling, target encoding, feature selection) and the
+        correlation summary use the sample. Rows are split by a seeded
+        per-row draw, so the split is stratified only in expectation.
+
+        Returns:
+            Same summary as `run`, plus a `streaming` block.
+        """
+        progress = progress or ProgressReporter(label="preprocess")
+        os.makedirs(output_dir, exist_ok=True)
+
+        with progress.stage("scan"):
+            # 1. Feature plan from the first batch (Parquet batches share one schema)
+            first = next(iter(batches()), None)
+            if first is None:
+                raise ValueError("Dataset is empty.")
+            if target_col not in first.columns:
+                raise ValueError(f"Target column '{target_col}' not found in dataset.")
+            plan = self._feature_plan(self._features(first.drop(columns=[target_col])))
+            stats = {
+                col: _ColumnStats(cfg.get('strategy', 'mean' if ftype == 'numeric' else 'most_frequent'), ftype == 'categorical')
+                for col, ftype, cfg in plan
+            }
+            target_dtype = first[target_col].dtype
+
+            # 2. Statistics of the training rows, a sample of them, and the target classes
+            sample = ReservoirSample(PREPROCESS_SAMPLE_ROWS, seed=self.random_state)
+            classes = Counter()
+            dropped_rows = 0
+            for X_train, y_train, _, y_test, dropped in self._split_batches(batches, target_col):
+                dropped_rows += dropped
+                for col, column_stats in stats.items():
+                    column_stats.update(X_train[col])
+                sample.update(X_train.assign(**{target_col: y_train}))
+                if classes is not None:
+                    classes.update(y_train.value_counts().to_dict())
+                    classes.update(y_test.value_counts().to_dict())
+                    if len(classes) > TARGET_COUNT_CAP:
+                        classes = None  # Continuous target; stop tracking
+
+            if sample.frame is None or len(sample.frame) == 0:
+                raise ValueError("No training rows left after dropping rows with a missing target.")
+
+            # 3. Encode Target if categorical (same rule as _prepare_data)
+            n_classes = len(classes) if classes is not None else None
+            if not pd.api.types.is_numeric_dtype(target_dtype):
+                if classes is None:
+                    raise ValueError(f"Target has over {TARGET_COUNT_CAP} unique classes.")
+                self.label_encoder = LabelEncoder().fit(np.array(list(classes), dtype=object))
+                self.target_mapping = {int(i): str(l) for i, l in enumerate(self.label_encoder.classes_)}
+            fractional = classes is not None and any(isinstance(c, float) and not float(c).is_integer() for c in classes)
+            is_classification = bool(self.label_encoder) or target_type(n_classes, fractional) in CLASSIFICATION_TYPES
+
+        with progress.stage("fit"):
+            X_sample = sample.frame.drop(columns=[target_col])
+            y_sample = sample.frame[target_col]
+            if self.label_encoder:
+                y_sample = pd.Series(self.label_encoder.transform(y_sample), name=target_col)
+
+            # Encoders learn the categories of the full training split, not just the sample's
+            self.preprocessor = self._build_column_transformer(X_sample, plan)
+            configs = {col: cfg for col, _, cfg in plan}
+            for _, pipe, cols in self.preprocessor.transformers:
+                encoder = pipe.named_steps.get('encoder')
+                if isinstance(encoder, (OneHotEncoder, OrdinalEncoder)):
+                    cfg = configs[cols[0]]  # Identical for every column of a group
+                    fill_value = cfg.get('params', {}).get('fill_value', 'missing') if cfg.get('strategy') == 'constant' else None
+                    encoder.set_params(categories=[stats[col].categories(fill_value) for col in cols])
+
+            with self._parallel():
+                self.neighbor_imputer = self._build_neighbor_imputer(plan)
+                if self.neighbor_imputer:
+                    X_sample = self.neighbor_imputer.fit_transform(X_sample)
+                self.preprocessor.fit(X_sample, y_sample)
+
+            # Imputers use the full-data statistics
+            for name, _, cols in self.preprocessor.transformers:
+                imputer = self.preprocessor.named_transformers_[name].named_steps['imputer']
+                if not isinstance(imputer, SimpleImputer) or imputer.strategy == 'constant':
+                    continue
+                statistics = imputer.statistics_.copy()
+                for i, col in enumerate(cols):
+                    value = stats[col].statistic()
+                    if value is not None:
+                        statistics[i] = value
+                imputer.statistics_ = statistics
+
+            # Scalers with a streaming fit start over
+            scalers = []
+            for _, pipe, cols in self.preprocessor.transformers_:
+                if isinstance(pipe, Pipeline) and isinstance(pipe.steps[-1][1], (StandardScaler, MinMaxScaler)):
+                    pipe.steps[-1] = (pipe.steps[-1][0], clone(pipe.steps[-1][1]))
+                    scalers.append((pipe, cols))
+
+        passes = 2
+        if scalers:
+            passes += 1
+            with progress.stage("scaling"):
+                for X_train, _, _, _, _ in self._split_batches(batches, target_col):
+                    if len(X_train) == 0:
+                        continue
+                    X_train = self._impute_neighbors(X_train)
+                    for pipe, cols in scalers:
+                        pipe.steps[-1][1].partial_fit(pipe[:-1].transform(X_train[cols]))
+
+        # 4. Feature Selection (Optional), fitted on the sample
+        with self._parallel():
+            X_sample_transformed = self.preprocessor.transform(X_sample)
+        if self.selection_config.get('method') != 'None':
+            self.selector = self._build_selector(self.selection_config, is_classification)
+            if self.selector:
+                with progress.stage("selection"):
+                    X_sample_transformed = self.selector.fit_transform(self._selector_input(X_sample_transformed), y_sample)
+
+        with progress.stage("transform"):
+            # 5. Transform batch by batch: dense output is appended as one row group
+            # per batch, sparse output is kept as CSR (bounded by its non-zeros)
+            n_features = X_sample_transformed.shape[1]
+            column_names = self._output_feature_names(n_features, "feat_")
+            sparse_output = sp.issparse(X_sample_transformed)
+            # Storage dtypes are decided once, on the sample, so every row group shares them
+            binary = self._one_hot_mask(n_features)
+            dtypes = None if sparse_output else storage_dtypes(X_sample_transformed, binary)
+            writers = {name: RowGroupWriter(os.path.join(output_dir, f"{name}.parquet")) for name in ("X_train", "X_test", "y_train", "y_test")}
+            counts = {"train": Counter(), "test": Counter()}
+            preview_data = np.empty((0, n_features))
+            for name in ("X_train", "X_test"):
+                remove_features(os.path.join(output_dir, name))
+                if sparse_output:
+                    # Sparse batches are appended to CSR parts on disk, never concatenated in memory
+                    sparse_dtype = sparse_storage_dtype(sp.csr_matrix(X_sample_transformed), binary)
+                    writers[name] = SparseRowWriter(os.path.join(output_dir, name), column_names, sparse_dtype)
+
+            for X_train, y_train, X_test, y_test, _ in self._split_batches(batches, target_col):
+                for split, X_part, y_part in (("train", X_train, y_train), ("test", X_test, y_test)):
+                    if len(X_part) == 0:
+                        continue
+                    X_part_transformed = self._transform(X_part)
+                    if sparse_output:
+                        writers[f"X_{split}"].write(X_part_transformed)
+                    else:
+                        writers[f"X_{split}"].write(storage_frame(X_part_transformed, column_names, dtypes))
+                    writers[f"y_{split}"].write(pd.DataFrame({'target': y_part.to_numpy()}))
+                    counts[split].update(y_part.value_counts().to_dict())
+                    if split == "train" and len(preview_data) < 10:
+                        head = X_part_transformed[:10 - len(preview_data)]
+                        preview_data = np.vstack([preview_data, head.toarray() if sp.issparse(head) else head])
+
+            artifact_paths = {}
+            for name, writer in writers.items():
+                if name.startswith("X_") and sparse_output:
+                    artifact_paths[name] = writer.close()
+                    continue
+                empty = storage_frame(np.empty((0, n_features)), column_names, dtypes) if name.startswith("X_") else pd.DataFrame({'target': y_sample.iloc[:0]})
+                writer.close(empty)
+                artifact_paths[name] = writer.path
+
+        with progress.stage("save"):
+            pipeline_path, encoder_path = self._save_pipelines(output_dir)
+
+        # 6. Generate Preview
+        feature_names = self._output_feature_names(n_features, "Feature_")
+        preview_list = self._preview_records(preview_data, feature_names)
+
+        with progress.stage("correlation"):
+            # Calculate Correlations (on the transformed sample)
+            correlation_data, feature_importance = self._correlation_summary(
+                X_sample_transformed, y_sample, feature_names, is_classification
+            )
+
+        train_count, test_count = sum(counts["train"].values()), sum(counts["test"].values())
+        return {
+            "status": "Completed",
+            "trainCount": train_count,
+            "testCount": test_count,
+            "featureCount": n_features,
+            "features": feature_names,
+            "targetMapping": self.target_mapping,
+            "trainDistribution": self._distribution(dict(counts["train"].most_common())),
+            "testDistribution": self._distribution(dict(counts["test"].most_common())),
+            "droppedRows": dropped_rows,
+            "processedData": preview_list,
+            "processedShape": [train_count, n_features],
+            "processedCorrelation": correlation_data,
+            "featureImportance": feature_importance,
+            "artifactsPath": output_dir,
+            "artifacts": {**artifact_paths, "pipeline": pipeline_path, "label_encoder": encoder_path},
+            "streaming": {
+                "passes": passes,
+                "sampleRows": len(X_sample),
+                "sampled": ["selection", "processedCorrelation", "featureImportance"]
+            }
+        }
+
+    def _features(self, X: pd.DataFrame) -> pd.DataFrame:
+        """Drops ignored features."""
+        if self.dropped_features:
+            X = X.drop(columns=[col for col in self.dropped_features if col in X.columns], errors='ignore')
+        return X
+
+    def _split_batches(self, batches: Callable[[], Iterable[pd.DataFrame]], target_col: str):
+        """
+        Yields (X_train, y_train, X_test, y_test, dropped_rows) for every batch.
+
+        Each row goes to the test split with probability `split_ratio`, drawn
+        from a generator seeded by the batch position, so every pass over the
+        same batches reproduces the same split.
+        """
+        for i, batch in enumerate(batches()):
+            initial_count = len(batch)
+            batch = batch.dropna(subset=[target_col])
+            y = batch[target_col]
+            X = self._features(batch.drop(columns=[target_col]))
+            if self.label_encoder:
+                y = pd.Series(self.label_encoder.transform(y), index=y.index, name=target_col)
+
+            is_test = np.random.default_rng([self.random_state, i]).random(len(batch)) < self.split_ratio
+            yield X[~is_test], y[~is_test], X[is_test], y[is_test], initial_count - len(batch)
+
+    def _transform(self, X: pd.DataFrame):
+        """Preprocessor (and selector) output for a batch; CSR when the preprocessor output is sparse."""
+        with self._parallel():
+            X_transformed = self.preprocessor.transform(self._impute_neighbors(X))
+        if self.selector:
+            X_transformed = self.selector.transform(self._selector_input(X_transformed))
+        return X_transformed
+
+    def _impute_neighbors(self, X: pd.DataFrame) -> pd.DataFrame:
+        """Fills the KNN-imputed columns, if any, ahead of the column pipelines."""
+        if self.neighbor_imputer:
+            with self._parallel():
+                return self.neighbor_imputer.transform(X)
+        return X
+
+    def _parallel(self):
+        """
+        joblib context the column pipelines run in.
+
+        The ColumnTransformer itself keeps n_jobs=None, which defers to this
+        context, so the saved pipeline still runs serially wherever it is loaded.
+        """
+        return joblib.parallel_config(backend=PREPROCESS_BACKEND, n_jobs=self.n_jobs)
+
+    def _selector_input(self, X):
+        # PCA cannot fit sparse input with a variance-ratio target; the other selectors keep it sparse
+        if isinstance(self.selector, PCA) and sp.issparse(X):
+            return X.toarray()
+        return X
+
     def _prepare_data(self, df: pd.DataFrame, target_col: str) -> Tuple[pd.DataFrame, pd.Series, int]:
         """Separates target, drops ignored features, cleans target."""
         # Drop rows with missing target
@@ -233,25 +523,20 @@ class PreprocessingPipeline:
         X = df.drop(columns=[target_col])
         
         # Drop ignored features
-        if self.dropped_features:
-            X = X.drop(columns=[col for col in self.dropped_features if col in X.columns], errors='ignore')
-            
-        # Encode Target if categorical
-        if y.dtype == 'object' or y.dtype.name == 'category' or y.nunique() < 50:
-            # Check if it's already numeric though
-            if not pd.api.types.is_numeric_dtype(y):
-                self.label_encoder = LabelEncoder()
-                y = pd.Series(self.label_encoder.fit_transform(y), index=y.index, name=target_col)
-                self.target_mapping = {int(i): str(l) for i, l in enumerate(self.label_encoder.classes_)}
+        X = self._features(X)
             
+        # Encode Target if categorical (numeric targets are used as they are)
+        if not pd.api.types.is_numeric_dtype(y):
+            self.label_encoder = LabelEncoder()
+            y = pd.Series(self.label_encoder.fit_transform(y), index=y.index, name=target_col)
+            self.target_mapping = {int(i): str(l) for i, l in enumerate(self.label_encoder.classes_)}
+
         return X, y, dropped_rows
 
-    def _build_column_transformer(self, X: pd.DataFrame) -> ColumnTransformer:
-        """Constructs the ColumnTransformer based on featureConfigs."""
+    def _build_column_transformer(self, X: pd.DataFrame, plan: Optional[List[Tuple[str, str, Dict[str, Any]]]] = None) -> ColumnTransformer:
+        """Constructs the ColumnTransformer based on featureConfigs (or a precomputed feature plan)."""
         transformers = []
         
-        # Default Strategies
-        numeric_cols = X.select_dtypes(include=['number']).columns
         # categorical_cols = X.select_dtypes(include=['object', 'category']).columns
 
         # Helper to create pipeline for a single feature or group
@@ -260,9 +545,12 @@ class PreprocessingPipeline:
             
             # 1. Imputation
             strategy = config.get('strategy', 'mean' if dtype == 'numeric' else 'most_frequent')
-            if strategy == 'knn':
-                k = int(config.get('params', {}).get('n_neighbors', 5))
-                steps.append(('imputer', KNNImputer(n_neighbors=k)))
+            if strategy == 'knn' and dtype == 'numeric':
+                # Already filled by the joint NeighborImputer stage (see _build_neighbor_imputer)
+                steps.append(('imputer', 'passthrough'))
+            elif strategy == 'knn':
+                # Distances need numbers; categorical columns take their most frequent value
+                steps.append(('imputer', SimpleImputer(strategy='most_frequent')))
             elif strategy == 'constant':
                 fill_value = config.get('params', {}).get('fill_value', 0 if dtype == 'numeric' else 'missing')
                 # Ensure correct type for constant
@@ -301,7 +589,7 @@ class PreprocessingPipeline:
             if dtype == 'categorical':
                 encoding = config.get('params', {}).get('encoding', 'OneHot')
                 if encoding == 'OneHot':
-                    steps.append(('encoder', OneHotEncoder(handle_unknown='ignore', sparse_output=False)))
+                    steps.append(('encoder', OneHotEncoder(handle_unknown='ignore', sparse_output=True)))
                 elif encoding == 'Ordinal':
                     steps.append(('encoder', OrdinalEncoder(handle_unknown='use_encoded_value', unknown_value=-1)))
                 elif encoding == 'Target':
@@ -313,7 +601,22 @@ class PreprocessingPipeline:
 
             return Pipeline(steps)
 
-        # Build Transformers List
+        # Build Transformers List: columns with identical settings share one pipeline
+        for i, (ftype, cfg, cols) in enumerate(self._column_groups(X, plan or self._feature_plan(X))):
+            pipe = create_feature_pipeline(cfg, dtype=ftype)
+            name = f"{cols[0]}_pipe" if len(cols) == 1 else f"group{i}_{ftype}_pipe"
+            transformers.append((name, pipe, cols))
+
+        # Create ColumnTransformer
+        # One-hot blocks are sparse; the stacked output stays sparse (CSR) while its
+        # density is below the default sparse_threshold (0.3) and is saved as such.
+        # n_jobs=None defers to the joblib context set by _parallel (serial outside it)
+        return ColumnTransformer(transformers=transformers, n_jobs=None, verbose_feature_names_out=False)
+
+    def _feature_plan(self, X: pd.DataFrame) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """(column, type, config) of every feature, from featureConfigs or inferred from the dtype."""
+        numeric_cols = X.select_dtypes(include=['number']).columns
+        plan = []
         for col in X.columns:
             # Get specific config or default
             if col in self.feature_configs:
@@ -327,15 +630,67 @@ class PreprocessingPipeline:
                  else:
                      ftype = 'categorical'
                      cfg = {'strategy': 'most_frequent', 'params': {'encoding': 'OneHot'}}
-            
-            pipe = create_feature_pipeline(cfg, dtype=ftype)
-            transformers.append((f"{col}_pipe", pipe, [col]))
+            plan.append((col, ftype, cfg))
+        return plan
 
-        # Create ColumnTransformer
-        # sparse_threshold=0 to force dense output if possible (easier for pandas/preview)
-        # but for very large OneHot, sparse might be better. We'll use default (0.3).
-        # n_jobs=None to avoid joblib resource tracker issues on Windows
-        return ColumnTransformer(transformers=transformers, n_jobs=None, verbose_feature_names_out=False)
+    def _column_groups(self, X: pd.DataFrame, plan: List[Tuple[str, str, Dict[str, Any]]]) -> List[Tuple[str, Dict[str, Any], List[str]]]:
+        """
+        Merges features whose pipelines would be identical into (type, config, columns) groups.
+
+        Every step the configs can produce (imputers, transforms,
+        scalers, encoders) works column by column, so one pipeline over a
+        group gives the same values and names as one pipeline per column.
+        KNN imputation happens before, jointly for all KNN columns, see
+        _build_neighbor_imputer. Columns are also split by dtype kind,
+        since mixing kinds changes the imputer's output type (and with it
+        the one-hot category names). Groups keep the order of first appearance.
+
+        With several workers, groups with a costly fit (power transforms,
+        target encoding) are split into one chunk per worker so they fit
+        concurrently too.
+        """
+        groups = {}
+        for col, ftype, cfg in plan:
+            params = cfg.get('params', {}) or {}
+            strategy = cfg.get('strategy', 'mean' if ftype == 'numeric' else 'most_frequent')
+            fill_value = params.get('fill_value') if strategy == 'constant' else None
+            if ftype == 'numeric':
+                settings = (cfg.get('transform', 'none'), cfg.get('scaling', 'Standard'))
+            else:
+                settings = (params.get('encoding', 'OneHot'),)
+            key = (ftype, X[col].dtype.kind, strategy, repr(fill_value)) + settings
+
+            if key in groups:
+                groups[key][2].append(col)
+            else:
+                groups[key] = (ftype, cfg, [col])
+
+        workers = joblib.effective_n_jobs(self.n_jobs)
+        split_groups = []
+        for ftype, cfg, cols in groups.values():
+            costly = cfg.get('transform') in ('yeo-johnson', 'box-cox') if ftype == 'numeric' else \
+                (cfg.get('params', {}) or {}).get('encoding') == 'Target'
+            if costly and workers > 1 and len(cols) > 1:
+                bounds = np.linspace(0, len(cols), min(workers, len(cols)) + 1).astype(int)
+                split_groups.extend((ftype, cfg, cols[a:b]) for a, b in zip(bounds[:-1], bounds[1:]))
+            else:
+                split_groups.append((ftype, cfg, cols))
+        return split_groups
+
+    def _build_neighbor_imputer(self, plan: List[Tuple[str, str, Dict[str, Any]]]) -> Optional[NeighborImputer]:
+        """
+        One NeighborImputer over all numeric features configured for KNN imputation,
+        so their neighbors are found from all of them together. Runs ahead of the
+        ColumnTransformer; uses the largest `n_neighbors` configured among them.
+        """
+        knn = [
+            (col, cfg) for col, ftype, cfg in plan
+            if ftype == 'numeric' and cfg.get('strategy') == 'knn'
+        ]
+        if not knn:
+            return None
+        k = max(int((cfg.get('params', {}) or {}).get('n_neighbors', 5)) for _, cfg in knn)
+        return NeighborImputer(columns=[col for col, _ in knn], n_neighbors=k, random_state=self.random_state)
 
     def _build_selector(self, config: Dict, is_classification: bool):
         method = config.get('method')
@@ -384,25 +739,152 @@ class PreprocessingPipeline:
             print(f"Warning: Could not retrieve feature names: {e}")
             return []
 
-    def _save_results(self, output_dir: str, X_train, X_test, y_train, y_test) -> Dict[str, str]:
-        """Saves transform data to parquet and pipelines to joblib."""
-        
-        # 1. Save Data (Parquet)
-        # Convert to DataFrame for Parquet
-        # Check if sparse
-        if hasattr(X_train, "toarray"):
-            X_train = X_train.toarray()
-            X_test = X_test.toarray()
-        
+    def _one_hot_mask(self, n_features: int) -> np.ndarray:
+        """Output columns produced by one-hot encoders (always 0/1), after feature selection."""
+        mask = np.zeros(max([s.stop for s in self.preprocessor.output_indices_.values()] + [0]), dtype=bool)
+        for name, pipe, _ in self.preprocessor.transformers_:
+            if isinstance(pipe, Pipeline) and isinstance(pipe.steps[-1][1], OneHotEncoder):
+                mask[self.preprocessor.output_indices_[name]] = True
+
+        if self.selector:
+            # Selectors keep a subset of the columns; PCA mixes them all
+            mask = mask[self.selector.get_support()] if hasattr(self.selector, 'get_support') else np.zeros(n_features, dtype=bool)
+        if len(mask) != n_features:
+            return np.zeros(n_features, dtype=bool)
+        return mask
+
+    def _output_feature_names(self, n_features: int, fallback_prefix: str) -> List[str]:
+        """Feature names of the transformed output, or generic names if they cannot be recovered."""
         feature_names = self._get_feature_names()
+        
+        # Fix: Check if list/array is empty or length mismatch safely for numpy arrays
         is_empty = feature_names is None or len(feature_names) == 0
-        if is_empty or len(feature_names) != X_train.shape[1]:
-             feature_names = [f"feat_{i}" for i in range(X_train.shape[1])]
+        if is_empty or len(feature_names) != n_features:
+             feature_names = [f"{fallback_prefix}{i}" for i in range(n_features)]
+        # Convert to list if it is an array
         elif hasattr(feature_names, 'tolist'):
              feature_names = feature_names.tolist()
-             
-        pd.DataFrame(X_train, columns=feature_names).to_parquet(os.path.join(output_dir, "X_train.parquet"))
-        pd.DataFrame(X_test, columns=feature_names).to_parquet(os.path.join(output_dir, "X_test.parquet"))
+        return feature_names
+
+    @staticmethod
+    def _preview_records(preview_data, feature_names: List[str]) -> List[Dict[str, Any]]:
+        """Create preview dictionaries."""
+        preview_list = []
+        if isinstance(preview_data, np.ndarray):
+            for row in preview_data:
+                # Zip with feature names if available, else generic indices
+                if len(feature_names) == len(row):
+                     preview_list.append(dict(zip(feature_names, row)))
+                else:
+                     preview_list.append(dict(zip([f"Feat_{i}" for i in range(len(row))], row)))
+        return preview_list
+
+    def _distribution(self, series) -> Dict[str, int]:
+        """Class counts of a target split (accepts a Series or precomputed value counts)."""
+        if series is None: return {}
+        # If categorical/object/int with few values
+        try:
+            vc = series.value_counts().to_dict() if isinstance(series, pd.Series) else dict(series)
+            # Map if encoded
+            if self.target_mapping:
+                # Key in vc is integer (encoded), map to original string
+                # Ensure keys are matched correctly (int vs int)
+                return {self.target_mapping.get(int(k), str(k)): int(v) for k, v in vc.items()}
+            return {str(k): int(v) for k, v in vc.items()}
+        except:
+            return {}
+
+    def _correlation_summary(self, X_train_transformed, y_train: pd.Series, feature_names: List[str], is_classification: bool) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        Correlation matrix of the transformed features (plus target) and target correlations.
+
+        Both are computed on at most PREPROCESS_CORR_ROWS sampled rows. The
+        target correlations of all features come from one matrix-vector
+        product (sparse input stays sparse). The matrix covers up to
+        PREPROCESS_CORR_FEATURES features, those most correlated with the
+        target when there are more, and is a float32 product of the centered
+        columns.
+        """
+        correlation_data = {}
+        feature_importance = []
+        try:
+            # 1. Row sample
+            n_rows, n_features = X_train_transformed.shape
+            rows = np.arange(n_rows)
+            if n_rows > PREPROCESS_CORR_ROWS:
+                rows = np.sort(np.random.default_rng(self.random_state).choice(n_rows, PREPROCESS_CORR_ROWS, replace=False))
+            X = X_train_transformed[rows]
+            if sp.issparse(X):
+                X = X.tocsr()
+
+            # 2. Target, if numeric (or encoded)
+            t_name = 'target'
+            if hasattr(y_train, 'name') and y_train.name:
+                t_name = str(y_train.name)
+            y = None
+            if (is_classification and self.label_encoder) or pd.api.types.is_numeric_dtype(y_train):
+                y = np.asarray(y_train, dtype=float)[rows]
+
+            # 3. Correlation of every feature with the target
+            target_corrs = None
+            if y is not None:
+                y_centered = y - y.mean()
+                mean = np.asarray(X.mean(axis=0), dtype=float).ravel()
+                mean_sq = np.asarray((X.multiply(X) if sp.issparse(X) else X * X).mean(axis=0), dtype=float).ravel()
+                std = np.sqrt(np.maximum(mean_sq - mean ** 2, 0))
+                cov = np.asarray(X.T @ y_centered, dtype=float).ravel() / len(y)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    target_corrs = np.where(std > 0, cov / (std * y_centered.std()), np.nan)
+
+            # 4. Matrix over the first features, or the ones closest to the target
+            max_features = PREPROCESS_CORR_FEATURES
+            if n_features > max_features and target_corrs is not None:
+                cols = np.sort(np.argsort(-np.nan_to_num(np.abs(target_corrs), nan=-1))[:max_features])
+            else:
+                cols = np.arange(min(n_features, max_features))
+            block = X[:, cols]
+            block = block.toarray() if sp.issparse(block) else np.asarray(block)
+            names = [feature_names[i] for i in cols]
+            if y is not None:
+                block = np.column_stack([block, y])
+                names.append(t_name)
+
+            # Columns plus the upper triangle; see wire.expand_matrix for the {x, y, v} form
+            corr = self._pearson(block.astype(np.float32))
+            correlation_data = compact_matrix(pd.DataFrame(corr, index=names, columns=names))
+
+            # 5. Feature Importance (Correlation with Target), strongest first
+            if target_corrs is not None:
+                sorted_corrs = pd.Series(np.abs(target_corrs), index=feature_names).sort_values(ascending=False)
+                feature_importance = [
+                    {"feature": idx, "importance": float(val)}
+                    for idx, val in sorted_corrs.head(max_features).items()
+                ]
+
+        except Exception as e:
+            print(f"Warning: Correlation calculation failed: {e}")
+        return correlation_data, feature_importance
+
+    @staticmethod
+    def _pearson(block: np.ndarray) -> np.ndarray:
+        """Pearson correlation of the columns of a dense block (NaN for constant columns)."""
+        centered = block - block.mean(axis=0)
+        norms = np.sqrt((centered * centered).sum(axis=0))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr = (centered.T @ centered) / np.outer(norms, norms)
+        corr = np.clip(corr, -1, 1)
+        np.fill_diagonal(corr, np.where(norms > 0, 1.0, np.nan))
+        return corr
+
+    def _save_results(self, output_dir: str, X_train, X_test, y_train, y_test) -> Dict[str, str]:
+        """Saves transform data (see artifacts.save_features) and pipelines to joblib."""
+        
+        # 1. Save Data (Parquet, or CSR .npz when the output is sparse)
+        feature_names = self._output_feature_names(X_train.shape[1], "feat_")
+
+        binary = self._one_hot_mask(X_train.shape[1])
+        X_train_path = save_features(os.path.join(output_dir, "X_train"), X_train, feature_names, binary)
+        X_test_path = save_features(os.path.join(output_dir, "X_test"), X_test, feature_names, binary)
 
        
         # Save Targets
@@ -410,8 +892,23 @@ class PreprocessingPipeline:
         pd.DataFrame({'target': y_test}).to_parquet(os.path.join(output_dir, "y_test.parquet"))
         print(y_train.head())
         print('ttttttt')
+        pipeline_path, encoder_path = self._save_pipelines(output_dir)
+            
+        return {
+            "X_train": X_train_path,
+            "X_test": X_test_path,
+            "y_train": os.path.join(output_dir, "y_train.parquet"),
+            "y_test": os.path.join(output_dir, "y_test.parquet"),
+            "pipeline": pipeline_path,
+            "label_encoder": encoder_path
+        }
+
+    def _save_pipelines(self, output_dir: str) -> Tuple[str, str]:
+        """Saves the fitted preprocessing pipeline and label encoder to joblib."""
         # Save Pipelines
         full_pipeline_steps = [('preprocessor', self.preprocessor)]
+        if self.neighbor_imputer:
+            full_pipeline_steps.insert(0, ('neighbor_imputer', self.neighbor_imputer))
         if self.selector:
             full_pipeline_steps.append(('selector', self.selector))
             
@@ -425,12 +922,4 @@ class PreprocessingPipeline:
         if self.label_encoder:
             encoder_path = os.path.join(output_dir, "label_encoder.joblib")
             joblib.dump(self.label_encoder, encoder_path)
-            
-        return {
-            "X_train": os.path.join(output_dir, "X_train.parquet"),
-            "X_test": os.path.join(output_dir, "X_test.parquet"),
-            "y_train": os.path.join(output_dir, "y_train.parquet"),
-            "y_test": os.path.join(output_dir, "y_test.parquet"),
-            "pipeline": pipeline_path,
-            "label_encoder": encoder_path
-        }
+        return pipeline_path, encoder_path
@@ -0,0 +1,46 @@
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Optional
+
+
+class ProgressReporter:
+    """
+    Times the named stages of a long-running step.
+
+    Every stage emits a "started" and a "completed" (or "failed") event with
+    its duration to the optional `emit` callback, and the timing is logged so
+    slow stages show up in the server output.
+    """
+
+    def __init__(self, emit: Optional[Callable[[Dict[str, Any]], None]] = None, label: str = ""):
+        self.emit = emit
+        self.label = label
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.time()
+        self._send({"stage": name, "status": "started", "timestamp": started})
+        try:
+            yield
+        except Exception:
+            self._send({
+                "stage": name, "status": "failed", "timestamp": time.time(),
+                "elapsedSeconds": round(time.time() - started, 3)
+            })
+            raise
+
+        elapsed = time.time() - started
+        print(f"[{self.label or 'progress'}] {name}: {elapsed:.2f}s")
+        self._send({
+            "stage": name, "status": "completed", "timestamp": time.time(),
+            "elapsedSeconds": round(elapsed, 3)
+        })
+
+    def _send(self, event: Dict[str, Any]):
+        if self.emit is None:
+            return
+        try:
+            self.emit(event)
+        except Exception as e:
+            # Progress is best effort and must never break the step itself
+            print(f"Progress event dropped: {e}")
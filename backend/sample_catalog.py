@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, Any, List, Callable, Optional
+
+
+class SampleCatalog:
+    """
+    Persistent cache of sample dataset metadata.
+
+    Entries are keyed by filename and remain valid while the file's size,
+    mtime and configured target column are unchanged. Only new or modified
+    files are re-analyzed, on a background thread, so readers are always
+    served from memory.
+    """
+
+    def __init__(
+        self,
+        samples_dir: str,
+        catalog_path: str,
+        targets: Dict[str, str],
+        analyze: Callable[[str, Optional[str]], Dict[str, Any]],
+        scan_interval: float = 5.0,
+    ):
+        self.samples_dir = samples_dir
+        self.catalog_path = catalog_path
+        self.targets = targets
+        self.analyze = analyze
+        self.scan_interval = scan_interval
+
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._last_scan = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+        self._ready = threading.Event()
+
+        self._load()
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """
+        Returns the cached entries, scheduling a background refresh if due.
+
+        Only the very first call on an empty catalog waits for the scan, so
+        async callers should run it in a worker thread.
+        """
+        if time.time() - self._last_scan >= self.scan_interval:
+            self.refresh_async()
+        if not self._ready.is_set():
+            self._ready.wait()
+        with self._lock:
+            return list(self._entries.values())
+
+    def refresh_async(self):
+        """Starts a background refresh unless one is already running."""
+        if not self._refreshing.acquire(blocking=False):
+            return
+        threading.Thread(target=self._refresh_locked, daemon=True).start()
+
+    def refresh(self):
+        """Scans the samples folder and re-analyzes new or changed files (blocking)."""
+        with self._refreshing:
+            self._scan()
+
+    def _refresh_locked(self):
+        try:
+            self._scan()
+        finally:
+            self._refreshing.release()
+
+    def _scan(self):
+        self._last_scan = time.time()
+        try:
+            if not os.path.exists(self.samples_dir):
+                current = {}
+            else:
+                current = {
+                    entry.name: entry.stat()
+                    for entry in os.scandir(self.samples_dir)
+                    if entry.is_file() and entry.name.endswith(".csv")
+                }
+
+            with self._lock:
+                known = dict(self._entries)
+
+            updated = {}
+            changed = False
+            for filename, stat in current.items():
+                target = self.targets.get(filename)
+                entry = known.get(filename)
+                if (
+                    entry is not None
+                    and entry["sizeBytes"] == stat.st_size
+                    and entry["mtime"] == stat.st_mtime
+                    and entry["configuredTarget"] == target
+                ):
+                    updated[filename] = entry
+                    continue
+
+                # Use configured target if available, otherwise None (triggers heuristic)
+                analysis = self.analyze(os.path.join(self.samples_dir, filename), target)
+                updated[filename] = {
+                    "fileName": filename,
+                    "sizeBytes": stat.st_size,
+                    "mtime": stat.st_mtime,
+                    "createdAt": stat.st_ctime,
+                    "configuredTarget": target,
+                    "analysis": analysis,
+                }
+                changed = True
+
+                # Publish progress as we go so readers see new samples early
+                with self._lock:
+                    self._entries[filename] = updated[filename]
+
+            if changed or set(updated) != set(known):
+                with self._lock:
+                    self._entries = updated
+                self._save()
+        except Exception as e:
+            print(f"Sample catalog refresh failed: {e}")
+        finally:
+            self._ready.set()
+
+    def _load(self):
+        if not os.path.exists(self.catalog_path):
+            return
+        try:
+            with open(self.catalog_path, "r") as f:
+                self._entries = json.load(f)
+            self._ready.set()
+        except Exception as e:
+            print(f"Could not read sample catalog {self.catalog_path}: {e}")
+            self._entries = {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.catalog_path), exist_ok=True)
+        tmp_path = f"{self.catalog_path}.tmp"
+        with self._lock:
+            snapshot = dict(self._entries)
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self.catalog_path)
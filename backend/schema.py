@@ -0,0 +1,297 @@
+import os
+import json
+from collections import Counter
+from typing import Dict, Any, Optional, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from sketches import HyperLogLog, ReservoirSample
+from dataset_store import dataset_store
+
+# Bump when the inference rules or the cached format change so stale schemas are recomputed
+SCHEMA_VERSION = 1
+
+# Targets (and categorical columns) with more distinct values than this are not treated as classes
+MAX_CLASSES = 50
+CLASSIFICATION_TYPES = ("binary", "multiclass")
+
+# Distinct target values tracked before giving up on exact class counts (streaming steps)
+TARGET_COUNT_CAP = 10000
+
+# Rows kept to check text columns for dates
+SCHEMA_SAMPLE_ROWS = int(os.getenv("SCHEMA_SAMPLE_ROWS", "10000"))
+# Rows read at once when a schema has to be inferred from a stored dataset
+SCHEMA_BATCH_ROWS = int(os.getenv("SCHEMA_BATCH_ROWS", "100000"))
+# Exact value counts are kept per column up to this many distinct values
+SCHEMA_COUNT_CAP = int(os.getenv("SCHEMA_COUNT_CAP", "200"))
+SCHEMA_HLL_PRECISION = 12
+
+# Integer or text columns with (nearly) one distinct value per row are identifiers
+ID_DISTINCT_RATIO = 0.95
+# Text columns are datetimes when this share of their sampled values parses as a date
+DATETIME_PARSE_RATIO = 0.95
+
+
+def target_type(n_classes: Optional[int], fractional: bool = False) -> str:
+    """
+    Problem type of a target: "binary", "multiclass" or "regression".
+
+    `n_classes` is the number of distinct (non-missing) values, None when
+    there are too many to count; `fractional` is True for numeric targets
+    with non-integer values, which are always regression.
+    """
+    if n_classes is None or fractional or n_classes > MAX_CLASSES:
+        return "regression"
+    if n_classes == 0:
+        return "unknown"
+    return "binary" if n_classes == 2 else "multiclass"
+
+
+def series_target_type(y: pd.Series) -> str:
+    """`target_type` of a target held in memory."""
+    values = y.dropna()
+    return target_type(values.nunique(), _has_fractions(values))
+
+
+def _has_fractions(values: pd.Series) -> bool:
+    if not pd.api.types.is_float_dtype(values):
+        return False
+    finite = values.to_numpy(dtype=float)
+    finite = finite[np.isfinite(finite)]
+    return bool(np.any(finite != np.floor(finite)))
+
+
+class _ColumnSummary:
+    """Streaming summary of one column: type flags, missing values, distinct values."""
+
+    def __init__(self):
+        self.dtypes = set()
+        self.missing = 0
+        self.fractional = False
+        self.distinct = HyperLogLog(SCHEMA_HLL_PRECISION)
+        self.counts: Optional[Counter] = Counter()
+
+    def update(self, series: pd.Series):
+        self.dtypes.add(_dtype_kind(series))
+        self.missing += int(series.isnull().sum())
+        if not self.fractional:
+            self.fractional = _has_fractions(series)
+
+        # Exact counts while they stay small; the distinct-value sketch takes over beyond
+        value_counts = series.value_counts() if self.counts is not None else None
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            # Hashed as float64 (much cheaper than objects), so integer and float chunks of a column agree
+            values = series.dropna().to_numpy(dtype=float)
+            self.distinct.update_hashes(pd.util.hash_array(np.unique(values)))
+        else:
+            self.distinct.update(value_counts.index.to_numpy() if value_counts is not None else series.dropna().unique())
+
+        if value_counts is not None:
+            self.counts.update(value_counts.to_dict())
+            if len(self.counts) > SCHEMA_COUNT_CAP:
+                self.counts = None
+
+    def dtype(self) -> str:
+        # Any text chunk makes the column text, otherwise any float chunk makes it float
+        for kind in ("text", "datetime", "float", "integer", "boolean"):
+            if kind in self.dtypes:
+                return kind
+        return "text"
+
+    def n_distinct(self) -> int:
+        if self.counts is not None:
+            return len(self.counts)
+        return int(round(self.distinct.count()))
+
+
+def _dtype_kind(series: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(series):
+        return "boolean"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime"
+    if pd.api.types.is_float_dtype(series):
+        return "float"
+    if pd.api.types.is_numeric_dtype(series):
+        return "integer"
+    return "text"
+
+
+def _looks_like_dates(values: pd.Series) -> bool:
+    values = values.dropna().astype(str)
+    # Plain numbers parse as dates too; require a date or time separator
+    if len(values) == 0 or not values.str.contains(r"[-/:]").all():
+        return False
+    parsed = pd.to_datetime(values, errors="coerce", format="mixed")
+    return parsed.notna().mean() >= DATETIME_PARSE_RATIO
+
+
+class SchemaBuilder:
+    """
+    Infers a DatasetSchema from a stream of DataFrame chunks, in one pass.
+
+    Keeps, per column, missing counts, exact value counts while there are at
+    most SCHEMA_COUNT_CAP distinct values and a HyperLogLog estimate beyond,
+    plus a uniform sample of SCHEMA_SAMPLE_ROWS rows to recognize dates in
+    text columns. Memory does not grow with the number of rows.
+    """
+
+    def __init__(self, seed: int = 42):
+        self.columns: List[str] = []
+        self.row_count = 0
+        self.summaries: Dict[str, _ColumnSummary] = {}
+        self.sample = ReservoirSample(SCHEMA_SAMPLE_ROWS, seed=seed)
+
+    def update(self, chunk: pd.DataFrame):
+        if not self.columns:
+            self.columns = list(chunk.columns)
+            self.summaries = {col: _ColumnSummary() for col in self.columns}
+
+        self.row_count += len(chunk)
+        for col in self.columns:
+            self.summaries[col].update(chunk[col])
+
+        text_cols = [col for col in self.columns if _dtype_kind(chunk[col]) == "text"]
+        if text_cols:
+            self.sample.update(chunk[text_cols])
+
+    def result(self) -> "DatasetSchema":
+        columns = {}
+        for col in self.columns:
+            summary = self.summaries[col]
+            dtype = summary.dtype()
+            n_distinct = summary.n_distinct()
+            non_null = self.row_count - summary.missing
+            columns[col] = {
+                "dtype": dtype,
+                "kind": self._kind(col, dtype, n_distinct, non_null, summary.fractional),
+                "missing": summary.missing,
+                "distinct": n_distinct,
+                "distinctExact": summary.counts is not None,
+                "fractional": summary.fractional,
+                "counts": [[k, int(v)] for k, v in summary.counts.most_common()] if summary.counts is not None else None,
+            }
+        return DatasetSchema(self.columns, self.row_count, columns)
+
+    def _kind(self, col: str, dtype: str, n_distinct: int, non_null: int, fractional: bool) -> str:
+        if dtype == "datetime":
+            return "datetime"
+        if dtype == "text" and self.sample.frame is not None and col in self.sample.frame.columns:
+            if _looks_like_dates(self.sample.frame[col]):
+                return "datetime"
+        if dtype in ("integer", "text") and not fractional and non_null > MAX_CLASSES and n_distinct >= ID_DISTINCT_RATIO * non_null:
+            return "id"
+        if dtype in ("float", "integer"):
+            return "numeric"
+        return "categorical"
+
+
+class DatasetSchema:
+    """
+    Column kinds ("numeric", "categorical", "id", "datetime"), missing and
+    distinct counts of a dataset, and the problem type of any column used as
+    the target. Computed once per dataset (see `dataset_schema`) and shared
+    by upload validation, dataset analysis and details.
+    """
+
+    def __init__(self, columns: List[str], row_count: int, column_info: Dict[str, Dict[str, Any]]):
+        self.columns = columns
+        self.row_count = row_count
+        self.column_info = column_info
+
+    def kind(self, col: str) -> str:
+        return self.column_info[col]["kind"]
+
+    def class_counts(self, col: str) -> Optional[Dict[Any, int]]:
+        """Exact value counts of a column (most frequent first), None if it has too many values."""
+        counts = self.column_info[col]["counts"]
+        return {k: v for k, v in counts} if counts is not None else None
+
+    def target_type(self, col: str) -> str:
+        info = self.column_info[col]
+        return target_type(info["distinct"] if info["distinctExact"] else None, info["fractional"])
+
+    def profile(self, user_target_col: Optional[str] = None, size_bytes: int = 0, error: Optional[str] = None) -> Dict[str, Any]:
+        """Upload profile (row and missing counts, target class counts) with the target resolved."""
+        # Target Column Detection (fallback heuristic: last column)
+        target_col = None
+        if user_target_col and user_target_col in self.columns:
+            target_col = user_target_col
+        elif self.columns:
+            target_col = self.columns[-1]
+
+        target = self.column_info.get(target_col, {})
+        return {
+            "columns": self.columns,
+            "rowCount": self.row_count,
+            "nullCount": sum(info["missing"] for info in self.column_info.values()),
+            "targetCol": target_col,
+            "targetMissing": target.get("missing", 0),
+            "targetIsFloat": target.get("fractional", False),
+            "targetCounts": self.class_counts(target_col) if target_col else None,  # None when the target has too many values
+            "targetDistinct": target.get("distinct", 0),
+            "targetType": self.target_type(target_col) if target_col else "unknown",
+            "sizeBytes": size_bytes,
+            "error": error,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"columns": self.columns, "rowCount": self.row_count, "columnInfo": self.column_info}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DatasetSchema":
+        return cls(data["columns"], data["rowCount"], data["columnInfo"])
+
+
+def infer_schema(chunks: Iterable[pd.DataFrame]) -> DatasetSchema:
+    """Schema of a dataset given as DataFrame chunks (or a one-element list holding the whole frame)."""
+    builder = SchemaBuilder()
+    for chunk in chunks:
+        builder.update(chunk)
+    return builder.result()
+
+
+def dataset_schema(file_path: str) -> DatasetSchema:
+    """
+    Schema of a stored dataset, inferred on first use and cached next to it.
+
+    The cache is reused while the file's size and mtime are unchanged.
+    Uploads record it while streaming (see ingest.py), so this normally
+    costs one small JSON read.
+    """
+    stat = os.stat(file_path)
+    sidecar = dataset_store.sidecar_path(file_path, "schema.json")
+    try:
+        with open(sidecar, "r") as f:
+            saved = json.load(f)
+        if saved["version"] == SCHEMA_VERSION and saved["size"] == stat.st_size and saved["mtime"] == stat.st_mtime:
+            return DatasetSchema.from_dict(saved["schema"])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    schema = infer_schema(dataset_store.iter_batches(file_path, SCHEMA_BATCH_ROWS))
+    save_schema(file_path, schema)
+    return schema
+
+
+def save_schema(file_path: str, schema: DatasetSchema):
+    """Records the schema of a file that was just written."""
+    stat = os.stat(file_path)
+    sidecar = dataset_store.sidecar_path(file_path, "schema.json")
+    os.makedirs(os.path.dirname(sidecar), exist_ok=True)
+    tmp_path = f"{sidecar}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump({"version": SCHEMA_VERSION, "size": stat.st_size, "mtime": stat.st_mtime, "schema": schema.to_dict()}, f, default=_json_default)
+        os.replace(tmp_path, sidecar)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Could not save schema for {file_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _json_default(value):
+    # numpy scalars and timestamps among value counts
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
@@ -0,0 +1,277 @@
+import numpy as np
+import pandas as pd
+from collections import Counter
+from typing import Dict, Any, Optional, Tuple
+
+
+class MomentSketch:
+    """
+    Streaming count, mean, central moments (2nd to 4th), min and max.
+
+    Works on a 2-D block (rows x columns, NaN = missing) so all numeric
+    columns of a batch are updated together. Batches are merged with the
+    pairwise update formulas of Chan et al. / Pebay, which are exact up to
+    floating point rounding. Derived statistics follow pandas' definitions
+    (sample std, bias-corrected skew and excess kurtosis).
+    """
+
+    def __init__(self, n_cols: int):
+        self.count = np.zeros(n_cols)
+        self.mean = np.zeros(n_cols)
+        self.m2 = np.zeros(n_cols)
+        self.m3 = np.zeros(n_cols)
+        self.m4 = np.zeros(n_cols)
+        self.min = np.full(n_cols, np.inf)
+        self.max = np.full(n_cols, -np.inf)
+
+    def update(self, block: np.ndarray):
+        mask = ~np.isnan(block)
+        nb = mask.sum(axis=0).astype(float)
+        if not nb.any():
+            return
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mb = np.where(nb > 0, np.where(mask, block, 0).sum(axis=0) / nb, 0)
+            d = np.where(mask, block - mb, 0)
+            d2 = d * d
+            m2b = d2.sum(axis=0)
+            m3b = (d2 * d).sum(axis=0)
+            m4b = (d2 * d2).sum(axis=0)
+
+            na = self.count
+            n = na + nb
+            delta = mb - self.mean
+            ratio = np.where(n > 0, nb / n, 0)
+
+            self.m4 = (
+                self.m4 + m4b
+                + delta ** 4 * na * nb * (na * na - na * nb + nb * nb) / np.where(n > 0, n ** 3, 1)
+                + 6 * delta ** 2 * (na * na * m2b + nb * nb * self.m2) / np.where(n > 0, n * n, 1)
+                + 4 * delta * (na * m3b - nb * self.m3) / np.where(n > 0, n, 1)
+            )
+            self.m3 = (
+                self.m3 + m3b
+                + delta ** 3 * na * nb * (na - nb) / np.where(n > 0, n * n, 1)
+                + 3 * delta * (na * m2b - nb * self.m2) / np.where(n > 0, n, 1)
+            )
+            self.m2 = self.m2 + m2b + delta ** 2 * na * ratio
+            self.mean = self.mean + delta * ratio
+            self.count = n
+
+        self.min = np.fmin(self.min, np.nanmin(np.where(mask, block, np.inf), axis=0))
+        self.max = np.fmax(self.max, np.nanmax(np.where(mask, block, -np.inf), axis=0))
+
+    def std(self) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, np.sqrt(self.m2 / (self.count - 1)), np.nan)
+
+    def skew(self) -> np.ndarray:
+        n = self.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            value = (n * (n - 1) ** 0.5 / (n - 2)) * (self.m3 / self.m2 ** 1.5)
+        value = np.where(self.m2 == 0, 0.0, value)
+        return np.where(n < 3, np.nan, value)
+
+    def kurtosis(self) -> np.ndarray:
+        n = self.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            numerator = n * (n + 1) * (n - 1) * self.m4
+            denominator = (n - 2) * (n - 3) * self.m2 ** 2
+            adj = 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+            value = numerator / denominator - adj
+        value = np.where(denominator == 0, 0.0, value)
+        return np.where(n < 4, np.nan, value)
+
+
+class KLLSketch:
+    """
+    KLL quantile sketch (Karnin, Lang & Liberty, 2016).
+
+    Keeps a hierarchy of compactors; an item stored at level h stands for
+    2**h input values. Memory stays around 3*k values regardless of the
+    stream length, with a normalized rank error of roughly `rank_error(k)`.
+    """
+
+    def __init__(self, k: int = 200, seed: Optional[int] = None):
+        self.k = k
+        self.n = 0
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @staticmethod
+    def rank_error(k: int) -> float:
+        """Approximate normalized rank error (99% confidence) for a given k."""
+        return 2.296 / k ** 0.9723
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.n += len(values)
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** depth)))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                items = np.sort(items)
+                # An odd leftover item stays behind; pairs promote one random member
+                keep = items[len(items) - len(items) % 2:]
+                promoted = items[self._rng.integers(2):len(items) - len(keep):2]
+                self.levels[level] = keep
+                self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            level += 1
+
+    def _weighted(self) -> Tuple[np.ndarray, np.ndarray]:
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(lvl), 2.0 ** h) for h, lvl in enumerate(self.levels)])
+        return items, weights
+
+    def quantiles(self, qs) -> np.ndarray:
+        items, weights = self._weighted()
+        if len(items) == 0:
+            return np.full(len(qs), np.nan)
+        order = np.argsort(items, kind="stable")
+        items, weights = items[order], weights[order]
+        cdf = np.cumsum(weights) / weights.sum()
+        idx = np.searchsorted(cdf, np.asarray(qs, dtype=float), side="left")
+        return items[np.minimum(idx, len(items) - 1)]
+
+    def histogram(self, bins: int, value_range: Tuple[float, float]) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate histogram of the stream, scaled to the number of values seen."""
+        items, weights = self._weighted()
+        counts, edges = np.histogram(items, bins=bins, range=value_range, weights=weights)
+        if weights.sum() > 0:
+            counts = counts * (self.n / weights.sum())
+        return np.rint(counts).astype(int), edges
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter (Flajolet et al., 2007) over pandas' 64-bit hashes.
+
+    Adding the same value twice has no effect, so callers may feed the
+    distinct values of each batch instead of every row.
+    """
+
+    def __init__(self, precision: int = 14):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = np.zeros(self.m, dtype=np.uint8)
+
+    @staticmethod
+    def relative_error(precision: int) -> float:
+        return 1.04 / np.sqrt(1 << precision)
+
+    def update(self, values):
+        values = np.asarray(values, dtype=object)
+        if len(values) == 0:
+            return
+        self.update_hashes(pd.util.hash_array(values))
+
+    def update_hashes(self, hashes: np.ndarray):
+        """Adds values by their 64-bit hashes (e.g. pd.util.hash_array of a numeric array, far cheaper than objects)."""
+        if len(hashes) == 0:
+            return
+        idx = (hashes >> np.uint64(64 - self.p)).astype(np.int64)
+        # Remaining bits, with a sentinel so the leading-zero count is bounded
+        rest = (hashes << np.uint64(self.p)) | np.uint64(1 << (self.p - 1))
+        np.maximum.at(self.registers, idx, (65 - _bit_length(rest)).astype(np.uint8))
+
+    def count(self) -> float:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / np.sum(2.0 ** -self.registers.astype(float))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * self.m and zeros > 0:
+            # Small range correction (linear counting)
+            estimate = self.m * np.log(self.m / zeros)
+        return float(estimate)
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Vectorized int.bit_length for non-zero uint64 values."""
+    x = values.copy()
+    length = np.ones(len(x), dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = x >= np.uint64(1 << shift)
+        length[high] += shift
+        x[high] >>= np.uint64(shift)
+    return length
+
+
+class FrequentItems:
+    """
+    Misra-Gries heavy hitters summary over per-batch value counts.
+
+    Tracks at most `capacity` values. While no more than `capacity` distinct
+    values have been seen the counts are exact; afterwards every count is an
+    underestimate by at most `max_error`.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts = Counter()
+        self.max_error = 0
+
+    @property
+    def exact(self) -> bool:
+        return self.max_error == 0
+
+    def update(self, value_counts: pd.Series):
+        # value_counts arrives sorted by descending count; reduce it first so
+        # the merge below never touches more than `capacity` entries.
+        if len(value_counts) > self.capacity:
+            cut = int(value_counts.iloc[self.capacity])
+            value_counts = value_counts.iloc[:self.capacity] - cut
+            value_counts = value_counts[value_counts > 0]
+            self.max_error += cut
+
+        self.counts.update(value_counts.to_dict())
+        if len(self.counts) > self.capacity:
+            cut = sorted(self.counts.values(), reverse=True)[self.capacity]
+            self.counts = Counter({k: v - cut for k, v in self.counts.items() if v > cut})
+            self.max_error += cut
+
+    def top(self, n: int) -> Dict[Any, int]:
+        return dict(self.counts.most_common(n))
+
+
+class ReservoirSample:
+    """
+    Uniform sample of at most `k` rows from a stream of DataFrame batches.
+
+    Every row gets a random key and the rows with the k smallest keys are
+    kept (bottom-k sampling), which is equivalent to reservoir sampling but
+    lets a whole batch be filtered with one vectorized comparison.
+    """
+
+    def __init__(self, k: int, seed: Optional[int] = None):
+        self.k = k
+        self.frame: Optional[pd.DataFrame] = None
+        self._keys = np.empty(0)
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, batch: pd.DataFrame):
+        keys = self._rng.random(len(batch))
+        if len(self._keys) >= self.k:
+            # Only rows that beat the current k-th key can enter
+            entering = keys < self._keys.max()
+            batch, keys = batch[entering], keys[entering]
+            if len(batch) == 0:
+                return
+
+        frame = batch if self.frame is None else pd.concat([self.frame, batch], ignore_index=True)
+        keys = np.concatenate([self._keys, keys])
+        if len(keys) > self.k:
+            keep = np.argpartition(keys, self.k - 1)[:self.k]
+            frame, keys = frame.iloc[keep].reset_index(drop=True), keys[keep]
+        self.frame, self._keys = frame, keys
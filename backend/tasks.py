@@ -0,0 +1,387 @@
+import os
+import time
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+import joblib
+import pandas as pd
+import numpy as np
+import matplotlib.pyplot as plt
+import seaborn as sns
+
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, confusion_matrix
+
+from preprocessing import PreprocessingPipeline, PREPROCESS_STREAMING_ROWS, PREPROCESS_BATCH_ROWS
+from balancing import BalancingPipeline, BALANCE_BATCH_ROWS
+from models import ModelFactory
+from analysis import ImbalanceAnalyzer
+from eda import run_eda, run_eda_approximate, EDA_APPROX_ROWS, EDA_BATCH_ROWS
+from dataset_store import dataset_store
+from eda_cache import EDACache
+from progress import ProgressReporter
+from artifacts import save_features, remove_features, save_reference, storage_frame, as_float, RowGroupWriter, DENSE_SUFFIX, FEATURE_PRECISION
+from artifact_reader import artifact_reader
+from manifest import StepManifest
+from knn_graph import KNNGraphStore
+
+# Entry points executed by the job workers (see jobs.py).
+# They only take plain, picklable arguments (paths and parsed configs) plus
+# the job's ProgressReporter, and return plain dicts; HTTP concerns stay in main.py.
+
+
+def eda_task(
+    file_path: str, file_name: str, target_col: Optional[str] = None,
+    mode: str = "auto", cache: Optional[EDACache] = None, cache_key: Optional[str] = None,
+    progress: Optional[ProgressReporter] = None
+) -> Dict[str, Any]:
+    """
+    Runs EDA on a dataset. `mode` is "exact", "approximate" or "auto", which
+    picks the sketch-based mode above EDA_APPROX_ROWS rows. Successful results
+    are stored in `cache` under `cache_key` when given.
+    """
+    progress = progress or ProgressReporter(label="eda")
+    try:
+        if mode == "approximate" or (mode == "auto" and dataset_store.row_count(file_path) > EDA_APPROX_ROWS):
+            with progress.stage("sketch"):
+                batches = dataset_store.iter_batches(file_path, EDA_BATCH_ROWS)
+                result = run_eda_approximate(batches, file_name, target_col)
+        else:
+            with progress.stage("load"):
+                # Jobs run in short-lived worker processes, whose LRU is always cold: read the Parquet copy
+                df = dataset_store.load(file_path, cache=False)
+            with progress.stage("analysis"):
+                result = run_eda(df, file_name, target_col)
+
+        if cache is not None and cache_key:
+            with progress.stage("cache"):
+                cache.put(cache_key, result)
+        return result
+    except Exception as e:
+        print(f"EDA Error: {e}")
+        # Return empty structure instead of crashing
+        return {"error": str(e)}
+
+
+def preprocess_task(
+    file_path: str, target_col: str, output_dir: str, cfg: Dict[str, Any],
+    manifest_key: Optional[str] = None, progress: Optional[ProgressReporter] = None
+) -> Dict[str, Any]:
+    """Preprocesses a dataset; the artifacts are recorded under `manifest_key` when given."""
+    progress = progress or ProgressReporter(label="preprocess")
+    manifest = StepManifest(output_dir)
+    manifest.clear()
+
+    pipeline = PreprocessingPipeline(cfg)
+    if dataset_store.row_count(file_path) > PREPROCESS_STREAMING_ROWS:
+        # 1-2. Stream the dataset through the pipeline (bounded memory)
+        batches = lambda: dataset_store.iter_batches(file_path, PREPROCESS_BATCH_ROWS)
+        result = pipeline.run_streaming(batches, target_col, output_dir, progress=progress)
+    else:
+        # 1. Load Data
+        with progress.stage("load"):
+            df = dataset_store.load(file_path, cache=False) # Worker process: see eda_task
+
+        # 2. Run Pipeline
+        result = pipeline.run(df, target_col, output_dir, progress=progress)
+
+    # 3. Construct Response
+    result["timestamp"] = datetime.now().isoformat()
+    if manifest_key:
+        manifest.put(manifest_key, result, result["artifacts"].values())
+    return result
+
+
+def balance_task(
+    artifacts_dir: str, balancing_dir: str, cfg: Dict[str, Any],
+    manifest_key: Optional[str] = None, progress: Optional[ProgressReporter] = None
+) -> Dict[str, Any]:
+    """Balances the preprocessed training data; the artifacts are recorded under `manifest_key` when given."""
+    progress = progress or ProgressReporter(label="balance")
+    manifest = StepManifest(balancing_dir)
+    manifest.clear()
+
+    # 1. Load Data
+    with progress.stage("load"):
+        X_train, feature_names = artifact_reader.features(os.path.join(artifacts_dir, "X_train"))
+        y_train = artifact_reader.target(os.path.join(artifacts_dir, "y_train.parquet")) # Series
+
+    # 2. Initialize Balancing Pipeline
+    balancing_cfg = cfg.get('imbalance', {})
+    pipeline = BalancingPipeline(balancing_cfg)
+
+    # Searches over the whole training set reuse its stored k-NN graph (built now if missing)
+    graph = None
+    if pipeline.technique in BalancingPipeline.GRAPH_TECHNIQUES:
+        with progress.stage("neighbors"):
+            graph = KNNGraphStore(artifacts_dir).get_or_build(StepManifest(artifacts_dir).key(), X_train)
+
+    # Large oversampling runs write only their new rows, in chunks
+    plan = pipeline.chunked_plan(X_train, y_train)
+    if plan is not None:
+        result = _balance_chunked(pipeline, plan, X_train, y_train, feature_names, artifacts_dir, balancing_dir, progress)
+        files = result.pop("files")
+        if manifest_key:
+            manifest.put(manifest_key, result, files)
+        return result
+
+    # 3. Apply Balancing
+    # Stored 0/1 columns are uint8; resamplers that interpolate need floats
+    X_train = as_float(X_train)
+    X_resampled, y_resampled, metadata = pipeline.apply_balancing(X_train, y_train, progress=progress, graph=graph)
+
+    # 4. Save Results
+    with progress.stage("save"):
+        os.makedirs(balancing_dir, exist_ok=True)
+
+        X_path = save_features(os.path.join(balancing_dir, "X_train_resampled"), X_resampled, feature_names)
+        y_path = os.path.join(balancing_dir, "y_train_resampled.parquet")
+        pd.DataFrame({'target': y_resampled}).to_parquet(y_path)
+
+    # 5. Post-Processing Analysis (PCA for visualization)
+    with progress.stage("pca"):
+        analyzer = ImbalanceAnalyzer()
+        # We only need PCA coordinates for the balanced dataset to plot it
+        pca_coords = analyzer.get_pca_coordinates(X_resampled, y_resampled)
+
+    # 6. Return Metadata
+    result = {
+        "status": "Completed",
+        "distribution": metadata,
+        "shape": {
+            "before": list(X_train.shape),
+            "after": list(X_resampled.shape)
+        },
+        "pca": pca_coords,
+        "artifactsPath": balancing_dir
+    }
+    if manifest_key:
+        manifest.put(manifest_key, result, [X_path, y_path])
+    return result
+
+
+def _balance_chunked(
+    pipeline: BalancingPipeline, plan: Dict[Any, int], X_train: pd.DataFrame, y_train: pd.Series,
+    feature_names: list, artifacts_dir: str, balancing_dir: str, progress: ProgressReporter
+) -> Dict[str, Any]:
+    """
+    Chunked variant of balancing for oversampling (see BalancingPipeline.chunked_plan).
+
+    X_train_resampled.parquet holds only the new rows, appended one row group
+    per batch; the input rows are kept by reference to the preprocessed
+    X_train. Peak memory is one batch plus the class being oversampled.
+    Returns the usual summary plus the written `files`.
+    """
+    os.makedirs(balancing_dir, exist_ok=True)
+    X_base = os.path.join(balancing_dir, "X_train_resampled")
+    y_path = os.path.join(balancing_dir, "y_train_resampled.parquet")
+    remove_features(X_base)
+    X_writer = RowGroupWriter(X_base + DENSE_SUFFIX)
+    y_writer = RowGroupWriter(y_path)
+    dtypes = [np.dtype(np.float64 if FEATURE_PRECISION == "float64" else np.float32)] * len(feature_names)
+
+    n_rows = len(y_train)
+    n_total = n_rows + sum(plan.values())
+    # PCA preview rows, drawn over the whole output and collected while it is written
+    preview = np.sort(np.random.default_rng(42).choice(n_total, min(n_total, 1000), replace=False))
+    preview_X = [X_train.iloc[preview[preview < n_rows]].to_numpy(dtype=float)]
+    preview_y = [y_train.to_numpy()[preview[preview < n_rows]]]
+
+    n_batches = 0
+    with progress.stage("resampling"):
+        y_writer.write(pd.DataFrame({'target': y_train.to_numpy()}))
+        offset = n_rows
+        for X_new, y_new in pipeline.generate_chunks(X_train, y_train, plan):
+            X_writer.write(storage_frame(X_new, feature_names, dtypes))
+            y_writer.write(pd.DataFrame({'target': y_new}))
+            picked = preview[(preview >= offset) & (preview < offset + len(y_new))] - offset
+            preview_X.append(X_new[picked])
+            preview_y.append(y_new[picked])
+            offset += len(y_new)
+            n_batches += 1
+
+    with progress.stage("save"):
+        X_writer.close(storage_frame(np.empty((0, len(feature_names))), feature_names, dtypes))
+        y_writer.close(pd.DataFrame({'target': y_train.iloc[:0]}))
+        reference_path = save_reference(X_base, os.path.join(artifacts_dir, "X_train"))
+
+    with progress.stage("pca"):
+        analyzer = ImbalanceAnalyzer()
+        pca_coords = analyzer.get_pca_coordinates(
+            pd.DataFrame(np.vstack(preview_X), columns=feature_names), pd.Series(np.concatenate(preview_y))
+        )
+
+    before_dist = {str(k): int(v) for k, v in y_train.value_counts().items()}
+    after_dist = dict(before_dist)
+    for label, n_new in plan.items():
+        after_dist[str(label)] += n_new
+
+    return {
+        "status": "Completed",
+        "distribution": {
+            "before": before_dist,
+            "after": after_dist,
+            "technique": pipeline.technique
+        },
+        "shape": {
+            "before": list(X_train.shape),
+            "after": [n_total, X_train.shape[1]]
+        },
+        "pca": pca_coords,
+        "artifactsPath": balancing_dir,
+        "streaming": {"batches": n_batches, "batchRows": BALANCE_BATCH_ROWS, "newRows": n_total - n_rows},
+        "files": [X_base + DENSE_SUFFIX, y_path, reference_path]
+    }
+
+
+def run_task(
+    X_train_base: str, y_train_path: str,
+    X_test_base: str, y_test_path: str,
+    artifacts_dir: str, artifacts_url: str,
+    cfg: Dict[str, Any], manifest_key: Optional[str] = None,
+    progress: Optional[ProgressReporter] = None
+) -> Dict[str, Any]:
+    """Trains and evaluates the configured model; the artifacts are recorded under `manifest_key` when given."""
+    progress = progress or ProgressReporter(label="run")
+    manifest = StepManifest(artifacts_dir)
+    manifest.clear()
+
+    # Feature matrices may be sparse (CSR); every supported model trains on them as-is.
+    # They are memory-mapped and read-only, which fitting and scoring never need to change.
+    with progress.stage("load"):
+        X_test, feature_names = artifact_reader.features(X_test_base)
+        y_test = artifact_reader.target(y_test_path)
+
+        X_final_train, _ = artifact_reader.features(X_train_base)
+        y_final_train = artifact_reader.target(y_train_path)
+
+    # 4. Model Initialization & Training
+    model_cfg = cfg.get('model', {})
+    algo = model_cfg.get('algorithm', 'RandomForest')
+    params = model_cfg.get('hyperparameters', {})
+
+    model = ModelFactory.get_model(algo, params)
+
+    # Fit
+    started = time.time()
+    with progress.stage("fit"):
+        model.fit(X_final_train, y_final_train)
+
+    # 5. Evaluation
+    is_multiclass = len(np.unique(y_test)) > 2
+    with progress.stage("predict"):
+        y_pred = model.predict(X_test)
+
+        y_prob = None
+        if hasattr(model, "predict_proba"):
+             y_prob = model.predict_proba(X_test)
+             if not is_multiclass:
+                  y_prob = y_prob[:, 1]
+    execution_time = time.time() - started
+
+    with progress.stage("metrics"):
+        acc = accuracy_score(y_test, y_pred)
+
+        if is_multiclass:
+            f1_metric = f1_score(y_test, y_pred, average='weighted')
+            prec_metric = precision_score(y_test, y_pred, average='weighted')
+            rec_metric = recall_score(y_test, y_pred, average='weighted')
+            g_mean = 0.0 # G-Mean is complex for multiclass, defaulting to 0 or macro-avg
+            pr_auc = 0.0 # PR-AUC natively isn't singular for multiclass without binarization
+        else:
+            # Assume minority class is 1 or second distinct value
+            pos_label = np.unique(y_test)[-1] if 1 not in np.unique(y_test) else 1
+            f1_metric = f1_score(y_test, y_pred, pos_label=pos_label, average='binary')
+            prec_metric = precision_score(y_test, y_pred, pos_label=pos_label, average='binary')
+            rec_metric = recall_score(y_test, y_pred, pos_label=pos_label, average='binary')
+
+            tn, fp, fn, tp = confusion_matrix(y_test, y_pred).ravel()
+            sensitivity = tp / (tp + fn) if (tp + fn) > 0 else 0
+            specificity = tn / (tn + fp) if (tn + fp) > 0 else 0
+            g_mean = (sensitivity * specificity) ** 0.5
+
+            pr_auc = 0.0
+            if y_prob is not None:
+                from sklearn.metrics import average_precision_score
+                pr_auc = average_precision_score(y_test, y_prob)
+
+    metrics = {
+        "accuracy": round(acc, 4),
+        "f1Score": round(f1_metric, 4),
+        "precision": round(prec_metric, 4),
+        "recall": round(rec_metric, 4),
+        "prAuc": round(pr_auc, 4),
+        "gMean": round(g_mean, 4),
+        "executionTimeSeconds": round(execution_time, 2)
+    }
+
+    with progress.stage("plotting"):
+        # 6. Save Artifacts strictly under workflow artifacts correctly
+        os.makedirs(artifacts_dir, exist_ok=True)
+
+        # Save Model
+        model_filename = "model.joblib"
+        joblib.dump(model, os.path.join(artifacts_dir, model_filename))
+
+        # Save Confusion Matrix
+        cm = confusion_matrix(y_test, y_pred)
+        plt.figure(figsize=(6, 5))
+        sns.heatmap(cm, annot=True, fmt='d', cmap='Blues')
+        plt.title(f'Confusion Matrix ({algo})')
+        plt.ylabel('True Label')
+        plt.xlabel('Predicted Label')
+        cm_filename = "confusion_matrix.png"
+        plt.savefig(os.path.join(artifacts_dir, cm_filename))
+        plt.close()
+
+        # Save Precision-Recall Curve (only for binary with proba)
+        pr_curve_filename = ""
+        if y_prob is not None and not is_multiclass:
+             from sklearn.metrics import PrecisionRecallDisplay
+             plt.figure(figsize=(6, 5))
+             PrecisionRecallDisplay.from_predictions(y_test, y_prob, name=algo)
+             plt.title("Precision-Recall Curve")
+             pr_curve_filename = "pr_curve.png"
+             plt.savefig(os.path.join(artifacts_dir, pr_curve_filename))
+             plt.close()
+
+
+        # Save Feature Importance (if available)
+        feat_imp_filename = ""
+        importances = None
+        if hasattr(model, "feature_importances_"):
+             importances = model.feature_importances_
+        elif hasattr(model, "coef_"):
+             importances = np.abs(model.coef_[0])
+
+        if importances is not None:
+             # Top 20
+             indices = np.argsort(importances)[::-1][:20]
+             top_feats = [feature_names[i] for i in indices]
+             top_imps = importances[indices]
+
+             plt.figure(figsize=(8, 6))
+             sns.barplot(x=top_imps, y=top_feats, palette="viridis")
+             plt.title("Feature Importance (Top 20)")
+             plt.xlabel("Importance")
+             feat_imp_filename = "feature_importance.png"
+             plt.tight_layout()
+             plt.savefig(os.path.join(artifacts_dir, feat_imp_filename))
+             plt.close()
+
+    # URLs
+    artifacts = {
+         "modelPath": f"{artifacts_url}/{model_filename}",
+         "confusionMatrixUrl": f"{artifacts_url}/{cm_filename}",
+         "prCurveUrl": f"{artifacts_url}/{pr_curve_filename}" if pr_curve_filename else None,
+         "featureImportanceUrl": f"{artifacts_url}/{feat_imp_filename}" if feat_imp_filename else None,
+    }
+
+    result = {
+        "status": "Completed",
+        "results": metrics,
+        "artifacts": artifacts
+    }
+    if manifest_key:
+        files = [model_filename, cm_filename, pr_curve_filename, feat_imp_filename]
+        manifest.put(manifest_key, result, [os.path.join(artifacts_dir, name) for name in files if name])
+    return result
@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sp
+from imblearn.over_sampling import SMOTE, RandomOverSampler
+from sklearn.datasets import make_classification
+from sklearn.neighbors import NearestNeighbors
+
+import balancing
+from artifact_reader import ArtifactReader
+from artifacts import save_features, load_features, StaleReferenceError
+from balancing import BalancingPipeline
+from manifest import StepManifest
+from tasks import balance_task
+
+
+def _training_set(n_rows: int = 3_000, weights=(0.8, 0.15), seed: int = 0):
+    X, y = make_classification(
+        n_samples=n_rows, n_features=5, n_informative=3, n_classes=len(weights) + 1,
+        weights=list(weights), n_clusters_per_class=1, random_state=seed
+    )
+    return pd.DataFrame(X, columns=[f"f{i}" for i in range(5)]), pd.Series(y)
+
+
+def _chunks(technique: str, X, y, **params):
+    pipeline = BalancingPipeline({"technique": technique, "params": params})
+    plan = pipeline.chunked_plan(X, y)
+    return plan, list(pipeline.generate_chunks(X, y, plan))
+
+
+@pytest.mark.parametrize("sampler, technique", [(SMOTE, "SMOTE"), (RandomOverSampler, "RandomOverSampler")])
+@pytest.mark.parametrize("strategy", ["auto", "not majority", {1: 2_700, 2: 1_000}])
+def test_chunked_plan_adds_the_rows_imblearn_would(monkeypatch, sampler, technique, strategy):
+    monkeypatch.setattr(balancing, "BALANCE_STREAMING_ROWS", 0)
+    monkeypatch.setattr(balancing, "BALANCE_BATCH_ROWS", 700)
+    X, y = _training_set()
+
+    plan, chunks = _chunks(technique, X, y, sampling_strategy=strategy)
+    _, y_reference = sampler(sampling_strategy=strategy, random_state=42).fit_resample(X, y)
+    y_chunked = np.concatenate([y.to_numpy()] + [y_new for _, y_new in chunks])
+    assert pd.Series(y_chunked).value_counts().to_dict() == pd.Series(y_reference).value_counts().to_dict()
+    assert all(len(y_new) <= 700 and len(X_new) == len(y_new) for X_new, y_new in chunks)
+
+
+def test_smote_chunks_interpolate_between_same_class_neighbors(monkeypatch):
+    monkeypatch.setattr(balancing, "BALANCE_STREAMING_ROWS", 0)
+    X, y = _training_set()
+    plan, chunks = _chunks("SMOTE", X, y, k_neighbors=5)
+
+    for label in plan:
+        X_class = X[y == label].to_numpy()
+        neighbors = NearestNeighbors(n_neighbors=6).fit(X_class).kneighbors(X_class, return_distance=False)[:, 1:]
+        X_new = np.vstack([X_b[y_b == label] for X_b, y_b in chunks])
+        assert len(X_new) == plan[label]
+        # Each new row lies on the segment from some row to one of its 5 nearest same-class rows
+        for row in X_new[:200]:
+            offsets = X_class[neighbors] - X_class[:, None, :]
+            gaps = np.einsum("ijk,ik->ij", offsets, row - X_class) / np.maximum(np.einsum("ijk,ijk->ij", offsets, offsets), 1e-12)
+            residual = np.linalg.norm(X_class[:, None, :] + gaps[..., None] * offsets - row, axis=2)
+            on_segment = (residual < 1e-9) & (gaps >= -1e-12) & (gaps <= 1 + 1e-12)
+            assert on_segment.any()
+
+
+def test_chunked_plan_only_for_large_dense_oversampling(monkeypatch):
+    X, y = _training_set()
+    assert BalancingPipeline({"technique": "SMOTE"}).chunked_plan(X, y) is None  # Below the threshold
+    monkeypatch.setattr(balancing, "BALANCE_STREAMING_ROWS", 0)
+    assert BalancingPipeline({"technique": "SMOTE"}).chunked_plan(X, y) is not None
+    assert BalancingPipeline({"technique": "ADASYN"}).chunked_plan(X, y) is None
+    assert BalancingPipeline({"technique": "SMOTE"}).chunked_plan(sp.csr_matrix(X.to_numpy()), y) is None
+
+
+def _preprocessed(artifacts_dir: str, X: pd.DataFrame, y: pd.Series, key: str):
+    """The artifacts of a preprocessing run recorded under `key`."""
+    os.makedirs(artifacts_dir, exist_ok=True)
+    X_path = save_features(os.path.join(artifacts_dir, "X_train"), X, list(X.columns))
+    y_path = os.path.join(artifacts_dir, "y_train.parquet")
+    pd.DataFrame({"target": y}).to_parquet(y_path)
+    StepManifest(artifacts_dir).put(key, {}, [X_path, y_path])
+
+
+def test_chunked_result_is_read_through_its_base(tmp_path, monkeypatch):
+    monkeypatch.setattr(balancing, "BALANCE_STREAMING_ROWS", 0)
+    monkeypatch.setattr(balancing, "BALANCE_BATCH_ROWS", 500)
+    artifacts_dir, balancing_dir = str(tmp_path / "preprocessing"), str(tmp_path / "balancing")
+    X, y = _training_set()
+    _preprocessed(artifacts_dir, X, y, "run1")
+
+    result = balance_task(artifacts_dir, balancing_dir, {"imbalance": {"technique": "SMOTE"}}, manifest_key="balance1")
+    n_total = result["shape"]["after"][0]
+    assert result["streaming"]["batches"] > 1
+    assert not os.path.exists(os.path.join(balancing_dir, "X_train_resampled.npz"))
+
+    X_base = os.path.join(balancing_dir, "X_train_resampled")
+    for X_resampled, columns in (load_features(X_base), ArtifactReader().features(X_base)):
+        assert X_resampled.shape == (n_total, X.shape[1]) and list(columns) == list(X.columns)
+        np.testing.assert_allclose(np.asarray(X_resampled)[:len(X)], X.to_numpy(), rtol=1e-6)
+    y_resampled = pd.read_parquet(os.path.join(balancing_dir, "y_train_resampled.parquet"))["target"]
+    assert len(y_resampled) == n_total
+    assert y_resampled.value_counts().to_dict() == {int(k): v for k, v in result["distribution"]["after"].items()}
+
+    # Preprocessing again rewrites the base: the resampled matrix must not be joined onto it
+    X_new, y_new = _training_set(seed=1)
+    _preprocessed(artifacts_dir, X_new, y_new, "run2")
+    with pytest.raises(StaleReferenceError):
+        load_features(X_base)
+    with pytest.raises(StaleReferenceError):
+        ArtifactReader().features(X_base)
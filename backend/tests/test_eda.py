@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from eda import run_eda, run_eda_approximate, KLL_K, _numeric_stats
+from sketches import KLLSketch
+
+
+def _dataset(n_rows: int = 20_000, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "amount": rng.lognormal(3, 1, n_rows),
+        "age": rng.integers(18, 90, n_rows).astype(float),
+        "flag": rng.integers(0, 2, n_rows),
+        "city": rng.choice(["a", "b", "c", "d"], n_rows, p=[0.4, 0.3, 0.2, 0.1]),
+        "target": rng.choice([0, 1], n_rows, p=[0.9, 0.1]),
+    })
+    df.loc[rng.random(n_rows) < 0.05, "age"] = np.nan
+    df.loc[rng.random(n_rows) < 0.02, "city"] = None
+    return df
+
+
+def _batches(df: pd.DataFrame, batch_rows: int):
+    for start in range(0, len(df), batch_rows):
+        yield df.iloc[start:start + batch_rows].reset_index(drop=True)
+
+
+def test_approximate_eda_matches_exact():
+    df = _dataset()
+    exact = run_eda(df, "data.csv", "target")
+    approx = run_eda_approximate(_batches(df, 3_000), "data.csv", "target")
+
+    assert approx["accuracy"]["rowCount"] == exact["accuracy"]["rowCount"] == len(df)
+    for col in ["amount", "age", "flag"]:
+        e, a = exact["univariate"][col], approx["univariate"][col]
+        assert a["missing"] == e["missing"]
+        for stat in ["mean", "std", "min", "max", "skew", "kurtosis"]:
+            assert a[stat] == pytest.approx(e[stat], rel=1e-8, abs=1e-10), (col, stat)
+        # Sketched quartiles: the ranks the estimate occupies lie within the rank error of q
+        values = np.sort(df[col].dropna().to_numpy())
+        eps = KLLSketch.rank_error(KLL_K)
+        for stat, q in [("q1", 0.25), ("median", 0.5), ("q3", 0.75)]:
+            low = np.searchsorted(values, a["boxplot"][stat], side="left") / len(values)
+            high = np.searchsorted(values, a["boxplot"][stat], side="right") / len(values)
+            assert low - eps <= q <= high + eps, (col, stat)
+        assert sum(a["histogram"]["counts"]) == pytest.approx(sum(e["histogram"]["counts"]), abs=10)
+    assert approx["univariate"]["flag"]["counts"] == exact["univariate"]["flag"]["counts"]
+
+    city_exact, city_approx = exact["univariate"]["city"], approx["univariate"]["city"]
+    assert city_approx["missing"] == city_exact["missing"]
+    assert city_approx["unique"] == city_exact["unique"]
+    assert city_approx["counts"] == city_exact["counts"]
+
+    assert approx["targetStats"]["imbalanceRatio"] == pytest.approx(exact["targetStats"]["imbalanceRatio"])
+    assert approx["targetStats"]["entropy"] == pytest.approx(exact["targetStats"]["entropy"])
+
+
+def _reference_stats(column: pd.Series) -> dict:
+    """The per-column computation `_numeric_stats` replaced."""
+    values = column.dropna().to_numpy(dtype=float)
+    counts, bins = np.histogram(values, bins=10)
+    return {
+        "mean": column.mean(), "std": column.std(), "median": np.median(values),
+        "min": values.min(), "max": values.max(),
+        "q1": np.percentile(values, 25), "q3": np.percentile(values, 75),
+        "skew": column.skew(), "kurtosis": column.kurtosis(),
+        "counts": counts.tolist(), "bins": bins.tolist(),
+        "unique": column.nunique(),
+    }
+
+
+def test_numeric_stats_match_per_column_reference():
+    rng = np.random.default_rng(4)
+    n_rows = 5_001
+    df = pd.DataFrame({
+        "normal": rng.normal(size=n_rows),
+        "skewed": rng.exponential(2, n_rows),
+        "ints": rng.integers(-3, 4, n_rows),
+        "constant": np.full(n_rows, 7.5),
+        "two_rows": np.r_[[1.0, 2.0], np.full(n_rows - 2, np.nan)],
+        "sparse": np.where(rng.random(n_rows) < 0.9, np.nan, rng.normal(size=n_rows)),
+        "flag": rng.integers(0, 2, n_rows).astype(bool).astype(np.uint8),
+    })
+    stats = _numeric_stats(df)
+
+    for col in df.columns:
+        expected, got = _reference_stats(df[col]), stats[col]
+        assert got["mean"] == expected["mean"] and got["std"] == pytest.approx(expected["std"], nan_ok=True)
+        assert got["median"] == expected["median"] == got["boxplot"]["median"]
+        assert got["min"] == expected["min"] and got["max"] == expected["max"]
+        assert got["boxplot"]["q1"] == expected["q1"] and got["boxplot"]["q3"] == expected["q3"], col
+        assert got["histogram"]["counts"] == expected["counts"], col
+        assert got["histogram"]["bins"] == expected["bins"], col
+        for stat in ["skew", "kurtosis"]:
+            reference = 0.0 if pd.isna(expected[stat]) else expected[stat]
+            assert got[stat] == pytest.approx(reference, rel=1e-12, abs=1e-12), (col, stat)
+        if expected["unique"] < 50:
+            assert got["counts"] == {str(k): int(v) for k, v in df[col].value_counts().head(10).items()}
+        else:
+            assert "counts" not in got
+
+
+def test_numeric_stats_empty_columns():
+    stats = _numeric_stats(pd.DataFrame({"a": [np.nan, np.nan], "b": [1.0, np.nan]}))
+    assert stats["a"]["mean"] == 0 and "histogram" not in stats["a"] and stats["a"]["counts"] == {}
+    assert stats["b"]["boxplot"] == {"q1": 1.0, "median": 1.0, "q3": 1.0, "min": 1.0, "max": 1.0}
+
+    empty = _numeric_stats(pd.DataFrame({"a": pd.Series([], dtype=float)}))
+    assert empty["a"]["median"] == 0 and "histogram" not in empty["a"]
+
+
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+def test_numeric_stats_reject_infinite_values_like_numpy():
+    column = pd.Series([1.0, np.inf, 2.0])
+    with pytest.raises(ValueError):
+        np.histogram(column.to_numpy(), bins=10)
+    with pytest.raises(ValueError):
+        _numeric_stats(column.to_frame("x"))
@@ -0,0 +1,100 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.neighbors import NearestNeighbors
+
+import analysis
+from analysis import ImbalanceAnalyzer, HARDNESS_LEVELS, CI_Z
+
+
+def _wilson(successes: int, n: int, population: int):
+    """Textbook Wilson score interval, n replaced by the FPC-adjusted size when sampling without replacement."""
+    if n == population:
+        return successes / n, successes / n
+    n_eff = n * (population - 1) / (population - n)
+    p = successes / n
+    center = (p + CI_Z ** 2 / (2 * n_eff)) / (1 + CI_Z ** 2 / n_eff)
+    half = CI_Z / (1 + CI_Z ** 2 / n_eff) * math.sqrt(p * (1 - p) / n_eff + CI_Z ** 2 / (4 * n_eff ** 2))
+    return max(center - half, 0), min(center + half, 1)
+
+
+def _reference_hardness(X: pd.DataFrame, y: pd.Series):
+    """Every row rated on its 5 nearest neighbors (the analysis before sampling)."""
+    indices = NearestNeighbors(n_neighbors=6).fit(X).kneighbors(X, return_distance=False)[:, 1:]
+    same_class = (y.to_numpy()[indices] == y.to_numpy()[:, None]).sum(axis=1)
+    level = np.select([same_class >= 4, same_class >= 2], ["safe", "borderline"], "rare")
+    return {
+        label: {lvl: round(float(np.mean(level[y.to_numpy() == label] == lvl) * 100), 1) for lvl in HARDNESS_LEVELS}
+        for label in y.unique()
+    }
+
+
+def _dataset(n_rows: int, weights, seed: int = 0):
+    X, y = make_classification(
+        n_samples=n_rows, n_features=5, n_informative=3, n_classes=len(weights) + 1,
+        weights=weights, n_clusters_per_class=1, flip_y=0.05, random_state=seed
+    )
+    return pd.DataFrame(X, columns=[f"f{i}" for i in range(5)]), pd.Series(y)
+
+
+def test_intervals_match_the_wilson_formula():
+    level_counts = np.array([[120, 50, 30], [10, 0, 0], [7, 2, 1]])
+    class_totals = np.array([1_000, 10, 10])
+    intervals = ImbalanceAnalyzer._hardness_intervals(level_counts, class_totals, ["a", "b", "c"])
+
+    for row, label in enumerate("abc"):
+        for col, level in enumerate(HARDNESS_LEVELS):
+            low, high = _wilson(level_counts[row, col], level_counts[row].sum(), class_totals[row])
+            assert intervals[label][level] == [round(low * 100, 1), round(high * 100, 1)], (label, level)
+    # Fully rated classes are exact
+    assert intervals["b"]["safe"] == [100.0, 100.0] and intervals["c"]["rare"] == [10.0, 10.0]
+
+
+def test_finite_population_correction_narrows_intervals():
+    level_counts = np.array([[500, 300, 200]])
+    large = ImbalanceAnalyzer._hardness_intervals(level_counts, np.array([10 ** 9]), ["x"])["x"]["safe"]
+    small = ImbalanceAnalyzer._hardness_intervals(level_counts, np.array([1_500]), ["x"])["x"]["safe"]
+    assert small[0] > large[0] and small[1] < large[1]
+    assert large[0] < 50 < large[1]
+
+
+def test_stratified_sample_caps_every_class():
+    codes = np.repeat([0, 1, 2], [5_000, 300, 40])
+    sample = ImbalanceAnalyzer()._stratified_sample(codes, 200)
+    assert (np.diff(sample) > 0).all()
+    np.testing.assert_array_equal(np.bincount(codes[sample]), [200, 200, 40])
+    np.testing.assert_array_equal(sample, ImbalanceAnalyzer()._stratified_sample(codes, 200))
+
+
+def test_fully_rated_classes_match_the_per_row_reference(monkeypatch):
+    X, y = _dataset(3_000, [0.8, 0.15])
+    monkeypatch.setattr(analysis, "COMPLEXITY_SAMPLES_PER_CLASS", 10 ** 6)
+    monkeypatch.setattr(analysis, "COMPLEXITY_BATCH_ROWS", 97)  # Many uneven batches
+    metrics = ImbalanceAnalyzer().calculate_metrics(X, y)
+
+    assert metrics["class_complexity"] == _reference_hardness(X, y)
+    assert metrics["complexity_rated"] == y.value_counts().to_dict()
+    minority = y.value_counts().idxmin()
+    assert metrics["complexity"] == metrics["class_complexity"][minority]
+    for label, levels in metrics["class_complexity_ci"].items():
+        for level, interval in levels.items():
+            assert interval == [metrics["class_complexity"][label][level]] * 2
+
+
+def test_sampled_classes_stay_within_their_intervals(monkeypatch):
+    X, y = _dataset(20_000, [0.9, 0.07])
+    reference = _reference_hardness(X, y)
+    monkeypatch.setattr(analysis, "COMPLEXITY_SAMPLES_PER_CLASS", 1_000)
+    metrics = ImbalanceAnalyzer().calculate_metrics(X, y)
+
+    assert metrics["complexity_rated"] == {label: min(n, 1_000) for label, n in y.value_counts().items()}
+    misses = 0
+    for label, levels in metrics["class_complexity_ci"].items():
+        for level, (low, high) in levels.items():
+            assert low <= metrics["class_complexity"][label][level] <= high
+            misses += not (low - 0.1 <= reference[label][level] <= high + 0.1)
+    # 95% intervals: at most one of the nine may miss the full-data value
+    assert misses <= 1
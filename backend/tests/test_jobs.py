@@ -0,0 +1,27 @@
+from jobs import JobManager, CANCELLED, COMPLETED, QUEUED
+
+
+def _noop(progress=None):
+    return {}
+
+
+def test_jobs_are_only_visible_to_their_owner():
+    manager = JobManager(max_workers=1)
+    job = manager.completed("alice", "eda", {"rows": 3})
+
+    assert manager.get(job["jobId"], "alice")["status"] == COMPLETED
+    assert manager.result(job["jobId"], "alice")["result"] == {"rows": 3}
+    assert manager.events(job["jobId"], 0, "alice") == ([], COMPLETED)
+
+    for lookup in (manager.get, manager.result, manager.cancel):
+        assert lookup(job["jobId"], "mallory") is None
+    assert manager.events(job["jobId"], 0, "mallory") is None
+
+
+def test_only_the_owner_can_cancel():
+    manager = JobManager(max_workers=0)  # Nothing is dispatched: the job stays queued
+    job = manager.submit("alice", "eda", _noop)
+
+    assert manager.cancel(job["jobId"], "mallory") is None
+    assert manager.get(job["jobId"], "alice")["status"] == QUEUED
+    assert manager.cancel(job["jobId"], "alice")["status"] == CANCELLED
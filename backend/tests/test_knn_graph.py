@@ -0,0 +1,120 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sp
+from sklearn.datasets import make_classification
+from sklearn.neighbors import NearestNeighbors
+
+from analysis import ImbalanceAnalyzer
+from balancing import BalancingPipeline
+from knn_graph import KNNGraph, KNNGraphStore, row_keys
+from neighbors import NeighborEngine
+
+
+def _training_set(n_rows: int = 2_000, seed: int = 0):
+    X, y = make_classification(n_samples=n_rows, n_features=6, weights=[0.85], random_state=seed)
+    # Features on very different scales: a graph in another space would pick other neighbors
+    return pd.DataFrame(X * [1, 10, 100, 1, 0.1, 5], columns=[f"f{i}" for i in range(6)]), pd.Series(y)
+
+
+def _assert_same_neighbors(got, expected):
+    (distances, indices), (expected_distances, expected_indices) = got, expected
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-5, atol=1e-6)
+    np.testing.assert_array_equal(indices, expected_indices)
+
+
+def test_graph_matches_nearest_neighbors():
+    X, _ = _training_set()
+    graph = KNNGraph.build(X, n_neighbors=10)
+    expected_distances, expected_indices = NearestNeighbors(n_neighbors=10).fit(X.to_numpy()).kneighbors()
+    np.testing.assert_array_equal(graph.indices, expected_indices)
+    np.testing.assert_allclose(graph.distances, expected_distances, rtol=1e-6)
+
+
+@pytest.mark.parametrize("k", [3, 6, 11])
+def test_graph_backed_kneighbors_match_exact_search(k):
+    X, y = _training_set()
+    graph = KNNGraph.build(X, n_neighbors=10)
+    X_arr = X.to_numpy()
+
+    # Whole training set and single-class subsets, as the resamplers fit them
+    for rows in (np.arange(len(X)), np.flatnonzero(y == 1), np.flatnonzero(y == 0)):
+        subset = X_arr[rows]
+        nn = NeighborEngine(n_neighbors=k, engine="exact", graph=graph).fit(subset)
+        assert nn.graph_rows_ is not None
+        reference = NearestNeighbors(n_neighbors=k).fit(subset)
+        _assert_same_neighbors(nn.kneighbors(), reference.kneighbors())
+        _assert_same_neighbors(nn.kneighbors(subset), reference.kneighbors(subset))
+        # Training rows outside the subset, and rows the graph does not know
+        others = np.r_[X_arr[np.setdiff1d(np.arange(len(X)), rows)[:50]], X_arr[:50] + 0.01]
+        _assert_same_neighbors(nn.kneighbors(others), reference.kneighbors(others))
+
+
+def test_graph_with_duplicate_rows():
+    X, _ = _training_set(500)
+    X = pd.concat([X, X.iloc[:40], X.iloc[:10]], ignore_index=True)
+    graph = KNNGraph.build(X, n_neighbors=10)
+
+    rows = graph.locate(X)
+    np.testing.assert_array_equal(np.sort(rows), np.arange(len(X)))  # Duplicates map to distinct rows
+
+    nn = NeighborEngine(n_neighbors=6, engine="exact", graph=graph).fit(X)
+    distances, indices = nn.kneighbors()
+    expected_distances, _ = NearestNeighbors(n_neighbors=6).fit(X.to_numpy()).kneighbors()
+    # Equidistant neighbors (the copies) may come in another order; the distances may not
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-5, atol=1e-6)
+    assert not (indices == np.arange(len(X))[:, None]).any()
+
+
+def test_row_keys_ignore_storage_dtype_and_explicit_zeros():
+    X, _ = _training_set(200)
+    np.testing.assert_array_equal(row_keys(X), row_keys(X.to_numpy(dtype=np.float64)))
+    np.testing.assert_array_equal(row_keys(X.astype(np.float32)), row_keys(X.astype(np.float32).to_numpy(dtype=np.float64)))
+
+    dense = np.where(np.abs(X.to_numpy()) > 1, X.to_numpy(), 0)
+    sparse = sp.csr_matrix(dense)
+    with_zeros = sparse.copy()
+    with_zeros.data[::7] = 0  # Stored, but zero
+    np.testing.assert_array_equal(row_keys(with_zeros), row_keys(sp.csr_matrix(with_zeros.toarray())))
+    assert len(np.unique(row_keys(sparse))) == len(np.unique(dense, axis=0))
+
+
+def test_resampling_with_a_graph_is_unchanged():
+    X, y = _training_set()
+    graph = KNNGraph.build(X)
+    for technique in BalancingPipeline.NEIGHBOR_TECHNIQUES:
+        X_plain, y_plain, _ = BalancingPipeline({"technique": technique}).apply_balancing(X, y)
+        X_graph, y_graph, _ = BalancingPipeline({"technique": technique}).apply_balancing(X, y, graph=graph)
+        np.testing.assert_allclose(np.asarray(X_graph), np.asarray(X_plain), err_msg=technique)
+        np.testing.assert_array_equal(np.asarray(y_graph), np.asarray(y_plain))
+
+
+def test_analyzer_reads_the_shared_graph():
+    X, y = _training_set()
+    graph = KNNGraph.build(X)
+    with_graph = ImbalanceAnalyzer().calculate_metrics(X, y, graph=graph)
+    without = ImbalanceAnalyzer().calculate_metrics(X, y)
+    assert with_graph["class_complexity"] == without["class_complexity"]
+
+
+def test_store_serves_graphs_of_the_same_key(tmp_path):
+    X, _ = _training_set(300)
+    built = KNNGraphStore(str(tmp_path)).get_or_build("key1", X, n_neighbors=8)
+    stored = KNNGraphStore(str(tmp_path)).get("key1", 8)
+    np.testing.assert_array_equal(stored.indices, built.indices)
+
+    assert KNNGraphStore(str(tmp_path)).get("key2") is None  # Other preprocessing output
+    assert KNNGraphStore(str(tmp_path)).get("key1", 9) is None  # Too few neighbors stored
+
+
+def test_store_ignores_graphs_of_another_version(tmp_path):
+    X, _ = _training_set(300)
+    store = KNNGraphStore(str(tmp_path))
+    store.get_or_build("key1", X)
+    with open(store.meta_path, "r") as f:
+        meta = json.load(f)
+    with open(store.meta_path, "w") as f:
+        json.dump({k: v for k, v in meta.items() if k != "version"}, f)
+    assert store.get("key1") is None
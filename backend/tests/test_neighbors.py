@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from imblearn.over_sampling import SMOTE
+from imblearn.under_sampling import EditedNearestNeighbours
+from sklearn.datasets import make_blobs, make_classification
+from sklearn.neighbors import NearestNeighbors
+
+import neighbors
+from neighbors import NeighborEngine
+
+
+def _data(n_rows: int = 2_000, n_features: int = 8, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(n_rows, n_features))
+
+
+def _reference(X, queries, k: int):
+    nn = NearestNeighbors(n_neighbors=k, algorithm="brute").fit(X)
+    return nn.kneighbors(queries, k)
+
+
+def _true_distances(X, queries, indices):
+    X, queries = (m.toarray() if sp.issparse(m) else m for m in (X, queries))
+    return np.linalg.norm(X[indices] - queries[:, None, :], axis=2)
+
+
+@pytest.mark.parametrize("engine", ["exact", "ball_tree", "auto"])
+def test_exact_engines_match_nearest_neighbors(engine):
+    X, queries = _data(), _data(300, seed=1)
+    nn = NeighborEngine(n_neighbors=6, engine=engine).fit(X)
+
+    distances, indices = nn.kneighbors(queries)
+    expected_distances, expected_indices = _reference(X, queries, 6)
+    np.testing.assert_array_equal(indices, expected_indices)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-10)
+
+    # Fitted rows as queries leave each row itself out
+    self_distances, self_indices = nn.kneighbors()
+    expected_distances, expected_indices = NearestNeighbors(n_neighbors=6).fit(X).kneighbors()
+    np.testing.assert_array_equal(self_indices, expected_indices)
+    np.testing.assert_allclose(self_distances, expected_distances, rtol=1e-10)
+
+
+def test_approximate_engine_probing_every_list_is_exact(monkeypatch):
+    monkeypatch.setattr(neighbors, "NEIGHBOR_APPROX_PROBES", 10_000)
+    dense = _data(1_500, 40, seed=2)
+    sparse = sp.csr_matrix(np.where(np.abs(dense) > 0.7, dense, 0))
+    for X in (_data(), sparse):
+        nn = NeighborEngine(n_neighbors=5, engine="approximate").fit(X)
+        distances, indices = nn.kneighbors(X[:200])
+        expected_distances, expected_indices = _reference(X, X[:200], 5)
+        np.testing.assert_array_equal(indices, expected_indices)
+        # |q|^2 + |c|^2 - 2 q.c leaves about sqrt(rounding) on zero distances
+        np.testing.assert_allclose(distances, expected_distances, atol=1e-6)
+
+        _, self_indices = nn.kneighbors()
+        _, expected_indices = NearestNeighbors(n_neighbors=5).fit(X).kneighbors()
+        np.testing.assert_array_equal(self_indices, expected_indices)
+
+
+def test_approximate_engine_recall_on_clustered_data():
+    X, _ = make_blobs(n_samples=20_000, n_features=10, centers=50, random_state=0)
+    nn = NeighborEngine(n_neighbors=10, engine="approximate").fit(X)
+    distances, indices = nn.kneighbors(X[:2_000])
+    _, expected = _reference(X, X[:2_000], 10)
+
+    recall = np.mean([len(np.intersect1d(a, b)) / 10 for a, b in zip(indices, expected)])
+    assert recall >= 0.95
+    # Returned neighbors are real rows, nearest first, with their exact distances
+    np.testing.assert_allclose(distances, _true_distances(X, X[:2_000], indices), atol=1e-6)
+    assert (np.diff(distances, axis=1) >= 0).all()
+
+
+def test_kneighbors_graph_matches_nearest_neighbors():
+    X = _data(500)
+    for mode in ("connectivity", "distance"):
+        got = NeighborEngine(n_neighbors=4, engine="exact").fit(X).kneighbors_graph(mode=mode)
+        expected = NearestNeighbors(n_neighbors=4).fit(X).kneighbors_graph(mode=mode)
+        assert abs(got - expected).max() < 1e-10
+
+
+def test_resamplers_give_the_same_output_as_their_default_search():
+    X, y = make_classification(n_samples=3_000, n_features=6, weights=[0.9], random_state=0)
+
+    X_default, y_default = SMOTE(k_neighbors=5, random_state=42).fit_resample(X, y)
+    X_engine, y_engine = SMOTE(k_neighbors=NeighborEngine(n_neighbors=6, engine="exact"), random_state=42).fit_resample(X, y)
+    np.testing.assert_allclose(X_engine, X_default)
+    np.testing.assert_array_equal(y_engine, y_default)
+
+    X_default, _ = EditedNearestNeighbours(n_neighbors=3).fit_resample(X, y)
+    X_engine, _ = EditedNearestNeighbours(n_neighbors=NeighborEngine(n_neighbors=4, engine="ball_tree")).fit_resample(X, y)
+    np.testing.assert_array_equal(X_engine, X_default)
+
+
+def test_unknown_engine_is_rejected():
+    with pytest.raises(ValueError):
+        NeighborEngine(engine="lsh").fit(_data(50))
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.sparse as sp
+
+from preprocessing import PreprocessingPipeline
+
+
+def _frame(n_rows: int = 600, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        **{f"num{i}": rng.normal(i, 1 + i, n_rows) for i in range(4)},
+        **{f"pos{i}": rng.exponential(2, n_rows) for i in range(3)},
+        "count0": rng.integers(0, 20, n_rows),
+        "count1": rng.integers(0, 5, n_rows),
+        **{f"cat{i}": rng.choice(["a", "b", "c", f"only{i}"], n_rows) for i in range(3)},
+        **{f"ord{i}": rng.choice(["low", "mid", "high"], n_rows) for i in range(2)},
+    })
+    for col in ["num1", "num3", "pos0", "cat1", "ord0"]:
+        df.loc[rng.random(n_rows) < 0.1, col] = np.nan
+    return df
+
+
+FEATURE_CONFIGS = {
+    "num2": {"type": "numeric", "strategy": "median", "scaling": "MinMax"},
+    "num3": {"type": "numeric", "strategy": "median", "scaling": "MinMax"},
+    **{f"pos{i}": {"type": "numeric", "strategy": "constant", "params": {"fill_value": 1}, "transform": "yeo-johnson"} for i in range(3)},
+    "count1": {"type": "numeric", "strategy": "most_frequent", "scaling": "Robust"},
+    **{f"ord{i}": {"type": "categorical", "strategy": "constant", "params": {"fill_value": "none", "encoding": "Ordinal"}} for i in range(2)},
+}
+
+
+def _per_column(pipeline: PreprocessingPipeline) -> PreprocessingPipeline:
+    """The same pipeline with one transformer per column, as before columns were grouped."""
+    pipeline._column_groups = lambda X, plan: [(ftype, cfg, [col]) for col, ftype, cfg in plan]
+    return pipeline
+
+
+def _by_name(transformer, X: pd.DataFrame, y: pd.Series) -> pd.DataFrame:
+    values = transformer.fit_transform(X, y)
+    values = values.toarray() if sp.issparse(values) else values
+    return pd.DataFrame(values, columns=transformer.get_feature_names_out())
+
+
+@pytest.mark.parametrize("n_jobs", [1, 4])
+def test_grouped_transformer_matches_per_column(n_jobs):
+    X = _frame()
+    y = pd.Series(np.random.default_rng(1).integers(0, 2, len(X)))
+    config = {"featureConfigs": FEATURE_CONFIGS, "nJobs": n_jobs}
+
+    grouped = PreprocessingPipeline(config)._build_column_transformer(X)
+    reference = _per_column(PreprocessingPipeline(config))._build_column_transformer(X)
+    assert len(grouped.transformers) < len(reference.transformers) == X.shape[1]
+
+    out, expected = _by_name(grouped, X, y), _by_name(reference, X, y)
+    assert sorted(out.columns) == sorted(expected.columns)
+    pd.testing.assert_frame_equal(out[expected.columns], expected, check_exact=False, rtol=1e-12)
+
+
+def test_column_groups_split_by_settings_and_dtype_kind():
+    X = _frame()
+    groups = PreprocessingPipeline({"featureConfigs": FEATURE_CONFIGS, "nJobs": 1})._column_groups(
+        X, PreprocessingPipeline({"featureConfigs": FEATURE_CONFIGS})._feature_plan(X)
+    )
+    columns = [cols for _, _, cols in groups]
+    assert ["num0", "num1"] in columns  # Default mean / Standard, float
+    assert ["count0"] in columns  # Same settings, but integer
+    assert ["num2", "num3"] in columns
+    assert ["pos0", "pos1", "pos2"] in columns
+    assert ["cat0", "cat1", "cat2"] in columns
+    assert ["ord0", "ord1"] in columns
+    assert sorted(col for cols in columns for col in cols) == sorted(X.columns)
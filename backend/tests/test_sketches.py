@@ -0,0 +1,110 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from sketches import MomentSketch, KLLSketch, HyperLogLog, FrequentItems, ReservoirSample
+
+
+def _chunks(data, n: int):
+    """`data` in `n` consecutive batches, as the streaming EDA reads it."""
+    bounds = np.linspace(0, len(data), n + 1).astype(int)
+    return [data.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def test_moment_sketch_matches_pandas_across_batches():
+    rng = np.random.default_rng(0)
+    data = np.column_stack([rng.normal(5, 2, 5000), rng.exponential(3, 5000), rng.integers(0, 4, 5000).astype(float)])
+    data[rng.random(data.shape) < 0.1] = np.nan
+
+    sketch = MomentSketch(data.shape[1])
+    for block in np.array_split(data, 7):
+        sketch.update(block)
+
+    frame = pd.DataFrame(data)
+    np.testing.assert_array_equal(sketch.count, frame.count().to_numpy())
+    np.testing.assert_allclose(sketch.mean, frame.mean().to_numpy(), rtol=1e-10)
+    np.testing.assert_allclose(sketch.std(), frame.std().to_numpy(), rtol=1e-10)
+    np.testing.assert_allclose(sketch.skew(), frame.skew().to_numpy(), rtol=1e-8)
+    np.testing.assert_allclose(sketch.kurtosis(), frame.kurt().to_numpy(), rtol=1e-8)
+    np.testing.assert_array_equal(sketch.min, frame.min().to_numpy())
+    np.testing.assert_array_equal(sketch.max, frame.max().to_numpy())
+
+
+def test_moment_sketch_constant_and_empty_columns():
+    sketch = MomentSketch(2)
+    sketch.update(np.column_stack([np.full(10, 3.0), np.full(10, np.nan)]))
+    assert sketch.std()[0] == 0 and sketch.skew()[0] == 0 and sketch.kurtosis()[0] == 0
+    assert sketch.count[1] == 0 and np.isnan(sketch.std()[1])
+
+
+def test_kll_quantiles_within_rank_error():
+    rng = np.random.default_rng(1)
+    values = rng.lognormal(size=200_000)
+    sketch = KLLSketch(k=200, seed=0)
+    for chunk in np.array_split(values, 40):
+        sketch.update(chunk)
+
+    qs = np.linspace(0.01, 0.99, 25)
+    estimates = sketch.quantiles(qs)
+    # Rank of each estimate in the exact data, compared with the requested rank
+    ranks = np.searchsorted(np.sort(values), estimates) / len(values)
+    assert np.max(np.abs(ranks - qs)) <= KLLSketch.rank_error(200)
+    assert sum(len(level) for level in sketch.levels) < 4 * 200
+
+
+def test_kll_histogram_matches_numpy():
+    rng = np.random.default_rng(2)
+    values = rng.normal(size=100_000)
+    sketch = KLLSketch(k=200, seed=0)
+    sketch.update(values)
+
+    counts, edges = sketch.histogram(20, (values.min(), values.max()))
+    exact, exact_edges = np.histogram(values, bins=20, range=(values.min(), values.max()))
+    np.testing.assert_allclose(edges, exact_edges)
+    assert abs(counts.sum() - len(values)) <= 20
+    assert np.max(np.abs(counts - exact)) <= 2 * KLLSketch.rank_error(200) * len(values)
+
+
+@pytest.mark.parametrize("n_distinct", [50, 5_000, 200_000])
+def test_hyperloglog_count(n_distinct):
+    hll = HyperLogLog(precision=14)
+    values = np.arange(n_distinct)
+    # Repeated values must not change the estimate
+    for chunk in np.array_split(np.concatenate([values, values[::3]]), 5):
+        hll.update(chunk)
+    assert abs(hll.count() - n_distinct) <= 4 * HyperLogLog.relative_error(14) * n_distinct + 1
+
+
+def test_frequent_items_exact_and_bounded():
+    rng = np.random.default_rng(3)
+    few = pd.Series(rng.integers(0, 5, 10_000))
+    exact_summary = FrequentItems(capacity=10)
+    for chunk in _chunks(few, 4):
+        exact_summary.update(chunk.value_counts())
+    assert exact_summary.exact
+    assert exact_summary.top(5) == few.value_counts().to_dict()
+
+    many = pd.Series(np.concatenate([np.repeat([1, 2, 3], 3000), rng.integers(100, 10_000, 20_000)]))
+    many = many.sample(frac=1, random_state=0)
+    summary = FrequentItems(capacity=20)
+    for chunk in _chunks(many, 10):
+        summary.update(chunk.value_counts())
+    truth = many.value_counts()
+    assert not summary.exact
+    assert set(list(summary.top(3))) == {1, 2, 3}
+    for value, count in summary.counts.items():
+        assert truth[value] - summary.max_error <= count <= truth[value]
+
+
+def test_reservoir_sample_is_uniform_without_replacement():
+    frame = pd.DataFrame({"row": np.arange(10_000)})
+    hits = np.zeros(2)
+    for seed in range(20):
+        sample = ReservoirSample(k=500, seed=seed)
+        for chunk in _chunks(frame, 13):
+            sample.update(chunk)
+        rows = sample.frame["row"].to_numpy()
+        assert len(rows) == 500 and len(np.unique(rows)) == 500
+        hits += [np.sum(rows < 5_000), np.sum(rows >= 5_000)]
+    # Both halves of the stream are equally likely to be sampled
+    assert abs(hits[0] - hits[1]) / hits.sum() < 0.05
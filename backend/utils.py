@@ -3,9 +3,9 @@ import os
 def get_user_storage_usage(user_id: str) -> int:
     """
     Calculates the total bytes used by a user in the storage directory.
-    Path: storage/{user_id}
+    Path: storage/users/{user_id}
     """
-    storage_root = "storage"
+    storage_root = os.path.join("storage", "users")
     user_dir = os.path.join(storage_root, user_id)
     
     total_size = 0
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional
+
+try:
+    import msgpack
+except ImportError:  # Optional: only needed for the binary response format
+    msgpack = None
+
+# Response formats accepted by `?format=` on result endpoints
+RESPONSE_FORMATS = ("json", "compact", "msgpack")
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+# Result keys holding a correlation matrix or PCA points
+MATRIX_KEYS = ("correlation", "processedCorrelation")
+POINTS_KEYS = ("pca",)
+
+
+def compact_matrix(matrix: pd.DataFrame, fill_value: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Symmetric matrix as its column names plus the row-major upper triangle
+    (diagonal included): entry (i, j), i <= j, sits at
+    i * n - i * (i - 1) / 2 + (j - i). Missing values are NaN (null in JSON)
+    unless `fill_value` is given.
+    """
+    values = matrix.to_numpy(dtype=float)
+    if fill_value is not None:
+        values = np.where(np.isnan(values), fill_value, values)
+    return {
+        "layout": "upper",
+        "columns": matrix.columns.tolist(),
+        "values": values[np.triu_indices(len(values))],
+    }
+
+
+def compact_points(components: np.ndarray, targets: List[str]) -> Dict[str, Any]:
+    """2-3D projection as one array per axis instead of one dict per point."""
+    n_comps = components.shape[1]
+    zeros = np.zeros(len(components))
+    return {
+        "layout": "columns",
+        "x": components[:, 0] if n_comps > 0 else zeros,
+        "y": components[:, 1] if n_comps > 1 else zeros,
+        "z": components[:, 2] if n_comps > 2 else zeros,
+        "target": targets,
+    }
+
+
+def expand_matrix(compact: Dict[str, Any]) -> Dict[str, Any]:
+    """Legacy `{columns, matrix: [{x, y, v}]}` form of a compact matrix (missing cells are left out)."""
+    columns = compact["columns"]
+    n = len(columns)
+    upper = np.asarray(compact["values"], dtype=float)
+    full = np.empty((n, n))
+    rows, cols = np.triu_indices(n)
+    full[rows, cols] = upper
+    full[cols, rows] = upper
+
+    matrix = []
+    for i, r in enumerate(columns):
+        for j, c in enumerate(columns):
+            v = full[i, j]
+            if not np.isnan(v):
+                matrix.append({"x": c, "y": r, "v": float(v)})
+    return {"columns": columns, "matrix": matrix}
+
+
+def expand_points(compact: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Legacy list of `{x, y, z, target}` points."""
+    return [
+        {"x": float(x), "y": float(y), "z": float(z), "target": t}
+        for x, y, z, t in zip(compact["x"], compact["y"], compact["z"], compact["target"])
+    ]
+
+
+def expand_result(result: Any) -> Any:
+    """Restores the legacy (per-cell / per-point) shapes in a result for older clients."""
+    if not isinstance(result, dict):
+        return result
+    expanded = dict(result)
+    for key in MATRIX_KEYS:
+        value = result.get(key)
+        if isinstance(value, dict) and value.get("layout") == "upper":
+            expanded[key] = expand_matrix(value)
+    for key in POINTS_KEYS:
+        value = result.get(key)
+        if isinstance(value, dict) and value.get("layout") == "columns":
+            expanded[key] = expand_points(value)
+    return expanded
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if hasattr(obj, 'item'):
+        return obj.item()
+    if obj is pd.NA or obj is pd.NaT:
+        return None
+    raise TypeError(f"Type is not MessagePack serializable: {type(obj).__name__}")
+
+
+def packb(obj) -> bytes:
+    """MessagePack encoding of a (compact) result. NaN stays NaN, as MessagePack floats allow it."""
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed")
+    return msgpack.packb(obj, default=_msgpack_default)
@@ -8,12 +8,110 @@ export const apiClient = axios.create({
     },
 });
 
+export interface JobStatus {
+    jobId: string;
+    userId: string;
+    kind: string;
+    status: 'Queued' | 'Running' | 'Completed' | 'Failed' | 'Cancelled';
+    error?: string | null;
+    stage?: string | null;
+}
+
+export interface JobStageEvent {
+    stage: string;
+    status: 'started' | 'completed' | 'failed';
+    timestamp: number;
+    elapsedSeconds?: number;
+}
+
 export interface RunWorkflowPayload {
     fileName: string;
     targetCol: string;
     config: PipelineConfig;
 }
 
+// Long-running steps (/preprocess, /balance, /run, /perform-eda) return a job.
+// Poll it until it finishes, then fetch its result. Job routes only answer the job's owner.
+export async function waitForJob(job: JobStatus, intervalMs = 1000) {
+    const params = { userId: job.userId };
+    let status = job;
+    while (status.status === 'Queued' || status.status === 'Running') {
+        await new Promise(resolve => setTimeout(resolve, intervalMs));
+        status = (await apiClient.get(`/jobs/${job.jobId}`, { params })).data;
+    }
+
+    if (status.status !== 'Completed') {
+        const detail = status.error || `Job ${status.status.toLowerCase()}`;
+        // Same shape as an axios error so callers can keep reading response.data.detail
+        const err: any = new Error(detail);
+        err.response = { data: { detail } };
+        throw err;
+    }
+
+    // Compact format: correlation matrices and PCA points arrive as flat arrays
+    const response = await apiClient.get(`/jobs/${job.jobId}/result`, { params: { ...params, format: 'compact' } });
+    return expandCompactResult(response.data);
+}
+
+interface CompactMatrix {
+    layout: 'upper';
+    columns: string[];
+    values: (number | null)[]; // Row-major upper triangle, diagonal included
+}
+
+interface CompactPoints {
+    layout: 'columns';
+    x: number[];
+    y: number[];
+    z: number[];
+    target: string[];
+}
+
+// Rebuilds the {columns, matrix: {x, y, v}[]} shape the charts read
+export function expandCompactMatrix(compact: CompactMatrix) {
+    const cols = compact.columns;
+    const n = cols.length;
+    const full: (number | null)[][] = cols.map(() => new Array(n).fill(null));
+    let k = 0;
+    for (let i = 0; i < n; i++) {
+        for (let j = i; j < n; j++) {
+            const v = compact.values[k++] ?? null;
+            full[i]![j] = v;
+            full[j]![i] = v;
+        }
+    }
+
+    const matrix: { x: string; y: string; v: number }[] = [];
+    cols.forEach((row, i) => cols.forEach((col, j) => {
+        const v = full[i]![j];
+        if (v !== null && v !== undefined) matrix.push({ x: col, y: row, v });
+    }));
+    return { columns: cols, matrix };
+}
+
+export function expandCompactPoints(compact: CompactPoints) {
+    return compact.x.map((x, i) => ({ x, y: compact.y[i], z: compact.z[i], target: compact.target[i] }));
+}
+
+export function expandCompactResult(result: any) {
+    if (!result || typeof result !== 'object') return result;
+    for (const key of ['correlation', 'processedCorrelation']) {
+        if (result[key]?.layout === 'upper') result[key] = expandCompactMatrix(result[key]);
+    }
+    if (result.pca?.layout === 'columns') result.pca = expandCompactPoints(result.pca);
+    return result;
+}
+
+// Streams the stage events of a job (Server-Sent Events). Returns a function that closes the stream.
+export function subscribeToJob(job: JobStatus, onStage: (event: JobStageEvent) => void) {
+    const query = new URLSearchParams({ userId: job.userId });
+    const source = new EventSource(`${apiClient.defaults.baseURL}/jobs/${job.jobId}/events?${query}`);
+    source.addEventListener('stage', (e) => onStage(JSON.parse((e as MessageEvent).data)));
+    source.addEventListener('status', () => source.close());
+    source.onerror = () => source.close();
+    return () => source.close();
+}
+
 export default {
     async fetchDatasetHeaders(url: string) {
         if (!url) return [];
@@ -37,7 +135,7 @@ export default {
                 'Content-Type': 'multipart/form-data'
             }
         });
-        return response.data;
+        return waitForJob(response.data);
     },
 
     async runBalancing(payload: FormData) {
@@ -46,7 +144,7 @@ export default {
                 'Content-Type': 'multipart/form-data'
             }
         });
-        return response.data;
+        return waitForJob(response.data);
     },
 
     async getImbalanceAnalysis(payload: FormData) {
@@ -15,6 +15,7 @@ import {
 import { db, auth } from '../lib/firebase';
 import { useAuthStore } from './auth';
 import axios from 'axios';
+import { waitForJob } from '../services/api';
 
 export interface Dataset {
   id: string;
@@ -313,7 +314,7 @@ export const useDatasetsStore = defineStore('datasets', () => {
 
     try {
       const response = await axios.post(`${PYTHON_API_URL}/perform-eda`, formData);
-      return response.data;
+      return await waitForJob(response.data);
     } catch (e: any) {
       console.error("EDA Fetch Error:", e);
       throw e;
@@ -364,7 +365,7 @@ export const useDatasetsStore = defineStore('datasets', () => {
       formData.append('config', JSON.stringify(config));
 
       const response = await axios.post(`${PYTHON_API_URL}/preprocess`, formData);
-      return response.data;
+      return await waitForJob(response.data);
 
     } catch (e: any) {
       console.error("Preprocessing error:", e);